@@ -22,7 +22,7 @@ __author__ = 'Christoph Franke'
 __date__ = '16/07/2019'
 
 from abc import ABC
-from typing import Union
+from typing import Union, List
 import weakref
 
 
@@ -59,10 +59,49 @@ class Field:
         return f'Field {self.name} {self.datatype}'
 
 
+class FeatureSchema:
+    '''
+    field metadata shared by all features of a table, maps the field names to
+    the positions of the values held by the features
+
+    Attributes
+    ----------
+    fields : tuple
+        Field objects in order of the values
+    names : tuple
+        names of the fields in order of the values
+    index : dict
+        field names as keys and positions of their values as values
+    defaults : tuple
+        default values of the fields in order of the values
+    '''
+    __slots__ = ('fields', 'names', 'index', 'defaults')
+
+    def __init__(self, fields: List[Field]):
+        '''
+        Parameters
+        ----------
+        fields : list
+            list of Field objects
+        '''
+        self.fields = tuple(fields)
+        self.names = tuple(f.name for f in fields)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.defaults = tuple(f.default for f in fields)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return f'FeatureSchema {self.names}'
+
+
 class Feature:
     '''
     Feature representing a row in a database table with it's column values
-    as fields
+    as fields, the values are held positionally and accessed via the schema
+    shared with all other features of the table, attributes not matching a
+    field are kept per feature as before
 
     Attributes
     ----------
@@ -73,6 +112,10 @@ class Feature:
     geom : QgsGeometry
         geometry of the feature
     '''
+    # '__dict__' is only allocated when an attribute is set that is not a
+    # field of the table
+    __slots__ = ('id', 'geom', 'table', '_schema', '_values', '__dict__')
+
     def __init__(self, table, id=None, geom=None, **kwargs):
         '''
         Parameters
@@ -87,33 +130,52 @@ class Feature:
         **kwargs
             field values, field name as key and value of field as value
         '''
-        self.__dict__['_fields'] = {f.name: f for f in table.fields()}
-        self.id = id
-        self.geom = geom
-        self.table = table
-        self._fields = []
-        for f in table.fields():
-            self._fields.append(f.name)
-            v = kwargs.get(f.name, None)
+        schema = table.schema
+        values = [kwargs.get(name) for name in schema.names]
+        for i, v in enumerate(values):
             if v is None:
-                v = f.default
-            self.__dict__[f.name] = v
+                values[i] = schema.defaults[i]
+        object.__setattr__(self, 'id', id)
+        object.__setattr__(self, 'geom', geom)
+        object.__setattr__(self, 'table', table)
+        object.__setattr__(self, '_schema', schema)
+        object.__setattr__(self, '_values', values)
+
+    def __getattr__(self, name):
+        # only called if there is no slot with the name -> look up field
+        try:
+            idx = object.__getattribute__(self, '_schema').index[name]
+        except (KeyError, AttributeError):
+            raise AttributeError(
+                f"'{type(self).__name__}' object has no field '{name}'"
+            ) from None
+        return self._values[idx]
+
+    def __setattr__(self, name, value):
+        idx = (None if name in Feature.__slots__
+               else self._schema.index.get(name))
+        if idx is None:
+            object.__setattr__(self, name, value)
+            return
+        self._values[idx] = value
 
     def __getitem__(self, idx):
-        if idx not in self._fields:
+        i = self._schema.index.get(idx)
+        if i is None:
             raise KeyError(idx)
-        return getattr(self, idx)
+        return self._values[i]
 
     def __setitem__(self, idx, value):
-        if idx not in self._fields:
+        i = self._schema.index.get(idx)
+        if i is None:
             raise KeyError(idx)
-        setattr(self, idx, value)
+        self._values[i] = value
 
     def save(self):
         '''
         store current state of features in database
         '''
-        kwargs = {f: getattr(self, f) for f in self._fields}
+        kwargs = dict(zip(self._schema.names, self._values))
         if self.geom and hasattr(self.geom, 'isGeosValid') \
            and not self.geom.isGeosValid():
             self.geom = self.geom.makeValid()
@@ -154,21 +216,15 @@ class FeatureCollection:
             database table the features are in
         '''
         self.table = table
-        self._it = 0
 
     def __iter__(self):
-        self.table.reset_cursor()
+        iter(self.table)
         return self
 
     def __next__(self):
-        if self._it >= len(self.table):
-            self._it = 0
-            self.table.reset_cursor()
-            raise StopIteration
-        else:
-            row = next(self.table)
-            self._it += 1
-            return self._row_to_feature(row)
+        # the table resets its cursor when exhausted
+        row = next(self.table)
+        return self._row_to_feature(row)
 
     def __len__(self):
         return len(self.table)
@@ -202,17 +258,7 @@ class FeatureCollection:
             employees.delete(name__in=['Thomas Müller', 'Hans Müller'])
             employees.delete(income__gt=60000, age__lt=65)
         '''
-        if len(kwargs) > 0:
-            prev_where = self.table.where
-            ids = [feat.id for feat in self.filter(**kwargs)]
-            # reset filter
-            # ToDo: fix filter side effects
-            self.table.where = prev_where
-        else:
-            # delete all features
-            ids = [feat.id for feat in self]
-        for id in ids:
-            self.table.delete(id)
+        self.table.delete_rows(**kwargs)
 
     def values(self, field_name: str) -> list:
         '''
@@ -637,6 +683,16 @@ class Table(ABC):
         '''
         raise NotImplementedError
 
+    @property
+    def schema(self) -> FeatureSchema:
+        '''
+        field metadata shared by all features of this table
+        '''
+        schema = getattr(self, '_schema', None)
+        if schema is None:
+            schema = self._schema = FeatureSchema(self.fields())
+        return schema
+
     def features(self):
         '''
         override to cache features
@@ -647,6 +703,35 @@ class Table(ABC):
         '''
         return FeatureCollection(self)
 
+    def delete_rows(self, **kwargs):
+        '''
+        override
+
+        Parameters
+        ----------
+        **kwargs
+            field filters the rows to delete have to match (in addition to
+            the active filters of the table)
+
+        Returns
+        -------
+        count : int
+            number of deleted rows
+        '''
+        raise NotImplementedError
+
+    def content_hash(self) -> str:
+        '''
+        override
+
+        Returns
+        -------
+        str
+            hash of the content of the whole table, changes whenever any row
+            of the table changes
+        '''
+        raise NotImplementedError
+
     def to_pandas(self, columns=[]):
         '''
         override
@@ -22,10 +22,15 @@ __author__ = 'Christoph Franke'
 __date__ = '16/07/2019'
 
 import os
+import itertools
+import hashlib
+import threading
+import weakref
+from contextlib import contextmanager
 from osgeo import ogr, osr
 from qgis.core import QgsGeometry
 import pandas as pd
-from typing import Union, List
+from typing import Union, List, Tuple
 from collections import OrderedDict
 import numpy as np
 import datetime
@@ -43,6 +48,448 @@ DATATYPES = {
     datetime.date: ogr.OFTDateTime
 }
 
+# "__in" filters with more values are matched via temporary key tables
+MAX_INLINE_KEYS = 500
+# number of keys inserted into a key table per statement
+KEY_CHUNK_SIZE = 500
+_key_table_ids = itertools.count()
+
+
+def sql_literal(value: object) -> str:
+    '''
+    render a value as a SQLite literal
+
+    Parameters
+    ----------
+    value : object
+        value of a basic data type (or its numpy equivalent)
+
+    Returns
+    -------
+    str
+        escaped literal
+    '''
+    if value is None:
+        return 'NULL'
+    if isinstance(value, (bool, np.bool_)):
+        return '1' if value else '0'
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)):
+        return 'NULL' if np.isnan(value) else repr(float(value))
+    if isinstance(value, datetime.date):
+        value = value.isoformat()
+    value = str(value)
+    # strings may still be enclosed in double quotes by convention
+    if len(value) > 1 and value.startswith('"') and value.endswith('"'):
+        value = value[1:-1]
+    return "'" + value.replace("'", "''") + "'"
+
+
+def bind_parameters(sql: str, params: list) -> str:
+    '''
+    bind parameters to the "?" placeholders of a SQL expression as escaped
+    literals (OGR attribute filters don't support parameters)
+
+    Parameters
+    ----------
+    sql : str
+        SQL expression with "?" as placeholders
+    params : list
+        values to bind in order of the placeholders
+
+    Returns
+    -------
+    str
+        SQL expression with bound values
+    '''
+    parts = sql.split('?')
+    if len(parts) - 1 != len(params):
+        raise ValueError(f'{len(parts) - 1} placeholders but '
+                         f'{len(params)} parameters given')
+    bound = [parts[0]]
+    for param, part in zip(params, parts[1:]):
+        bound.append(sql_literal(param))
+        bound.append(part)
+    return ''.join(bound)
+
+
+class CompiledFilter:
+    '''
+    Django-style field filters compiled into a parameterised SQLite where
+    clause. The lookups are parsed and matched to the fields only once, the
+    values are bound every time the filter is applied
+
+    Attributes
+    ----------
+    terms : list
+        tuples of filter key, column name and lookup
+    '''
+    OPERATORS = {
+        'eq': '=',
+        'gt': '>',
+        'lt': '<',
+        'ne': '<>',
+        'in': 'IN'
+    }
+
+    def __init__(self, keys: List[str], fields: List[Field], id_field: str):
+        '''
+        Parameters
+        ----------
+        keys : list
+            filter keys, field names or field filter names (Django-style)
+        fields : list
+            Field objects of the filtered table
+        id_field : str
+            name of the id column (filter key "id" is mapped to it)
+        '''
+        field_names = [f.name for f in fields]
+        self.terms = []
+        for key in keys:
+            split = key.split('__')
+            field_name = split[0]
+            lookup = split[1] if len(split) > 1 else 'eq'
+            if lookup not in self.OPERATORS:
+                raise ValueError(f'filter {lookup} is not supported')
+            if field_name == 'id':
+                column = id_field
+            elif field_name not in field_names:
+                raise ValueError(f'{field_name} not in fields')
+            else:
+                column = field_name
+            self.terms.append((key, column, lookup))
+
+    def sql(self, filters: dict, key_table: object = None
+            ) -> Tuple[str, list]:
+        '''
+        where clause with the given filter values
+
+        Parameters
+        ----------
+        filters : dict
+            filter keys the filter was compiled with as keys and the values to
+            match as values
+        key_table : function, optional
+            called with the values of "__in" filters exceeding MAX_INLINE_KEYS,
+            expected to return the name of a table with a column "key"
+            containing those values, defaults to binding all values of "__in"
+            filters as parameters
+
+        Returns
+        -------
+        tuple
+            where clause with "?" as placeholders and list of parameters
+        '''
+        clauses = []
+        params = []
+        for key, column, lookup in self.terms:
+            value = filters[key]
+            operator = self.OPERATORS[lookup]
+            if lookup == 'in':
+                values = list(value)
+                if not values:
+                    # nothing can match an empty list
+                    clauses.append('0')
+                elif key_table and len(values) > MAX_INLINE_KEYS:
+                    table = key_table(values)
+                    clauses.append(f'"{column}" IN (SELECT key FROM {table})')
+                else:
+                    placeholders = ', '.join(['?'] * len(values))
+                    clauses.append(f'"{column}" IN ({placeholders})')
+                    params.extend(values)
+            elif value is None and lookup in ('eq', 'ne'):
+                clauses.append(f'"{column}" IS {"NOT " if lookup == "ne" else ""}'
+                               'NULL')
+            else:
+                clauses.append(f'"{column}" {operator} ?')
+                params.append(value)
+        return ' AND '.join(clauses), params
+
+
+class GeopackageConnections:
+    '''
+    process-wide pool of ogr connections to geopackage files shared by all
+    workspaces. Every writable file has a single writer handle used for the
+    writes (and the reads inside of write transactions), writes on it are
+    serialised by a lock per file. All other reads are served by handles
+    held per thread and file (ogr handles must not be used by multiple
+    threads at once), so that workers can read in parallel. The handles of a
+    thread are closed with release_thread() when its job is done, handles of
+    threads that ended without releasing them are closed when the next
+    handle is opened. Geopackages opened for writing are switched to WAL
+    journal mode, so that readers are not blocked by writes and writes are
+    not blocked by readers
+    '''
+    _writers = {}
+    # read-only connections by connection id as tuples of file key, owning
+    # thread and connection
+    _readers = {}
+    # read-only connections of the calling thread by file key
+    _local = threading.local()
+    _locks = {}
+    # threads running a transaction per connection
+    _transactions = {}
+    # open result sets per connection
+    _results = {}
+    # result sets released by other threads than the one owning the
+    # connection, released by the owning thread on its next request
+    _pending = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.normcase(os.path.abspath(path))
+
+    @classmethod
+    def _open(cls, path: str, update: bool) -> ogr.DataSource:
+        conn = ogr.Open(path, 1 if update else 0)
+        if conn is None:
+            raise ConnectionError(f'{path} could not be opened')
+        return conn
+
+    @classmethod
+    def lock(cls, path: str) -> threading.RLock:
+        '''
+        lock serialising the writes on the geopackage file with given path
+        '''
+        key = cls._key(path)
+        with cls._lock:
+            lock = cls._locks.get(key)
+            if lock is None:
+                lock = cls._locks[key] = threading.RLock()
+        return lock
+
+    @classmethod
+    def writer(cls, path: str) -> ogr.DataSource:
+        '''
+        shared writable connection to the geopackage file with given path
+        (opened in WAL mode)
+        '''
+        key = cls._key(path)
+        with cls._lock:
+            conn = cls._writers.get(key)
+            if conn is None:
+                conn = cls._open(path, True)
+                cls._execute(conn, 'PRAGMA journal_mode=WAL;')
+                cls._writers[key] = conn
+        return conn
+
+    @classmethod
+    def reader(cls, path: str) -> ogr.DataSource:
+        '''
+        read-only connection to the geopackage file with given path owned by
+        the calling thread
+        '''
+        key = cls._key(path)
+        readers = getattr(cls._local, 'readers', None)
+        if readers is None:
+            readers = cls._local.readers = {}
+        conn = readers.get(key)
+        with cls._lock:
+            # the connection might have been closed by close()
+            if conn is not None and id(conn) not in cls._readers:
+                conn = None
+            pending = cls._pending.pop(id(conn), []) if conn else []
+        if conn is None:
+            cls._close_dead_readers()
+            conn = readers[key] = cls._open(path, False)
+            with cls._lock:
+                cls._readers[id(conn)] = (
+                    key, threading.current_thread(), conn)
+        for result in pending:
+            cls._release(result)
+        return conn
+
+    @classmethod
+    def release_thread(cls):
+        '''
+        close the read-only connections of the calling thread, to be called
+        when the thread is done with the geopackages (e.g. at the end of a
+        job), connections requested afterwards are opened again
+        '''
+        readers = getattr(cls._local, 'readers', None)
+        if not readers:
+            return
+        with cls._lock:
+            conns = [cls._readers.pop(id(conn))[2]
+                     for conn in readers.values() if id(conn) in cls._readers]
+            readers.clear()
+            for conn in conns:
+                cls._close_conn(conn)
+
+    @classmethod
+    def _close_dead_readers(cls):
+        '''
+        close the read-only connections of threads that ended without
+        releasing them
+        '''
+        with cls._lock:
+            dead = [k for k, (_, thread, _) in cls._readers.items()
+                    if not thread.is_alive()]
+            for k in dead:
+                cls._close_conn(cls._readers.pop(k)[2])
+
+    @classmethod
+    def in_transaction(cls, conn: ogr.DataSource) -> bool:
+        '''
+        True if the calling thread runs a transaction on given connection
+        '''
+        return cls._transactions.get(id(conn)) == threading.get_ident()
+
+    @classmethod
+    def register(cls, result: '_ResultSet'):
+        '''
+        register an open result set, it is released before its connection is
+        closed
+        '''
+        with cls._lock:
+            cls._results.setdefault(
+                id(result.conn), weakref.WeakSet()).add(result)
+
+    @classmethod
+    def release(cls, result: '_ResultSet'):
+        '''
+        release a result set and drop the temporary tables of its query. The
+        result sets of connections owned by other threads are released by
+        the owning thread on its next request of the connection
+        '''
+        if result.layer is None:
+            return
+        if result.owner is None:
+            with cls.lock(result.path):
+                cls._release(result)
+        elif result.owner is not threading.current_thread():
+            with cls._lock:
+                cls._pending.setdefault(id(result.conn), []).append(result)
+        else:
+            cls._release(result)
+
+    @classmethod
+    def _release(cls, result: '_ResultSet'):
+        layer, result.layer = result.layer, None
+        if layer is None:
+            return
+        result.conn.ReleaseResultSet(layer)
+        for name in result.key_tables:
+            cls._execute(result.conn, f'DROP TABLE IF EXISTS temp."{name}";')
+
+    @staticmethod
+    def _execute(conn: ogr.DataSource, sql: str):
+        res = conn.ExecuteSQL(sql, dialect='SQLITE')
+        if res is not None:
+            conn.ReleaseResultSet(res)
+
+    @classmethod
+    def checkpoint(cls, path: str):
+        '''
+        write the content of the WAL file back into the geopackage file with
+        given path (e.g. before copying the file)
+        '''
+        conn = cls._writers.get(cls._key(path))
+        if conn is None:
+            return
+        with cls.lock(path):
+            cls._execute(conn, 'PRAGMA wal_checkpoint(TRUNCATE);')
+
+    @classmethod
+    def close(cls, path: str):
+        '''
+        close all connections to the geopackage file with given path,
+        connections requested afterwards are opened again
+        '''
+        key = cls._key(path)
+        with cls.lock(path), cls._lock:
+            conns = [cls._readers.pop(k)[2] for k, (k_path, _, _)
+                     in list(cls._readers.items()) if k_path == key]
+            writer = cls._writers.pop(key, None)
+            if writer is not None:
+                conns.append(writer)
+            for conn in conns:
+                cls._close_conn(conn)
+
+    @classmethod
+    def _close_conn(cls, conn: ogr.DataSource):
+        # result sets can't be released after closing, expects the pool lock
+        # to be held
+        results = list(cls._results.pop(id(conn), []))
+        results += cls._pending.pop(id(conn), [])
+        for result in results:
+            cls._release(result)
+        cls._transactions.pop(id(conn), None)
+        conn.Close()
+
+
+class _ResultSet:
+    '''
+    features returned by a SQLite query on a geopackage connection, owns the
+    result layer and the temporary key tables of the query until released
+
+    Attributes
+    ----------
+    conn : DataSource
+        the connection the query was executed on
+    layer : Layer
+        ogr result layer, None after releasing
+    key_tables : list
+        names of the temporary tables dropped when releasing
+    owner : Thread
+        the thread owning the connection, None for the shared writer
+        connection
+    '''
+    # alias of the id column in the queries
+    ID_COLUMN = '_row_id'
+
+    def __init__(self, conn: ogr.DataSource, path: str, sql: str,
+                 spatial_filter: ogr.Geometry = None,
+                 key_tables: List[str] = [],
+                 owner: threading.Thread = None):
+        self.conn = conn
+        self.path = path
+        self.key_tables = list(key_tables)
+        self.owner = owner
+        self.layer = conn.ExecuteSQL(sql, spatialFilter=spatial_filter,
+                                     dialect='SQLITE')
+        if self.layer is None:
+            for name in self.key_tables:
+                GeopackageConnections._execute(
+                    conn, f'DROP TABLE IF EXISTS temp."{name}";')
+            raise ValueError(f'query failed: {sql}')
+        GeopackageConnections.register(self)
+        # ogr may take the aliased primary key as feature id
+        self._id_index = self.layer.GetLayerDefn().GetFieldIndex(
+            self.ID_COLUMN)
+
+    def feature_id(self, feat: ogr.Feature) -> int:
+        '''
+        id of a feature of the result in the queried table
+        '''
+        if self._id_index >= 0:
+            return feat.GetField(self._id_index)
+        return feat.GetFID()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> ogr.Feature:
+        feat = self.layer.GetNextFeature() if self.layer else None
+        if not feat:
+            raise StopIteration
+        return feat
+
+    def close(self):
+        GeopackageConnections.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        if self.layer is not None:
+            self.close()
+
 
 class GeopackageWorkspace(Workspace):
     '''
@@ -51,7 +498,9 @@ class GeopackageWorkspace(Workspace):
     Attributes
     ----------
     conn : DataSource
-        ogr connection to geopackage file
+        ogr connection to geopackage file used for writing
+    lock : RLock
+        lock serialising the writes on the geopackage file
     tables : list
         names of available tables in workspace
     wkb_types : list
@@ -74,15 +523,117 @@ class GeopackageWorkspace(Workspace):
             raise ValueError('workspace name can not be empty')
         if not os.path.exists(self.path):
             raise FileNotFoundError(f'{self.path} does not exist')
-        self._conn = None
+        # compiled filters per table and filter keys
+        self._compiled_filters = {}
+        self.lock = GeopackageConnections.lock(self.path)
 
     @property
     def conn(self) -> ogr.DataSource:
-        ''' ogr connection '''
-        if not(self._conn):
-            self._conn = ogr.Open(
-                self.path, 0 if self.database.read_only else 1)
-        return self._conn
+        '''
+        ogr connection for writing, shared writer connection of the file or
+        read-only connection of the calling thread if the database is
+        read-only. Use it only while holding the lock
+        '''
+        if self.database.read_only:
+            return GeopackageConnections.reader(self.path)
+        return GeopackageConnections.writer(self.path)
+
+    def read_conn(self) -> Tuple[ogr.DataSource, threading.Thread]:
+        '''
+        ogr connection for reading, the writer connection inside of write
+        transactions of the calling thread (so that the uncommitted changes
+        are read), otherwise the read-only connection of the calling thread
+
+        Returns
+        -------
+        tuple
+            the connection and the thread owning it (None for the writer
+            connection)
+        '''
+        if not self.database.read_only:
+            # the writer switches the file to WAL mode before any reads
+            writer = GeopackageConnections.writer(self.path)
+            if GeopackageConnections.in_transaction(writer):
+                return writer, None
+        return (GeopackageConnections.reader(self.path),
+                threading.current_thread())
+
+    @staticmethod
+    def _rows(conn: ogr.DataSource, sql: str) -> List[tuple]:
+        res = conn.ExecuteSQL(sql, dialect='SQLITE')
+        if res is None:
+            return []
+        try:
+            rows = [tuple(f.GetField(i) for i in range(f.GetFieldCount()))
+                    for f in res]
+        finally:
+            conn.ReleaseResultSet(res)
+        return rows
+
+    def execute(self, sql: str) -> List[tuple]:
+        '''
+        execute a SQLite statement on the writer connection of the geopackage
+
+        Parameters
+        ----------
+        sql : str
+            SQLite statement
+
+        Returns
+        -------
+        list
+            rows of the result as tuples, empty if the statement has no result
+        '''
+        with self.lock:
+            return self._rows(self.conn, sql)
+
+    def query(self, sql: str) -> List[tuple]:
+        '''
+        execute a reading SQLite statement on the read connection of the
+        calling thread
+
+        Parameters
+        ----------
+        sql : str
+            SQLite statement
+
+        Returns
+        -------
+        list
+            rows of the result as tuples
+        '''
+        conn, owner = self.read_conn()
+        if owner is None:
+            with self.lock:
+                return self._rows(conn, sql)
+        return self._rows(conn, sql)
+
+    @contextmanager
+    def transaction(self):
+        '''
+        context manager for a write transaction on the geopackage, other
+        threads can not write while the transaction is running, the
+        transaction is rolled back on errors. Nested transactions are part of
+        the outermost one
+        '''
+        running = GeopackageConnections._transactions
+        with self.lock:
+            conn = self.conn
+            if id(conn) in running:
+                yield conn
+                return
+            conn.StartTransaction()
+            # reads of this thread go to this connection until committed
+            running[id(conn)] = threading.get_ident()
+            try:
+                yield conn
+            except Exception:
+                conn.RollbackTransaction()
+                raise
+            else:
+                conn.CommitTransaction()
+            finally:
+                running.pop(id(conn), None)
 
     @staticmethod
     def _fn(database: Database, name: str) -> str:
@@ -118,8 +669,9 @@ class GeopackageWorkspace(Workspace):
         return GeopackageWorkspace(name, database)
 
     def remove_table(self, name):
-        if self.conn.GetLayerByName(name):
-            self.conn.DeleteLayer(name)
+        with self.lock:
+            if self.conn.GetLayerByName(name):
+                self.conn.DeleteLayer(name)
 
     @classmethod
     def create(cls, name: str, database: Database,
@@ -150,7 +702,8 @@ class GeopackageWorkspace(Workspace):
         '''
         names of available tables
         '''
-        tables = [l.GetName() for l in self.conn]
+        tables = [r[0] for r in
+                  self.query('SELECT table_name FROM gpkg_contents;')]
         return tables
 
     def get_table(self, name: str, field_names: list=None) -> 'GeopackageTable':
@@ -203,7 +756,7 @@ class GeopackageWorkspace(Workspace):
         GeopackageTable
         '''
         if overwrite and name in self.tables:
-            self.conn.DeleteLayer(name)
+            self.remove_table(name)
         kwargs = {}
         if geometry_type:
             wkb_types = self.wkb_types
@@ -219,17 +772,21 @@ class GeopackageWorkspace(Workspace):
             srs = osr.SpatialReference()
             srs.ImportFromEPSG(epsg)
             kwargs['srs'] = srs
-        layer = self.conn.CreateLayer(name, **kwargs)
-        for fieldname, typ in fields.items():
-            dt = DATATYPES[typ]
-            field = ogr.FieldDefn(fieldname, dt)
-            if fieldname in defaults:
-                default = str(defaults[fieldname])
-                # string default needs enclosing ""
-                if typ == str and not default.startswith('"'):
-                    default = f'"{default}"'
-                field.SetDefault(default)
-            layer.CreateField(field)
+        with self.lock:
+            layer = self.conn.CreateLayer(name, **kwargs)
+            for fieldname, typ in fields.items():
+                dt = DATATYPES[typ]
+                field = ogr.FieldDefn(fieldname, dt)
+                if fieldname in defaults:
+                    default = str(defaults[fieldname])
+                    # string default needs enclosing ""
+                    if typ == str and not default.startswith('"'):
+                        default = f'"{default}"'
+                    field.SetDefault(default)
+                layer.CreateField(field)
+            # ogr defers the creation of the table, the other connections
+            # can read it only after it is created in the file
+            layer.SyncToDisk()
         return self.get_table(name)
 
     @property
@@ -242,26 +799,26 @@ class GeopackageWorkspace(Workspace):
 
     def close(self):
         '''
-        close ogr connection to geopackage file
+        close all ogr connections to geopackage file (of all workspaces of
+        the file)
         '''
-        #self._conn.Release()
-        if hasattr(self, 'conn') and self._conn:
-            self._conn.Close()
-        del(self._conn)
-        self._conn = None
+        GeopackageConnections.close(self.path)
         super().close()
 
 
 class GeopackageTable(Table):
     '''
-    iterable table connected to a geopackage table
+    iterable table connected to a geopackage table. The table is read with
+    SQLite queries on the read-only connection of the calling thread, every
+    instance iterates over its own result set. The layer of the shared
+    writer connection is used for writing and for the metadata only
 
     Attributes
     ----------
     filters : dict
         active field filters
     where : str
-        active ogr filter string
+        active SQLite where clause
     '''
     id_field = 'fid' # ogr default feature id field name
     geom_field = 'geom' # ogr default geometry field name
@@ -285,18 +842,22 @@ class GeopackageTable(Table):
         self.workspace = workspace
         self.name = name
         self._where = ''
-        self._layer = self.workspace.conn.GetLayerByName(self.name)
+        self._filters = {}
+        # values of the long "__in" filters by the names of the key tables
+        # the where clause refers to, the tables are created per query
+        self._key_values = {}
+        self._spatial_filter = None
+        self._result = None
+        self._cursor = None
+        self._cursor_id = None
+        self._conn = None
+        self._sync_layer()
         if self._layer is None:
             raise ConnectionError(f'layer {self.name} not found')
-        # reset filters (ogr remembers them even on new connecion)
-        self.reset()
         if field_names:
             self.field_names = list(field_names)
         else:
-            defn = self._layer.GetLayerDefn()
-            self.field_names = [defn.GetFieldDefn(i).GetName()
-                                for i in range(defn.GetFieldCount())]
-        self._filters = {}
+            self.field_names = self._layer_fields()
         self.filter(**filters)
 
     def copy(self) -> 'GeopackageTable':
@@ -307,22 +868,91 @@ class GeopackageTable(Table):
         -------
         GeopackageTable
         '''
-        return GeopackageTable(self.name, self.workspace,
-                               field_names=self.field_names,
-                               filters=self._filters)
+        table = GeopackageTable(self.name, self.workspace,
+                                field_names=self.field_names,
+                                filters=self._filters)
+        # copies share the field metadata
+        table._fields = getattr(self, '_fields', None)
+        table._schema = getattr(self, '_schema', None)
+        return table
+
+    def _layer_fields(self) -> List[str]:
+        '''
+        names of all fields of the layer
+        '''
+        with self.workspace.lock:
+            defn = self._layer.GetLayerDefn()
+            return [defn.GetFieldDefn(i).GetName()
+                    for i in range(defn.GetFieldCount())]
 
-    def _ogr_feat_to_row(self, feat: ogr.Feature) -> dict:
+    def _query(self, field_names: List[str] = None, geometry: bool = True,
+               select: str = None, where: str = None) -> _ResultSet:
+        '''
+        query the rows of this table matching the filters (incl. the spatial
+        filter) on the read connection of the calling thread. Only the
+        requested columns are read
+
+        Parameters
+        ----------
+        field_names : list, optional
+            names of the fields to read, defaults to the fields shown in table
+        geometry : bool, optional
+            read the geometries if True, defaults to reading geometries
+        select : str, optional
+            expression to select instead of the columns (e.g. "count(*)"),
+            not supported in combination with a spatial filter
+        where : str, optional
+            where clause to query instead of the one of the filters, the
+            spatial filter is ignored as well then
+
+        Returns
+        -------
+        _ResultSet
+            the result of the query, has to be closed after reading
+        '''
+        if field_names is None:
+            field_names = self.field_names
+        self._sync_layer()
+        with self.workspace.lock:
+            id_column = self._layer.GetFIDColumn() or self.id_field
+            geom_column = self._layer.GetGeometryColumn()
+        layer_fields = self._layer_fields()
+        spatial_filter = None
+        if self._spatial_filter and geom_column and where is None:
+            spatial_filter = ogr.CreateGeometryFromWkt(self._spatial_filter)
+            # the geometries are needed to filter them
+            geometry = True
+        if select is None:
+            columns = [f'"{id_column}" AS "{_ResultSet.ID_COLUMN}"']
+            columns += [f'"{f}"' for f in field_names if f in layer_fields]
+            if geometry and geom_column:
+                columns.append(f'"{geom_column}"')
+            select = ', '.join(columns)
+        conn, owner = self.workspace.read_conn()
+        where, key_tables = self._bind_key_tables(
+            conn, self._where if where is None else where)
+        condition = f' WHERE {where}' if where else ''
+        return _ResultSet(conn, self.workspace.path,
+                          f'SELECT {select} FROM "{self.name}"{condition}',
+                          spatial_filter=spatial_filter,
+                          key_tables=key_tables, owner=owner)
+
+    def _ogr_feat_to_row(self, feat: ogr.Feature, field_names: List[str] = None,
+                         read_geom: bool = True, id: int = None) -> dict:
         ''' ogr feature to table row (dict with field names as keys and field
-        values as values) '''
-        if self.field_names is not None:
-            items = OrderedDict([(f, feat[f] if not isinstance(feat[f], str)
-                                  else feat[f].replace('"', ''))
-                                 for f in self.field_names
-                                 if hasattr(feat, f)])
-        else:
-            items = OrderedDict(self._cursor.items())
-        items[self.id_field] = feat.GetFID()
-        geom = feat.geometry()
+        values as values), only the given fields are read '''
+        if field_names is None:
+            field_names = self.field_names
+        items = OrderedDict()
+        for f in field_names:
+            if not hasattr(feat, f):
+                continue
+            value = feat[f]
+            if isinstance(value, str):
+                value = value.replace('"', '')
+            items[f] = value
+        items[self.id_field] = feat.GetFID() if id is None else id
+        geom = feat.geometry() if read_geom else None
         if geom:
             qgeom = QgsGeometry()
             qgeom.fromWkb(geom.ExportToWkb())
@@ -333,16 +963,20 @@ class GeopackageTable(Table):
         return items
 
     def __iter__(self):
-        self._layer.ResetReading()
+        self.reset_cursor()
+        # hidden fields don't have to be read at all
+        self._result = self._query()
         return self
 
     def __next__(self):
-        cursor = self._layer.GetNextFeature()
-        self._cursor = cursor
+        result = self._result
+        cursor = next(result, None) if result else None
         if not cursor:
             self.reset_cursor()
             raise StopIteration
-        return self._ogr_feat_to_row(cursor)
+        self._cursor = cursor
+        self._cursor_id = result.feature_id(cursor)
+        return self._ogr_feat_to_row(cursor, id=self._cursor_id)
 
     def __getitem__(self, idx):
         # there is no indexing of ogr layers, so just iterate
@@ -353,16 +987,115 @@ class GeopackageTable(Table):
             idx = length - 1
         elif idx >= length:
             raise IndexError(f'index {idx} exceeds table length of {length}')
-        for i, feat in enumerate(self._layer):
-            if i == idx:
-                self._layer.ResetReading()
-                return self._ogr_feat_to_row(feat)
+        with self._query() as result:
+            for i, feat in enumerate(result):
+                if i == idx:
+                    return self._ogr_feat_to_row(
+                        feat, id=result.feature_id(feat))
+
+    def _sync_layer(self):
+        '''
+        make sure the layer belongs to the current connection of the workspace
+        (connections are shared and may have been closed and reopened)
+        '''
+        with self.workspace.lock:
+            conn = self.workspace.conn
+            if conn is not self._conn:
+                self._conn = conn
+                self._layer = conn.GetLayerByName(self.name)
+
+    def _compiled_filter(self, keys: Tuple[str]) -> CompiledFilter:
+        '''
+        filter compiled for the given filter keys, cached per table
+        '''
+        cache = self.workspace._compiled_filters
+        compiled = cache.get((self.name, keys))
+        if compiled is None:
+            compiled = CompiledFilter(keys, self.fields(),
+                                      id_field=self.id_field)
+            cache[(self.name, keys)] = compiled
+        return compiled
+
+    def _key_table(self, values: list) -> str:
+        '''
+        register the values of a long "__in" filter as key table of the where
+        clause, the temporary table with the values in column "key" is
+        created on the connection of every query reading the table
+
+        Returns
+        -------
+        str
+            name of the table in the where clause
+        '''
+        name = f'_keys_{next(_key_table_ids)}'
+        self._key_values[name] = list(values)
+        return f'temp."{name}"'
+
+    def _bind_key_tables(self, conn: ogr.DataSource, where: str
+                         ) -> Tuple[str, List[str]]:
+        '''
+        create the key tables referred to in a where clause on a connection
+        under new names, so that concurrent queries don't share them
+
+        Returns
+        -------
+        tuple
+            where clause referring to the created tables and their names
+            (to drop them after the query)
+        '''
+        names = []
+        for key, values in self._key_values.items():
+            ref = f'temp."{key}"'
+            if ref not in where:
+                continue
+            name = f'{key}_{next(_key_table_ids)}'
+            GeopackageConnections._execute(
+                conn, f'CREATE TEMP TABLE "{name}" (key PRIMARY KEY);')
+            for i in range(0, len(values), KEY_CHUNK_SIZE):
+                rows = ', '.join(f'({sql_literal(v)})'
+                                 for v in values[i:i + KEY_CHUNK_SIZE])
+                GeopackageConnections._execute(
+                    conn, f'INSERT OR IGNORE INTO temp."{name}" (key) '
+                    f'VALUES {rows};')
+            where = where.replace(ref, f'temp."{name}"')
+            names.append(name)
+        return where, names
+
+    def _apply_filters(self):
+        '''
+        compile the active filters into the where clause
+        '''
+        compiled = self._compiled_filter(tuple(self._filters.keys()))
+        sql, params = compiled.sql(self._filters, key_table=self._key_table)
+        self.where = bind_parameters(sql, params)
+
+    @contextmanager
+    def _additional_filters(self, **kwargs):
+        '''
+        context manager applying filters on top of the active ones, the
+        previous filters are restored afterwards
+        '''
+        if not kwargs:
+            yield
+            return
+        prev_where = self.where
+        prev_filters = self._filters.copy()
+        prev_keys = self._key_values.copy()
+        self._filters.update(kwargs)
+        try:
+            self._apply_filters()
+            yield
+        finally:
+            self._key_values = prev_keys
+            self._filters = prev_filters
+            self.where = prev_where
 
     def reset(self):
         '''
         reset the filters (removes all filters)
         '''
         self._filters = {}
+        self._key_values = {}
         self.where = ''
         self.spatial_filter()
         self.reset_cursor()
@@ -371,8 +1104,11 @@ class GeopackageTable(Table):
         '''
         reset the iterating cursor
         '''
-        self._layer.ResetReading()
+        if self._result is not None:
+            self._result.close()
+            self._result = None
         self._cursor = None
+        self._cursor_id = None
 
     def filter(self, **kwargs):
         '''
@@ -389,7 +1125,8 @@ class GeopackageTable(Table):
 
             available filters:
                 <field-name>__in : list
-                    values of field have to match any value in the list
+                    values of field have to match any value in the list,
+                    long lists are matched via temporary key tables
                 <field-name>__gt : object
                     values of field have to be greater than value
                 <field-name>__lt : object
@@ -401,55 +1138,19 @@ class GeopackageTable(Table):
             table.filter(name__in=['Thomas Müller', 'Hans Müller'])
             table.filter(income__gt=60000, age__lt=65)
 
+            the filters are compiled once per table and combination of
+            filter keys and applied as a SQLite where clause
+
         Returns
         -------
         GeopackageTable
             filtered table
         '''
-        # ToDo: more filters
-        terms = []
-        #field_names = [field.name for field in self.fields()]
-        # ToDo: if there it is eventually possible to filter OR you can't just
-        # append filters to old ones
-        # (but seperate  previous and new filters with brackets)
         self._filters.update(kwargs)
-        field_dict = dict([(f.name, f) for f in self.fields()])
-
-        def check_quotation(value, field):
-            if field.datatype == str and (
-                not isinstance(value, str) or not value.startswith('"')):
-                value = f'"{value}"'
-            return value
-
-        for k, v in self._filters.items():
-            split = k.split('__')
-            field_name = split[0]
-            matching_field = field_dict.get(field_name)
-            if field_name == 'id':
-                field_name = self.id_field
-            elif not matching_field:
-                raise ValueError(f'{field_name} not in fields')
-            else:
-                if isinstance(v, list):
-                    v = [check_quotation(i, matching_field) for i in v]
-                else:
-                    v = check_quotation(v, matching_field)
-
-            if len(split) == 1:
-                terms.append(f'{field_name} = {v}')
-            elif split[1] == 'in':
-                vstr = [str(i) for i in v]
-                terms.append(f'"{field_name}" in ({",".join(vstr)})')
-            elif split[1] == 'gt':
-                terms.append(f'"{field_name}" > {v}')
-            elif split[1] == 'lt':
-                terms.append(f'"{field_name}" < {v}')
-            elif split[1] == 'ne':
-                terms.append(f'"{field_name}" <> {v}')
-        where = ' and '.join(terms)
-        #if self.where:
-            #where = f'({self.where}) and ({where})'
-        self.where = where
+        # the whole clause is compiled again, the key tables of the replaced
+        # clause are not referenced anymore
+        self._key_values = {}
+        self._apply_filters()
 
     def spatial_filter(self, wkt: str = None):
         '''
@@ -463,9 +1164,7 @@ class GeopackageTable(Table):
             remain, defaults to None (-> no spatial filtering)
 
         '''
-        if wkt is not None:
-            wkt = ogr.CreateGeometryFromWkt(wkt)
-        self._layer.SetSpatialFilter(wkt)
+        self._spatial_filter = wkt
 
     @property
     def filters(self) -> dict:
@@ -482,21 +1181,18 @@ class GeopackageTable(Table):
     @property
     def where(self) -> str:
         '''
-        active ogr filter string
+        active SQLite where clause
 
         Returns
         -------
         str
-            filter string (ogr database style)
+            where clause (SQLite style)
         '''
         return self._where
 
     @where.setter
     def where(self, value):
-        self._cursor = None
         self._where = value
-        self._layer = self.workspace.conn.GetLayerByName(self.name)
-        self._layer.SetAttributeFilter(value)
 
     def fields(self, cached: bool = True) -> List[Field]:
         '''
@@ -516,15 +1212,18 @@ class GeopackageTable(Table):
         '''
         if cached and getattr(self, '_fields', None):
             return self._fields
-        definition = self._layer.GetLayerDefn()
+        self._sync_layer()
+        with self.workspace.lock:
+            definition = self._layer.GetLayerDefn()
+            field_defns = []
+            for i in range(definition.GetFieldCount()):
+                defn = definition.GetFieldDefn(i)
+                field_defns.append((defn.GetName(), defn.GetType(),
+                                    defn.GetDefault()))
         fields = []
         rev_types = {v: k for k, v in DATATYPES.items()}
-        for i in range(definition.GetFieldCount()):
-            defn = definition.GetFieldDefn(i)
-            name = defn.GetName()
-            t = defn.GetType()
+        for name, t, default in field_defns:
             datatype = rev_types[t] if t in rev_types else None
-            default = defn.GetDefault()
             if default == 'None':
                 default = None
             # GetDefault returns strings -> need to cast
@@ -535,6 +1234,8 @@ class GeopackageTable(Table):
                 else:
                     default = datatype(default)
             fields.append(Field(datatype, name=name, default=default))
+        self._fields = fields
+        self._schema = None
         return fields
 
     def add(self, **kwargs) -> dict:
@@ -557,6 +1258,7 @@ class GeopackageTable(Table):
         Exception
             ogr error code while creating
         '''
+        self._sync_layer()
         geom = kwargs.pop(self.geom_field, None)
         id = kwargs.pop(self.id_field, None)
         feature = ogr.Feature(self._layer.GetLayerDefn())
@@ -571,26 +1273,94 @@ class GeopackageTable(Table):
                 value = float(value)
             ret = feature.SetField(field, value)
         if geom:
-            if not isinstance(geom, ogr.Geometry):
-                # geometries as bytes are preferable
-                if hasattr(geom, 'asWkb'):
-                    geom = geom.asWkb().data()
-                # some qgis geometries only support export to wkt
-                elif hasattr(geom, 'asWkt'):
-                    geom = geom.asWkt()
-                if isinstance(geom, str):
-                    geom = ogr.CreateGeometryFromWkt(geom)
-                elif isinstance(geom, bytes):
-                    geom = ogr.CreateGeometryFromWkb(geom)
-                else:
-                    raise Exception('unsupported geometry type')
-            feature.SetGeometry(geom)
-        ret = self._layer.CreateFeature(feature)
+            feature.SetGeometry(self._ogr_geometry(geom))
+        with self.workspace.lock:
+            ret = self._layer.CreateFeature(feature)
         if ret != 0:
             raise Exception(f'Feature could not be created in table {self.name}. '
                             f'Ogr declined creation with error code {ret}')
         return self._ogr_feat_to_row(feature)
 
+    @staticmethod
+    def _ogr_geometry(geom: object) -> ogr.Geometry:
+        '''
+        qgis geometry, wkt or wkb to ogr geometry
+        '''
+        if isinstance(geom, ogr.Geometry):
+            return geom
+        # geometries as bytes are preferable
+        if hasattr(geom, 'asWkb'):
+            geom = geom.asWkb().data()
+        # some qgis geometries only support export to wkt
+        elif hasattr(geom, 'asWkt'):
+            geom = geom.asWkt()
+        if isinstance(geom, str):
+            return ogr.CreateGeometryFromWkt(geom)
+        if isinstance(geom, bytes):
+            return ogr.CreateGeometryFromWkb(geom)
+        raise Exception('unsupported geometry type')
+
+    def add_rows(self, columns: dict) -> int:
+        '''
+        add multiple rows to the table in a single transaction, faster than
+        adding the rows one by one
+
+        Parameters
+        ----------
+        columns : dict
+            field values in columns, field names as keys and sequences of
+            values of equal length as values (geometries under the name of the
+            geometry field, ids under the name of the id field),
+            None is written as NULL
+
+        Returns
+        -------
+        int
+            number of added rows
+
+        Raises
+        ------
+        Exception
+            ogr error code while creating
+        '''
+        lengths = set(len(values) for values in columns.values())
+        if len(lengths) > 1:
+            raise ValueError('all columns need to have the same length')
+        n_rows = lengths.pop() if lengths else 0
+        if not n_rows:
+            return 0
+        self._sync_layer()
+        defn = self._layer.GetLayerDefn()
+        geoms = columns.get(self.geom_field)
+        ids = columns.get(self.id_field)
+        # look up the field indices only once
+        fields = [(defn.GetFieldIndex(name), values)
+                  for name, values in columns.items()
+                  if name in self.field_names]
+        with self.workspace.transaction():
+            for i in range(n_rows):
+                feature = ogr.Feature(defn)
+                if ids is not None and ids[i] is not None:
+                    feature.SetFID(int(ids[i]))
+                for idx, values in fields:
+                    value = values[i]
+                    if value is None:
+                        continue
+                    if isinstance(value, np.integer):
+                        value = int(value)
+                    elif isinstance(value, np.floating):
+                        value = float(value)
+                    feature.SetField(idx, value)
+                geom = geoms[i] if geoms is not None else None
+                if geom:
+                    feature.SetGeometry(self._ogr_geometry(geom))
+                ret = self._layer.CreateFeature(feature)
+                if ret != 0:
+                    raise Exception(
+                        f'Feature could not be created in table {self.name}. '
+                        f'Ogr declined creation with error code {ret}')
+        return n_rows
+
     def add_field(self, field: Field):
         '''
         add a field to the table, will be created if not existing
@@ -612,15 +1382,19 @@ class GeopackageTable(Table):
             if field.datatype == str and not default.startswith('"'):
                 default = f'"{default}"'
             f.SetDefault(str(default))
-            self._layer.CreateField(f)
-            # set all existing rows to default value
-            feat = self._layer.GetNextFeature()
-            while feat:
-                feat.SetField(name, default)
-                self._layer.SetFeature(feat)
-                feat = self._layer.GetNextFeature()
+            self._sync_layer()
+            with self.workspace.lock:
+                self._layer.CreateField(f)
+                # set all existing rows to default value with a single
+                # statement
+                if field.default is not None:
+                    self.workspace.execute(
+                        f'UPDATE "{self.name}" SET "{name}" = '
+                        f'{sql_literal(field.default)};')
         if getattr(self, '_fields', None):
             self._fields.append(field)
+        # schema of features has to be rebuilt with the new field
+        self._schema = None
         if name not in self.field_names:
             self.field_names.append(name)
 
@@ -633,14 +1407,225 @@ class GeopackageTable(Table):
         id : int
             id (as given by ogr) of feature to delete
         '''
-        self._layer.DeleteFeature(id)
+        self._sync_layer()
+        with self.workspace.lock:
+            self._layer.DeleteFeature(id)
 
     def truncate(self):
         '''
         truncate the table removing all features in it
         '''
-        self.workspace.conn.ExecuteSQL(
-            f'DELETE FROM {self.name};', dialect='SQLITE')
+        self._sync_layer()
+        with self.workspace.transaction():
+            self._delete_where()
+
+    def _spatial_index(self, trigger: str = 'delete'
+                       ) -> Tuple[str, str, str]:
+        '''
+        R-tree indexing the geometries of this table
+
+        Parameters
+        ----------
+        trigger : str, optional
+            suffix of the trigger of the R-tree to return ("delete" or
+            "insert"), defaults to the trigger removing the index entries of
+            deleted rows
+
+        Returns
+        -------
+        tuple
+            name and SQL of the R-tree table and SQL of the requested trigger
+            (None if not found)
+        '''
+        geom_column = self._layer.GetGeometryColumn()
+        if not geom_column:
+            return None, None, None
+        rtree = f'rtree_{self.name}_{geom_column}'
+        rows = self.workspace.execute(
+            'SELECT type, sql FROM sqlite_master WHERE name IN '
+            f'({sql_literal(rtree)}, {sql_literal(f"{rtree}_{trigger}")});')
+        sql = dict(rows)
+        if 'table' not in sql:
+            return None, None, None
+        return rtree, sql['table'], sql.get('trigger')
+
+    def copy_rows_from(self, path: str, name: str = None) -> int:
+        '''
+        copy all rows of a table in another geopackage file into this table
+        with a single SQL statement (attaching the other file). Only the
+        fields present in both tables are copied. If this table is empty, the
+        ids are kept and the R-tree entries are copied as well instead of
+        indexing the geometries row by row. If the geometries of the other
+        table are in another spatial reference system, the rows are copied
+        one by one with transformed geometries instead
+
+        Parameters
+        ----------
+        path : str
+            path to the geopackage file to copy the rows from
+        name : str, optional
+            name of the table to copy the rows from, defaults to the name of
+            this table
+
+        Returns
+        -------
+        int
+            number of copied rows
+
+        Raises
+        ------
+        RuntimeError
+            if called inside of a transaction of the calling thread
+        '''
+        name = name or self.name
+        self._sync_layer()
+        execute = self.workspace.execute
+        if GeopackageConnections.in_transaction(self.workspace.conn):
+            raise RuntimeError(
+                f'rows can not be copied into {self.name} inside of a '
+                'transaction, databases can not be attached in transactions')
+        with self.workspace.lock:
+            execute(f'ATTACH DATABASE {sql_literal(path)} AS template;')
+            try:
+                src_columns = [r[1] for r in execute(
+                    f'PRAGMA template.table_info("{name}");')]
+                if not src_columns:
+                    raise FileNotFoundError(
+                        f'layer {name} not found in {path}')
+                geom_column = self._layer.GetGeometryColumn()
+                srs_sql = ('SELECT srs_id FROM {}gpkg_geometry_columns '
+                           'WHERE table_name={};')
+                srs_ids = [execute(srs_sql.format(schema, sql_literal(t)))
+                           for schema, t in [('', self.name),
+                                             ('template.', name)]]
+                srs_ids = [r[0][0] if r else None for r in srs_ids]
+                # srs ids < 1 are undefined systems, nothing to transform
+                transform = (geom_column and
+                             all(i is not None and i > 0 for i in srs_ids)
+                             and srs_ids[0] != srs_ids[1])
+                if not transform:
+                    n_rows = self._insert_attached(name, src_columns)
+            finally:
+                execute('DETACH DATABASE template;')
+        if transform:
+            return self._add_transformed_rows(path, name)
+        self._layer.ResetReading()
+        return n_rows
+
+    def _insert_attached(self, name: str, src_columns: List[str]) -> int:
+        '''
+        copy the rows of the table with given name in the geopackage attached
+        as "template" into this table, expects the workspace to be locked
+        '''
+        execute = self.workspace.execute
+        n_rows = execute(
+            f'SELECT count(*) FROM template."{name}";')[0][0]
+        id_column = self._layer.GetFIDColumn() or self.id_field
+        geom_column = self._layer.GetGeometryColumn()
+        columns = [c for c in self.field_names + [geom_column]
+                   if c and c in src_columns]
+        empty = execute(
+            f'SELECT count(*) FROM "{self.name}";')[0][0] == 0
+        if empty:
+            columns.insert(0, id_column)
+        columns = ', '.join(f'"{c}"' for c in columns)
+        with self.workspace.transaction():
+            rtree, rtree_sql, trigger_sql = self._spatial_index('insert')
+            src_rtree = f'rtree_{name}_{geom_column}'
+            bulk_index = (empty and rtree and trigger_sql and
+                          execute('SELECT count(*) FROM '
+                                  'template.sqlite_master WHERE name='
+                                  f'{sql_literal(src_rtree)};')[0][0])
+            if bulk_index:
+                execute(f'DROP TRIGGER "{rtree}_insert";')
+            execute(f'INSERT INTO "{self.name}" ({columns}) '
+                    f'SELECT {columns} FROM template."{name}";')
+            if bulk_index:
+                execute(f'INSERT INTO "{rtree}" '
+                        f'SELECT * FROM template."{src_rtree}";')
+                execute(trigger_sql)
+        return n_rows
+
+    def _add_transformed_rows(self, path: str, name: str) -> int:
+        '''
+        add the rows of a table in another geopackage file with geometries
+        transformed into the spatial reference system of this table, the ids
+        are kept if this table is empty
+        '''
+        conn = GeopackageConnections.reader(path)
+        layer = conn.GetLayerByName(name)
+        if layer is None:
+            raise FileNotFoundError(f'layer {name} not found in {path}')
+        with self.workspace.lock:
+            target = self._layer.GetSpatialRef().Clone()
+            empty = self.workspace.execute(
+                f'SELECT count(*) FROM "{self.name}";')[0][0] == 0
+        source = layer.GetSpatialRef().Clone()
+        if hasattr(osr, 'OAMS_TRADITIONAL_GIS_ORDER'):
+            for srs in (source, target):
+                srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        ct = osr.CoordinateTransformation(source, target)
+        defn = layer.GetLayerDefn()
+        src_fields = [defn.GetFieldDefn(i).GetName()
+                      for i in range(defn.GetFieldCount())]
+        columns = {f: [] for f in self.field_names if f in src_fields}
+        geoms = columns[self.geom_field] = []
+        if empty:
+            ids = columns[self.id_field] = []
+        layer.ResetReading()
+        for feat in layer:
+            for field, values in columns.items():
+                if field in src_fields:
+                    values.append(feat.GetField(field))
+            geom = feat.GetGeometryRef()
+            if geom is not None:
+                geom = geom.Clone()
+                geom.Transform(ct)
+            geoms.append(geom)
+            if empty:
+                ids.append(feat.GetFID())
+        layer.ResetReading()
+        return self.add_rows(columns)
+
+    def _delete_where(self, where: str = ''):
+        '''
+        delete the rows matching a SQLite where clause with a single
+        statement, the R-tree is updated in bulk instead of row by row by its
+        trigger. Has to be called inside a transaction
+
+        Parameters
+        ----------
+        where : str, optional
+            where clause, defaults to deleting all rows
+        '''
+        execute = self.workspace.execute
+        table = f'"{self.name}"'
+        where, key_tables = self._bind_key_tables(self.workspace.conn, where)
+        condition = f' WHERE {where}' if where else ''
+        rtree, rtree_sql, trigger_sql = self._spatial_index()
+        if trigger_sql:
+            execute(f'DROP TRIGGER "{rtree}_delete";')
+        if rtree and where:
+            id_column = self._layer.GetFIDColumn() or self.id_field
+            execute(f'DELETE FROM "{rtree}" WHERE id IN '
+                    f'(SELECT "{id_column}" FROM {table}{condition});')
+        elif rtree:
+            # rebuilding the empty index is faster than clearing it
+            execute(f'DROP TABLE "{rtree}";')
+            execute(rtree_sql)
+        execute(f'DELETE FROM {table}{condition};')
+        if trigger_sql:
+            execute(trigger_sql)
+        for name in key_tables:
+            execute(f'DROP TABLE IF EXISTS temp."{name}";')
+
+    def _ids(self) -> List[int]:
+        '''
+        ids of all rows in (filtered) table, no fields are read
+        '''
+        with self._query([], geometry=False) as result:
+            ids = [result.feature_id(f) for f in result]
+        return ids
 
     def values(self, field: Field) -> List[object]:
         '''
@@ -654,9 +1639,19 @@ class GeopackageTable(Table):
         list
             values of the given field in all features of this collection
         '''
-        values = [f[field] for f in self._layer]
+        with self._query([field], geometry=False) as result:
+            values = [f[field] for f in result]
         return values
 
+    def _full_feature(self, id: int) -> ogr.Feature:
+        '''
+        complete feature with given id read from the layer of the writer
+        connection, None if not found
+        '''
+        self._sync_layer()
+        with self.workspace.lock:
+            return self._layer.GetFeature(int(id))
+
     def set(self, id: int, **kwargs) -> bool:
         '''
         sets given values to fields of row with given id
@@ -667,7 +1662,7 @@ class GeopackageTable(Table):
             True - successful set
             False - row with id not found
         '''
-        feature = self._layer.GetFeature(id)
+        feature = self._full_feature(id)
         if not feature:
             return False
         if 'geom' in kwargs:
@@ -681,7 +1676,8 @@ class GeopackageTable(Table):
             if isinstance(value, np.float64):
                 value = float(value)
             feature.SetField(field_name, value)
-        self._layer.SetFeature(feature)
+        with self.workspace.lock:
+            self._layer.SetFeature(feature)
         return True
 
     def get(self, id: int) -> dict:
@@ -693,14 +1689,19 @@ class GeopackageTable(Table):
         dict
             field names as keys, field values as values
         '''
-
-        feat = self._layer.GetFeature(id)
-        return self._ogr_feat_to_row(feat)
+        with self.workspace.lock:
+            id_column = self._layer.GetFIDColumn() or self.id_field
+        # the filters don't apply to the ids
+        with self._query(where=f'"{id_column}" = {int(id)}') as result:
+            feat = next(result, None)
+            if not feat:
+                return None
+            return self._ogr_feat_to_row(feat, id=result.feature_id(feat))
 
     def delete_rows(self, **kwargs) -> int:
         '''
         deletes rows matching given filters (in addition to already existing
-        filters)
+        filters), the filters are translated into a single SQL statement
 
         Parameters
         ----------
@@ -713,17 +1714,48 @@ class GeopackageTable(Table):
         int
             number of deleted rows
         '''
-        prev_where = self.where
-        self.filter(**kwargs)
-        i = 0
-        self._layer.StartTransaction()
-        for feature in self._layer:
-            self._layer.DeleteFeature(feature.GetFID())
-            i += 1
-        self._layer.CommitTransaction()
-        self.where = prev_where
+        with self._additional_filters(**kwargs):
+            with self.workspace.transaction():
+                if getattr(self, '_spatial_filter', None):
+                    # spatial filters are evaluated by ogr only
+                    self._sync_layer()
+                    i = 0
+                    for id in self._ids():
+                        self._layer.DeleteFeature(id)
+                        i += 1
+                else:
+                    i = len(self)
+                    if i:
+                        self._delete_where(self._where)
         return i
 
+    def content_hash(self) -> str:
+        '''
+        hash of the content of the whole table (ids, values of all fields and
+        geometries) ignoring the active filters, changes whenever any row of
+        the table changes
+
+        Returns
+        -------
+        str
+            hexadecimal SHA-1 digest of the rows ordered by id
+        '''
+        sha = hashlib.sha1()
+        conn, owner = self.workspace.read_conn()
+        with _ResultSet(
+                conn, self.workspace.path,
+                f'SELECT * FROM "{self.name}" ORDER BY {self.id_field}',
+                owner=owner) as res:
+            for feat in res:
+                values = [feat.GetFID()]
+                values.extend(feat.GetField(i)
+                              for i in range(feat.GetFieldCount()))
+                sha.update(repr(values).encode('utf-8'))
+                geom = feat.GetGeometryRef()
+                if geom is not None:
+                    sha.update(bytes(geom.ExportToIsoWkb()))
+        return sha.hexdigest()
+
     def update_cursor(self, row: Union[dict, list]):
         '''
         update field values of current cursor position (while iterating)
@@ -735,16 +1767,20 @@ class GeopackageTable(Table):
         '''
         if isinstance(row, list):
             row = dict(zip(self.field_names, row))
+        # the cursor was read with the columns of the scan only, the complete
+        # feature is written
+        feature = self._full_feature(self._cursor_id)
         for field_name, value in row.items():
             if field_name == self.id_field:
                 continue
             if field_name == self.geom_field:
                 if value:
                     value = ogr.CreateGeometryFromWkt(value.asWkt())
-                self._cursor.SetGeometry(value)
+                feature.SetGeometry(value)
                 continue
-            self._cursor.SetField(field_name, value)
-        self._layer.SetFeature(self._cursor)
+            feature.SetField(field_name, value)
+        with self.workspace.lock:
+            self._layer.SetFeature(feature)
 
     def to_pandas(self, columns: List[str] = []) -> pd.DataFrame:
         '''
@@ -762,10 +1798,16 @@ class GeopackageTable(Table):
             pandas dataframe containing the (filtered) table rows and
             fields as columns
         '''
-        rows = []
-        for row in self:
-            rows.append(row)
         columns = columns or [self.id_field, self.geom_field] + self.field_names
+        # only the requested columns are read from the geopackage
+        field_names = [c for c in columns if c in self.field_names]
+        with self._query(field_names,
+                         geometry=self.geom_field in columns) as result:
+            read_geom = self.geom_field in columns
+            rows = [self._ogr_feat_to_row(feat, field_names=field_names,
+                                          read_geom=read_geom,
+                                          id=result.feature_id(feat))
+                    for feat in result]
         df = pd.DataFrame.from_records(rows, columns=columns)
         return df
 
@@ -788,49 +1830,53 @@ class GeopackageTable(Table):
             if isinstance(v, (np.integer, np.float64, float)):
                 return np.isnan(v)
             return v is None
-        self._layer.StartTransaction()
-        for i, df_row in dataframe.iterrows():
-            items = df_row.to_dict()
-            if 'geom' in items and isnan(items['geom']):
-                items['geom'] = None
-            # no pkeys: take id field directly
-            pk = items.pop(self.id_field, None)
-            # if pkeys are given, find id of matching feature
-            if pkeys:
-                pk = None
-                filter_args = dict([(k, items[k]) for k in pkeys])
-                l_nan = [isnan(p) for p in filter_args.values()]
-                # no key should be nan or None
-                if sum(l_nan) == 0:
-                    prev_where = self.where
-                    prev_filters = self._filters.copy()
-                    self.filter(**filter_args)
-                    if len(self) == 1:
-                        pk = self[0][self.id_field]
-                    if len(self) > 1:
-                        self.where = prev_where
-                        raise ValueError('more than one feature is matching '
-                                         f'{filter_args}')
-                    self.where = prev_where
-                    self._filters = prev_filters
-
-            if not isnan(pk):
-                success = self.set(int(pk), **items)
-                if not success:
-                    items[self.id_field] = pk
+        with self.workspace.transaction():
+            for i, df_row in dataframe.iterrows():
+                items = df_row.to_dict()
+                if 'geom' in items and isnan(items['geom']):
+                    items['geom'] = None
+                # no pkeys: take id field directly
+                pk = items.pop(self.id_field, None)
+                # if pkeys are given, find id of matching feature
+                if pkeys:
+                    pk = None
+                    filter_args = dict([(k, items[k]) for k in pkeys])
+                    l_nan = [isnan(p) for p in filter_args.values()]
+                    # no key should be nan or None
+                    if sum(l_nan) == 0:
+                        # filter is compiled only once for all rows
+                        with self._additional_filters(**filter_args):
+                            ids = self._ids()
+                        if len(ids) > 1:
+                            raise ValueError('more than one feature is matching '
+                                             f'{filter_args}')
+                        if len(ids) == 1:
+                            pk = ids[0]
+
+                if not isnan(pk):
+                    success = self.set(int(pk), **items)
+                    if not success:
+                        items[self.id_field] = pk
+                        self.add(**items)
+                else:
                     self.add(**items)
-            else:
-                self.add(**items)
-        self._layer.CommitTransaction()
 
     def __len__(self) -> int:
-        count = self._layer.GetFeatureCount(force=True)
+        if self._spatial_filter:
+            # spatial filters are evaluated by ogr only
+            with self._query([], geometry=False) as result:
+                count = result.layer.GetFeatureCount(force=True)
+        else:
+            with self._query(select='count(*)') as result:
+                feat = next(result, None)
+                count = feat.GetField(0) if feat else 0
         return 0 if count < 0 else count
 
     def __repr__(self):
         return f'GeopackageTable {self.name} {self._layer}'
 
 
+
 class Geopackage(Database):
     '''
     manages the connection to geopackage files in a specific folder (base path)
@@ -993,6 +2039,15 @@ class Geopackage(Database):
                       f.endswith('.gpkg')]
         return workspaces
 
+    def checkpoint(self):
+        '''
+        write the pending content of the WAL files of all open geopackages in
+        the base path back into the geopackage files, e.g. before copying them
+        '''
+        for name in self.workspaces:
+            GeopackageConnections.checkpoint(
+                GeopackageWorkspace._fn(self, name))
+
     def __repr__(self):
         return f"Geopackage {self.base_path}"
 
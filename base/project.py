@@ -36,6 +36,9 @@ from .database import Field, Table, FeatureCollection, Workspace
 from .geopackage import Geopackage
 from .layers import Layer, TileLayer
 
+# ioctl request cloning the content of a file (copy-on-write, Linux)
+FICLONE = 0x40049409
+
 if sys.platform in ['win32', 'win64']:
     p = os.getenv('LOCALAPPDATA')
 # Mac OS and Linux
@@ -66,7 +69,8 @@ DEFAULT_SETTINGS = {
         'n_threads': 2,
         'jython_jar_file': DEFAULT_JYTHON_PATH,
         'java': JAVA_DEFAULT,
-        'josm_jar_file': DEFAULT_JOSM_JAR
+        'josm_jar_file': DEFAULT_JOSM_JAR,
+        'osmium': ''
     }
 }
 
@@ -306,6 +310,37 @@ class Project:
         return f'Project {self.name}'
 
 
+def clone_file(src: str, dst: str) -> bool:
+    '''
+    copy a file as a reflink sharing the data blocks with the source until
+    one of them is modified (copy-on-write), falls back to a regular copy if
+    the file system doesn't support reflinks
+
+    Parameters
+    ----------
+    src : str
+        path to the file to copy
+    dst : str
+        path to copy the file to
+
+    Returns
+    -------
+    bool
+        True if the file was reflinked, False if it was copied
+    '''
+    if sys.platform.startswith('linux'):
+        try:
+            import fcntl
+            with open(src, 'rb') as s, open(dst, 'wb') as d:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            shutil.copystat(src, dst)
+            return True
+        except (ImportError, OSError):
+            pass
+    shutil.copy2(src, dst)
+    return False
+
+
 class ProjectManager(metaclass=Singleton):
     '''
     singleton for accessing/changing projects and their data
@@ -361,6 +396,32 @@ class ProjectManager(metaclass=Singleton):
             os.mkdir(target_folder)
         return project
 
+    def clone_project(self, project: Project, name: str) -> Project:
+        '''
+        clone a project, the files are reflinked where the file system
+        supports it, so that only the data changed in one of the projects
+        afterwards takes up additional disk space
+
+        Parameters
+        ----------
+        project : Project
+            the project to clone
+        name : str
+            name of the new project
+
+        Returns
+        -------
+        Project
+            the cloned project
+        '''
+        cloned_project = self.create_project(name, create_folder=False)
+        # the copies have to contain everything written so far
+        project.data.checkpoint()
+        shutil.copytree(project.path, cloned_project.path,
+                        copy_function=clone_file,
+                        ignore=shutil.ignore_patterns('*-shm'))
+        return cloned_project
+
     def remove_project(self, project: Union[Project, str]):
         '''
         remove a project physically
@@ -87,6 +87,593 @@ class Point(object):
         else:
             return Point(x, y, id=self.id, epsg=target_srid)
 
+
+class PolygonIndex(object):
+    '''
+    index of polygons to locate many points at once. The polygons are
+    iterated, the points are handled as arrays per polygon: the candidates
+    are taken from the points sorted by x within the bounding box of the
+    polygon, they are tested against all edges of the polygon at once
+    (crossing number). Only the points on or next to the boundary are tested
+    with the prepared geometry of the polygon
+
+    Attributes
+    ----------
+    ids : np.ndarray
+        ids of the indexed polygons
+    '''
+    # maximum number of point-edge combinations computed at once
+    chunk_size = 2 ** 22
+    # points closer to the boundary are tested with the prepared geometries
+    tolerance = 1e-6
+
+    def __init__(self, geometries: List[QgsGeometry], ids: List[int] = None):
+        '''
+        Parameters
+        ----------
+        geometries : list
+            polygon geometries to index, empty geometries are skipped
+        ids : list, optional
+            ids of the polygons, defaults to the positions in the list of
+            geometries
+        '''
+        geometries = list(geometries)
+        self.ids = (np.arange(len(geometries)) if ids is None
+                    else np.array(ids, dtype=np.int64))
+        # min. x, min. y, max. x, max. y of the polygons, nan if empty
+        self._bounds = np.full((len(geometries), 4), np.nan)
+        self._edges = [None] * len(geometries)
+        self._engines = [None] * len(geometries)
+        for i, geom in enumerate(geometries):
+            if geom is None or geom.isEmpty():
+                continue
+            if geom.constGet().hasCurvedSegments():
+                geom = QgsGeometry(geom.constGet().segmentize())
+            bbox = geom.boundingBox()
+            self._bounds[i] = (bbox.xMinimum(), bbox.yMinimum(),
+                               bbox.xMaximum(), bbox.yMaximum())
+            self._edges[i] = self._polygon_edges(geom)
+            engine = QgsGeometry.createGeometryEngine(geom.constGet())
+            engine.prepareGeometry()
+            self._engines[i] = engine
+        self._indexed = np.nonzero(~np.isnan(self._bounds[:, 0]))[0]
+
+    @staticmethod
+    def _polygon_edges(geom: QgsGeometry) -> np.ndarray:
+        '''
+        edges of all rings of a (multi)polygon as rows of start x, start y,
+        end x and end y
+        '''
+        polygons = (geom.asMultiPolygon() if geom.isMultipart()
+                    else [geom.asPolygon()])
+        edges = []
+        for polygon in polygons:
+            for ring in polygon:
+                xy = np.array([(p.x(), p.y()) for p in ring], dtype=np.float64)
+                if len(xy) > 1:
+                    edges.append(np.column_stack([xy[:-1], xy[1:]]))
+        if not edges:
+            return np.empty((0, 4))
+        return np.concatenate(edges)
+
+    def _chunks(self, i: int, n: int):
+        '''
+        slices of n points to compute with the edges of polygon i at once
+        '''
+        rows = max(1, self.chunk_size // max(len(self._edges[i]), 1))
+        for start in range(0, n, rows):
+            yield slice(start, start + rows)
+
+    def _edge_distances(self, i: int, x: np.ndarray, y: np.ndarray
+                        ) -> np.ndarray:
+        '''
+        distances of the points to the boundary of polygon i
+        '''
+        x1, y1, x2, y2 = self._edges[i].T
+        dx, dy = x2 - x1, y2 - y1
+        length2 = dx ** 2 + dy ** 2
+        length2[length2 == 0] = 1
+        distances = np.empty(len(x))
+        for chunk in self._chunks(i, len(x)):
+            px = x[chunk, np.newaxis]
+            py = y[chunk, np.newaxis]
+            # position of the closest point on the edges
+            t = np.clip(((px - x1) * dx + (py - y1) * dy) / length2, 0, 1)
+            distances[chunk] = np.sqrt(
+                (x1 + t * dx - px) ** 2 + (y1 + t * dy - py) ** 2).min(axis=1)
+        return distances
+
+    def _inside(self, i: int, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        '''
+        check which points are within (or on the boundary of) polygon i
+        '''
+        x1, y1, x2, y2 = self._edges[i].T
+        inside = np.zeros(len(x), dtype=bool)
+        for chunk in self._chunks(i, len(x)):
+            px = x[chunk, np.newaxis]
+            py = y[chunk, np.newaxis]
+            crossing = (y1 > py) != (y2 > py)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x_cross = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+            inside[chunk] = (crossing & (px < x_cross)).sum(axis=1) % 2 == 1
+        # the crossing number is not reliable on the boundary
+        close = np.nonzero(
+            self._edge_distances(i, x, y) <= self.tolerance)[0]
+        engine = self._engines[i]
+        for j in close:
+            inside[j] = engine.intersects(QgsPoint(float(x[j]), float(y[j])))
+        return inside
+
+    def _positions(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        '''
+        positions of the first indexed polygons intersecting the points,
+        -1 for points outside of all polygons
+        '''
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        positions = np.full(len(x), -1, dtype=np.int64)
+        valid = np.nonzero(~(np.isnan(x) | np.isnan(y)))[0]
+        order = valid[np.argsort(x[valid], kind='stable')]
+        sorted_x = x[order]
+        for i in self._indexed:
+            x_min, y_min, x_max, y_max = self._bounds[i]
+            start = np.searchsorted(sorted_x, x_min, side='left')
+            end = np.searchsorted(sorted_x, x_max, side='right')
+            candidates = order[start:end]
+            candidates = candidates[(y[candidates] >= y_min) &
+                                    (y[candidates] <= y_max) &
+                                    (positions[candidates] < 0)]
+            if len(candidates) == 0:
+                continue
+            inside = self._inside(i, x[candidates], y[candidates])
+            positions[candidates[inside]] = i
+        return positions
+
+    def contains(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        '''
+        check which points are within (or on the boundary of) any polygon
+
+        Parameters
+        ----------
+        x : np.ndarray
+            x coordinates of the points
+        y : np.ndarray
+            y coordinates of the points
+
+        Returns
+        -------
+        np.ndarray
+            booleans, True for the points within a polygon
+        '''
+        return self._positions(x, y) >= 0
+
+    def locate(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        '''
+        find the polygons the points are in (if the polygons overlap, the
+        first one in order of the indexed geometries is taken)
+
+        Parameters
+        ----------
+        x : np.ndarray
+            x coordinates of the points
+        y : np.ndarray
+            y coordinates of the points
+
+        Returns
+        -------
+        np.ndarray
+            ids of the polygons the points are in, -1 for points outside of
+            all polygons
+        '''
+        positions = self._positions(x, y)
+        located = np.full(len(positions), -1, dtype=np.int64)
+        found = positions >= 0
+        located[found] = self.ids[positions[found]]
+        return located
+
+    def nearest(self, x: np.ndarray, y: np.ndarray,
+                max_distance: float = 0) -> np.ndarray:
+        '''
+        find the nearest polygons to the points, points within polygons are
+        located directly. For the remaining ones only the polygons whose
+        bounding boxes are closer than the farthest corner of the closest
+        bounding box are measured (if the distances are equal, the first one
+        in order of the indexed geometries is taken)
+
+        Parameters
+        ----------
+        x : np.ndarray
+            x coordinates of the points
+        y : np.ndarray
+            y coordinates of the points
+        max_distance : float, optional
+            maximum distance between point and polygon, defaults to no
+            maximum distance
+
+        Returns
+        -------
+        np.ndarray
+            ids of the nearest polygons, -1 for points without polygon within
+            the maximum distance
+        '''
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        positions = self._positions(x, y)
+        rest = np.nonzero((positions < 0) & ~(np.isnan(x) | np.isnan(y)))[0]
+        indexed = self._indexed
+        if len(rest) and len(indexed):
+            x_min, y_min, x_max, y_max = self._bounds[indexed].T
+            points, polygons = [], []
+            rows = max(1, self.chunk_size // len(indexed))
+            for start in range(0, len(rest), rows):
+                px = x[rest[start:start + rows], np.newaxis]
+                py = y[rest[start:start + rows], np.newaxis]
+                box_distances = np.hypot(
+                    np.maximum(np.maximum(x_min - px, px - x_max), 0),
+                    np.maximum(np.maximum(y_min - py, py - y_max), 0))
+                # every polygon is at least as close as the farthest corner
+                # of its bounding box
+                upper = np.hypot(
+                    np.maximum(np.abs(px - x_min), np.abs(px - x_max)),
+                    np.maximum(np.abs(py - y_min), np.abs(py - y_max))
+                ).min(axis=1, keepdims=True)
+                candidates = box_distances <= upper
+                if max_distance:
+                    candidates &= box_distances <= max_distance
+                p, g = np.nonzero(candidates)
+                points.append(p + start)
+                polygons.append(g)
+            points = np.concatenate(points)
+            polygons = indexed[np.concatenate(polygons)]
+            order = np.argsort(polygons, kind='stable')
+            points, polygons = points[order], polygons[order]
+            bounds = np.searchsorted(polygons, indexed, side='right')
+            best = np.full(len(rest), np.nextafter(max_distance, np.inf)
+                           if max_distance else np.inf)
+            start = 0
+            for i, end in zip(indexed, bounds):
+                candidates = points[start:end]
+                start = end
+                if len(candidates) == 0:
+                    continue
+                pts = rest[candidates]
+                distances = self._edge_distances(i, x[pts], y[pts])
+                closer = distances < best[candidates]
+                best[candidates[closer]] = distances[closer]
+                positions[pts[closer]] = i
+        nearest = np.full(len(positions), -1, dtype=np.int64)
+        found = positions >= 0
+        nearest[found] = self.ids[positions[found]]
+        return nearest
+
+
+class PointSet(object):
+    '''
+    set of points held once as a contiguous float64 array for vectorised
+    distance queries, radius queries use a grid index built lazily with the
+    radius as cell size
+
+    Attributes
+    ----------
+    coords : np.ndarray
+        coordinates of the points (one row per point, x, y (, z) columns)
+    '''
+    # maximum number of distances computed at once by nearest()
+    chunk_size = 2 ** 22
+    # maximum number of grid cells per axis
+    MAX_CELLS = 2 ** 30
+    # offsets of a grid cell and its neighbours
+    NEIGHBOURS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+    def __init__(self, points: Union[List[tuple], List[Point], np.ndarray]):
+        '''
+        Parameters
+        ----------
+        points : list or np.ndarray
+            x, y (, z) coordinates of the points as tuples, Points or array
+        '''
+        self.coords = self._to_array(points)
+        self._grid_index = None
+
+    @staticmethod
+    def _to_array(points) -> np.ndarray:
+        if isinstance(points, PointSet):
+            return points.coords
+        if isinstance(points, Point):
+            points = [points]
+        if not isinstance(points, np.ndarray):
+            points = [(p.x, p.y) if isinstance(p, Point) else p
+                      for p in points]
+        coords = np.array(points, dtype=np.float64)
+        if coords.ndim == 1:
+            coords = coords.reshape(1, -1) if coords.size else \
+                coords.reshape(0, 2)
+        return np.ascontiguousarray(coords)
+
+    def __len__(self) -> int:
+        return len(self.coords)
+
+    def distances(self, point: Union[tuple, Point]) -> np.ndarray:
+        '''
+        distances between the given point and all points in the set
+        '''
+        point = self._to_array(point)[0]
+        return np.sqrt(((self.coords - point) ** 2).sum(axis=1))
+
+    def nearest(self, points: Union[List[tuple], np.ndarray], k: int = 1
+                ) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        the k nearest points in the set for each of the given points
+
+        Parameters
+        ----------
+        points : list or np.ndarray
+            x, y (, z) coordinates of the points to query (or a single point)
+        k : int, optional
+            number of nearest points to return per point, defaults to 1
+
+        Returns
+        -------
+        tuple
+            distances and indices of the nearest points in the set, each
+            array with one row per queried point and k columns (ordered by
+            distance)
+        '''
+        query = self._to_array(points)
+        n = len(self.coords)
+        k = min(k, n)
+        distances = np.empty((len(query), k))
+        indices = np.empty((len(query), k), dtype=np.int64)
+        if k == 0:
+            return distances, indices
+        rows = max(1, self.chunk_size // n)
+        for start in range(0, len(query), rows):
+            chunk = query[start:start + rows]
+            dist = np.sqrt(((chunk[:, np.newaxis, :] -
+                             self.coords[np.newaxis, :, :]) ** 2).sum(axis=2))
+            if k < n:
+                idx = np.argpartition(dist, k - 1, axis=1)[:, :k]
+            else:
+                idx = np.tile(np.arange(n), (len(chunk), 1))
+            dist = np.take_along_axis(dist, idx, axis=1)
+            order = np.argsort(dist, axis=1, kind='stable')
+            distances[start:start + rows] = np.take_along_axis(dist, order, 1)
+            indices[start:start + rows] = np.take_along_axis(idx, order, 1)
+        return distances, indices
+
+    def _grid(self, cell_size: float) -> tuple:
+        '''
+        grid index of the points with given cell size (cached for the last
+        requested cell size). The cells are enlarged if there would be more
+        than MAX_CELLS cells per axis, so that the cell keys fit into int64
+        (larger cells still contain all points in range, only more
+        candidates are tested)
+        '''
+        if self._grid_index is None or self._grid_index[0] != cell_size:
+            origin = self.coords[:, :2].min(axis=0)
+            extent = float((self.coords[:, :2].max(axis=0) - origin).max())
+            size = max(cell_size, extent / self.MAX_CELLS)
+            cells = np.floor((self.coords[:, :2] - origin) /
+                             size).astype(np.int64)
+            shape = cells.max(axis=0) + 1
+            keys = np.ravel_multi_index((cells[:, 0], cells[:, 1]), shape)
+            order = np.argsort(keys, kind='stable')
+            cell_keys, starts, counts = np.unique(
+                keys[order], return_index=True, return_counts=True)
+            self._grid_index = (cell_size, size, origin, shape, cells, order,
+                                cell_keys, starts, counts)
+        return self._grid_index
+
+    def _cells(self, coords: np.ndarray, cell_size: float) -> np.ndarray:
+        '''
+        cells of the grid with given cell size the coordinates are in, cells
+        outside of the grid are clipped to the ones next to it
+        '''
+        _, size, origin, shape = self._grid(cell_size)[:4]
+        cells = np.floor((coords[:, :2] - origin) / size)
+        # far away points would overflow when casting
+        return np.clip(cells, -2, shape + 1).astype(np.int64)
+
+    def _candidates(self, cells: np.ndarray, cell_size: float
+                    ) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        all combinations of the given grid cells and the points in the
+        cell or its neighbouring cells
+
+        Returns
+        -------
+        tuple
+            indices of the cells and indices of the points
+        '''
+        (_, _, _, shape, _, order,
+         cell_keys, starts, counts) = self._grid(cell_size)
+        queries, points = [], []
+        for dx, dy in self.NEIGHBOURS:
+            tx = cells[:, 0] + dx
+            ty = cells[:, 1] + dy
+            valid = (tx >= 0) & (tx < shape[0]) & (ty >= 0) & (ty < shape[1])
+            query = np.nonzero(valid)[0]
+            target = np.ravel_multi_index((tx[valid], ty[valid]), shape)
+            pos = np.minimum(np.searchsorted(cell_keys, target),
+                             len(cell_keys) - 1)
+            found = cell_keys[pos] == target
+            query, pos = query[found], pos[found]
+            sizes = counts[pos]
+            total = sizes.sum()
+            if total == 0:
+                continue
+            offset = np.arange(total) - np.repeat(np.cumsum(sizes) - sizes,
+                                                  sizes)
+            queries.append(np.repeat(query, sizes))
+            points.append(order[np.repeat(starts[pos], sizes) + offset])
+        if not queries:
+            return (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        return np.concatenate(queries), np.concatenate(points)
+
+    def within(self, points: Union[List[tuple], np.ndarray], radius: float
+               ) -> List[np.ndarray]:
+        '''
+        the points in the set within a radius around each of the given points
+
+        Parameters
+        ----------
+        points : list or np.ndarray
+            x, y (, z) coordinates of the center points (or a single point)
+        radius : float
+            radius of the circles
+
+        Returns
+        -------
+        list
+            sorted indices of the points in the set within the radius, one
+            array per center point
+        '''
+        query = self._to_array(points)
+        if len(self.coords) == 0 or radius < 0:
+            return [np.empty(0, dtype=np.int64) for q in query]
+        # any cell size works for identical points (radius 0)
+        cell_size = radius or 1.0
+        q, p = self._candidates(self._cells(query, cell_size), cell_size)
+        dist2 = ((query[q] - self.coords[p]) ** 2).sum(axis=1)
+        within = dist2 <= radius ** 2
+        q, p = q[within], p[within]
+        order = np.lexsort((p, q))
+        q, p = q[order], p[order]
+        bounds = np.searchsorted(q, np.arange(1, len(query)))
+        return np.split(p, bounds)
+
+    def pairs_within(self, radius: float) -> np.ndarray:
+        '''
+        all pairs of points in the set within given distance of each other
+
+        Parameters
+        ----------
+        radius : float
+            maximum distance between two points of a pair
+
+        Returns
+        -------
+        np.ndarray
+            indices of the points forming pairs (2d array, lower index first,
+            sorted)
+        '''
+        if len(self.coords) < 2 or radius < 0:
+            return np.empty((0, 2), dtype=np.int64)
+        cell_size = radius or 1.0
+        cells = self._grid(cell_size)[4]
+        i, j = self._candidates(cells, cell_size)
+        lower = i < j
+        i, j = i[lower], j[lower]
+        dist2 = ((self.coords[i] - self.coords[j]) ** 2).sum(axis=1)
+        within = dist2 <= radius ** 2
+        pairs = np.column_stack([i[within], j[within]])
+        return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+    def collapse(self, tolerance: float, groups: np.ndarray = None
+                 ) -> np.ndarray:
+        '''
+        collapse points within a tolerance of each other, a point is
+        represented by the first preceding point in range that represents
+        itself, so all points are within the tolerance of their
+        representative
+
+        Parameters
+        ----------
+        tolerance : float
+            maximum distance of a point to its representative, only identical
+            points are collapsed if 0
+        groups : np.ndarray, optional
+            group of each point, only points of the same group are collapsed,
+            defaults to collapsing points regardless of their group
+
+        Returns
+        -------
+        np.ndarray
+            index of the representative of each point
+        '''
+        n = len(self.coords)
+        if n == 0:
+            return np.empty(0, dtype=np.int64)
+        if tolerance <= 0:
+            keys = self.coords if groups is None else np.column_stack(
+                [self.coords, groups])
+            first, inverse = np.unique(keys, axis=0, return_index=True,
+                                       return_inverse=True)[1:]
+            return first[inverse.ravel()].astype(np.int64)
+        pairs = self.pairs_within(tolerance)
+        if groups is not None:
+            groups = np.asarray(groups)
+            pairs = pairs[groups[pairs[:, 0]] == groups[pairs[:, 1]]]
+        representatives = np.arange(n, dtype=np.int64)
+        # all pairs of a point with preceding points are visited after the
+        # ones of the preceding points, so their representatives are final
+        for i, j in pairs[np.argsort(pairs[:, 1], kind='stable')]:
+            if representatives[j] == j and representatives[i] == i:
+                representatives[j] = i
+        return representatives
+
+
+def point_coordinates(geometries: List[QgsGeometry]
+                      ) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    coordinates of point geometries as arrays, the first point is taken from
+    multipoints
+
+    Parameters
+    ----------
+    geometries : list
+        point geometries
+
+    Returns
+    -------
+    tuple
+        arrays of x and y coordinates, nan for empty geometries
+    '''
+    coords = np.full((len(geometries), 2), np.nan)
+    for i, geom in enumerate(geometries):
+        if geom is None or geom.isEmpty():
+            continue
+        vertex = geom.vertexAt(0)
+        coords[i] = vertex.x(), vertex.y()
+    return coords[:, 0], coords[:, 1]
+
+def transform_coordinates(x: np.ndarray, y: np.ndarray, source_epsg: int,
+                          target_epsg: int = 4326
+                          ) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    transform coordinates into a different projection in one call
+
+    Parameters
+    ----------
+    x : np.ndarray
+        x coordinates (longitudes if geographic)
+    y : np.ndarray
+        y coordinates (latitudes if geographic)
+    source_epsg : int
+        epsg code of projection the coordinates are in
+    target_epsg : int, optional
+        epsg code of projection to transform to, defaults to 4326
+
+    Returns
+    -------
+    tuple
+        arrays of transformed x and y coordinates
+    '''
+    source = osr.SpatialReference()
+    source.ImportFromEPSG(int(source_epsg))
+    target = osr.SpatialReference()
+    target.ImportFromEPSG(int(target_epsg))
+    # x/y resp. lon/lat order independent of the axis order of the definition
+    if hasattr(osr, 'OAMS_TRADITIONAL_GIS_ORDER'):
+        for srs in (source, target):
+            srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    if len(x) == 0:
+        return np.array([]), np.array([])
+    ct = osr.CoordinateTransformation(source, target)
+    points = np.column_stack([x, y]).astype(float).tolist()
+    transformed = np.array(ct.TransformPoints(points))
+    return transformed[:, 0], transformed[:, 1]
+
 def clip_raster(raster_file: str, bbox: Tuple[Point, Point]) -> Tuple[str, int]:
     '''
     clip a raster file with given bbox
@@ -253,136 +840,3 @@ def intersect(input_features: Union[List[Feature], FeatureCollection],
     ret = [{i: f.attribute(f.fieldNameIndex(i)) for i in ret_fields}
            for f in output_layer.getFeatures()]
     return ret
-
-def closest_point(point: Tuple[float, float], points: List[Tuple[float, float]]
-                  ) -> Tuple[int, Tuple[float, float]]:
-    '''
-    get the point out of given points that is closest to the given point,
-    points have to be passed as tuples of x, y (z optional) coordinates
-
-    Parameters
-    ----------
-    point : tuple
-        x, y (, z) coordinates of point
-    points : list of tuples
-        x, y (, z) coordinates of points to pick closest one to point from
-
-    Returns
-    -------
-    point : tuple
-        index of closest point in points and x, y coordinates of closest point
-    '''
-    distances = _get_distances(point, points)
-    closest_idx = distances.argmin()
-    return closest_idx, tuple(points[closest_idx])
-
-def points_within(center_point: Union[tuple, Point],
-                  points: Union[List[tuple], List[Point]], radius: float
-                  ) -> Tuple[np.ndarray, np.ndarray]:
-    '''
-    get the points within a radius around a given center_point,
-    points have to be passed as tuples of x, y (z optional) coordinates
-
-    Parameters
-    ----------
-    center_point : tuple or Point
-        x, y (, z) coordinates of center-point of circle
-    points : list of tuples or list of Points
-        x, y (, z) coordinates of points
-    radius : float
-        radius of circle,
-        metric depends on projection of points (e.g. meter if Gauss-Krueger)
-
-    Returns
-    -------
-    points : list of tuples
-        array of x, y coordinates of points within radius and array of booleans
-        indicating if coordinates are within given radius
-    '''
-    distances = _get_distances(center_point, points)
-    is_within = distances <= radius
-    return np.array(points)[is_within], is_within
-
-def _get_distances(point: Union[tuple, Point],
-                   points: Union[List[tuple], List[Point]]) -> np.ndarray:
-    '''
-    get distances between point and each point in list of points
-    '''
-    points = [np.array(p) for p in points]
-    diff = np.array(points) - np.array(point)
-    distances = np.apply_along_axis(np.linalg.norm, 1, diff)
-    return distances
-
-def minimal_bounding_poly(geometries: List[QgsGeometry]) -> QgsGeometry:
-    '''
-    find minimal bounding polygon covering all given geometries
-
-    Parameters
-    ----------
-    geometries : list
-        list of geometries
-
-    Returns
-    -------
-    QgsGeometry
-        minimal bounding polygon
-    '''
-    hulls = []
-    for geom in geometries:
-        if geom.isMultipart():
-            for part in geom.asGeometryCollection():
-                hulls.append(part.convexHull())
-        else:
-            hulls.append(geom.convexHull())
-
-    multi_poly = hulls[0]
-    for hull in hulls[1:]:
-        multi_poly = multi_poly.combine(hull)
-    return multi_poly
-
-def remove_duplicates(features: Union[List[Feature], FeatureCollection],
-                      match_field: str = '', distance: float = 100) -> int:
-    '''
-    remove point features from database if other features are within given distance
-
-    Parameters
-    ----------
-    features : list or QgsFeatureIterator
-        features to remove duplicates from
-    distance : float, optional
-        only delete duplicate feature if it is within this range,
-        metric depends on projection of features, defaults to 100
-    match_field : str, optional
-        only delete features in range if those have same value in this field,
-        defaults to delete all in range
-
-    Returns
-    -------
-    int
-        number of removed duplicates
-    '''
-    add = match_field or 'id'
-    all_r = [(f.id, (f.geom.asPoint().x(), f.geom.asPoint().y()),
-              getattr(f, add)) for f in features]
-    if len(all_r) == 0:
-        return 0
-    ids, points, mfs = zip(*all_r)
-    ids = np.array(ids)
-    points = np.array(points)
-    mfs = np.array(mfs)
-    n_duplicates = 0
-    for feature in features:
-        point = feature.geom.asPoint()
-        p_within, indices = points_within((point.x(), point.y()), points,
-                                          distance)
-        sub_ids = ids[indices]
-        sub_mfs = mfs[indices]
-        for p, pid, pmf in zip(p_within, sub_ids, sub_mfs):
-            if feature.id == pid:
-                continue
-            if match_field and getattr(feature, add) != pmf:
-                continue
-            feature.delete()
-            n_duplicates += 1
-            break
-    return n_duplicates
\ No newline at end of file
@@ -0,0 +1,164 @@
+'''
+validation and repair of geometries in a pool of processes, the geometries
+are passed as WKB in chunks. Only ogr is used here (no qgis), so that the
+processes can be spawned outside of the QGIS application
+'''
+
+import os
+import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Tuple
+from osgeo import ogr
+
+# validation states of geometries
+VALID = 0
+REPAIRED = 1
+BROKEN = 2
+EMPTY = 3
+
+
+def validate_wkb(wkb: bytes) -> Tuple[int, bytes]:
+    '''
+    validate a geometry and repair it if it is not valid
+
+    Parameters
+    ----------
+    wkb : bytes
+        geometry as well known binary, empty bytes for empty geometries
+
+    Returns
+    -------
+    tuple
+        validation state and the (repaired) geometry as WKB, None if broken
+    '''
+    if not wkb:
+        return EMPTY, wkb
+    geom = ogr.CreateGeometryFromWkb(wkb)
+    if geom is None:
+        return BROKEN, None
+    if geom.IsEmpty():
+        return EMPTY, wkb
+    if geom.IsValid():
+        return VALID, wkb
+    try:
+        geom = geom.MakeValid()
+    except Exception:
+        geom = None
+    if geom is None or not geom.IsValid():
+        return BROKEN, None
+    return REPAIRED, bytes(geom.ExportToWkb())
+
+
+def _validate_chunk(wkbs: List[bytes]) -> List[Tuple[int, bytes]]:
+    return [validate_wkb(wkb) for wkb in wkbs]
+
+
+def _python_executable() -> str:
+    '''
+    python interpreter to spawn the processes with (inside QGIS the
+    executable of the process is QGIS itself), None if not found
+    '''
+    executable = sys.executable or ''
+    if os.path.basename(executable).lower().startswith('python'):
+        return executable
+    if sys.platform in ['win32', 'win64']:
+        names = ['pythonw.exe', 'python.exe']
+    else:
+        names = [f'python{sys.version_info.major}.{sys.version_info.minor}',
+                 f'python{sys.version_info.major}']
+    for folder in [sys.exec_prefix, os.path.join(sys.exec_prefix, 'bin')]:
+        for name in names:
+            path = os.path.join(folder, name)
+            if os.path.isfile(path):
+                return path
+    return None
+
+
+class GeometryValidator:
+    '''
+    validates and repairs geometries in a pool of processes, the pool is
+    started with the first batch large enough to be worth distributing and
+    kept until the validator is closed. Falls back to validating in the
+    calling process if no pool can be started
+
+    Attributes
+    ----------
+    processes : int
+        number of processes
+    chunk_size : int
+        number of geometries validated by a process at once
+    '''
+    def __init__(self, processes: int = None, chunk_size: int = 100):
+        '''
+        Parameters
+        ----------
+        processes : int, optional
+            number of processes, defaults to the number of cores minus one,
+            validation runs in the calling process if 1
+        chunk_size : int, optional
+            number of geometries validated by a process at once, defaults
+            to 100
+        '''
+        if processes is None:
+            processes = max((os.cpu_count() or 1) - 1, 1)
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self._executor = None
+        self._failed = processes <= 1
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None and not self._failed:
+            executable = _python_executable()
+            if not executable:
+                self._failed = True
+                return None
+            context = multiprocessing.get_context('spawn')
+            context.set_executable(executable)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.processes, mp_context=context)
+        return self._executor
+
+    def validate(self, wkbs: List[bytes]) -> List[Tuple[int, bytes]]:
+        '''
+        validate and repair geometries, the order is preserved
+
+        Parameters
+        ----------
+        wkbs : list
+            geometries as well known binary, empty bytes for empty geometries
+
+        Returns
+        -------
+        list
+            validation state and (repaired) geometry as WKB per geometry
+        '''
+        if len(wkbs) >= 2 * self.chunk_size:
+            executor = self._get_executor()
+            if executor:
+                chunks = [wkbs[i:i + self.chunk_size]
+                          for i in range(0, len(wkbs), self.chunk_size)]
+                try:
+                    results = []
+                    for chunk in executor.map(_validate_chunk, chunks):
+                        results.extend(chunk)
+                    return results
+                except (OSError, BrokenProcessPool):
+                    self._failed = True
+                    self.close()
+        return _validate_chunk(wkbs)
+
+    def close(self):
+        '''
+        shut down the pool of processes
+        '''
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,5 +1,7 @@
 from qgis.PyQt.QtCore import pyqtSignal, QObject, QThread
 
+from .geopackage import GeopackageConnections
+
 
 class Worker(QThread):
     '''
@@ -52,6 +54,9 @@ class Worker(QThread):
                 on_success()
         except Exception as e:
             self.error.emit(str(e))
+        finally:
+            # the read connections opened by this thread are of no use anymore
+            GeopackageConnections.release_thread()
 
     def work(self) -> object:
         '''
@@ -4,6 +4,8 @@ from shutil import move
 from argparse import ArgumentParser
 from subprocess import call
 
+from osm_data import PROFILES, prepare_router_data, write_profile
+
 OTP_JAR='/opt/OpenTripPlanner/otp-ggr-stable.jar'
 
 def main():
@@ -21,9 +23,37 @@ def main():
                         help="folder with graphs",
                         dest="graph_folder", required=True)
 
+    parser.add_argument("--memory", "-m", action="store", type=int,
+                        help="max. heap of the JVM in GB",
+                        dest="memory", default=2)
+
+    parser.add_argument("--bbox", "-b", action="store",
+                        help="clip the pbf data to minlon,minlat,maxlon,maxlat"
+                        " with osmium before building the graph",
+                        dest="bbox")
+
+    parser.add_argument("--profile", "-p", action="store",
+                        choices=list(PROFILES), default="standard",
+                        help="build profile, walk drops the ways not usable "
+                        "by pedestrians and the transit feeds",
+                        dest="profile")
+
+    parser.add_argument("--osmium", action="store",
+                        help="osmium executable", dest="osmium",
+                        default="osmium")
+
     args = parser.parse_args()
 
-    call(['java', '-Xmx2G', '-jar', OTP_JAR, '--build', args.folder])
+    # the data is prepared the same way as by the plugin, the original data
+    # is kept in the source folder of the data folder
+    bbox = None
+    if args.bbox:
+        bbox = [float(c) for c in args.bbox.split(',')]
+    metadata = prepare_router_data(args.folder, osmium=args.osmium,
+                                   bbox=bbox, profile=args.profile)
+
+    call(['java', '-Xmx{}G'.format(args.memory), '-jar', OTP_JAR,
+          '--build', args.folder])
 
     graph_file = os.path.join(args.folder, "Graph.obj")
     target_folder = os.path.join(args.graph_folder, args.name)
@@ -35,6 +65,7 @@ def main():
         print("overwriting old file...")
     move(graph_file, dst_file)
     print("Graph moved to " + dst_file)
+    write_profile(target_folder, metadata)
 
 if __name__ == "__main__":
     main()
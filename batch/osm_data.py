@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+'''
+preparation of the OpenStreetMap data the OTP routers are built from, shared
+by the plugin and the batch script building routers. The original data of a
+router is moved into its source folder on the first preparation and is
+clipped with osmium to an extent and/or stripped of the ways not usable by
+pedestrians into the router folder the graph is built from. The profile a
+router was built with is stored next to its graph
+'''
+
+import os
+import json
+import shutil
+import datetime
+import subprocess
+from collections import OrderedDict
+from typing import List, Tuple
+
+# folder in the router the original data (OSM data and transit feeds) is
+# kept in, the graph is built only from the data in the router folder itself
+SOURCE_FOLDER = 'source'
+# file in the router the metadata of the profile of the graph is stored in
+PROFILE_FILE = 'profile.json'
+# build profiles of the routers and their labels
+PROFILES = OrderedDict([
+    ('standard', 'Standard (alle Wege und ÖPNV)'),
+    ('walk', 'Fußverkehr (nur begehbare Wege, ohne ÖPNV)'),
+])
+# filter expressions (osmium tags-filter, a way matching any of them is
+# removed) of the ways not usable by pedestrians. Trunk roads are often
+# walkable (sidewalks, rural roads), they are only removed if pedestrians are
+# excluded explicitly or by being a motorroad ("Kraftfahrstraße")
+NON_PEDESTRIAN_WAYS = [
+    'w/highway=motorway,motorway_link,construction,proposed,raceway,'
+    'bus_guideway',
+    'w/foot=no',
+    'w/motorroad=yes',
+]
+
+
+def source_files(router_path: str, extension: str = '.pbf') -> List[str]:
+    '''
+    the original input files of a router with the given extension (.pbf for
+    OSM data, .zip for transit feeds), the ones kept in the source folder if
+    the data was prepared before, otherwise the ones in the router folder
+    '''
+    source_folder = os.path.join(router_path, SOURCE_FOLDER)
+    folder = source_folder if os.path.isdir(source_folder) else router_path
+    return sorted(os.path.join(folder, fn) for fn in os.listdir(folder)
+                  if fn.endswith(extension))
+
+
+def osm_commands(osmium: str, source: str, target: str,
+                 bbox: Tuple[float, float, float, float] = None,
+                 pedestrian_only: bool = False) -> List[List[str]]:
+    '''
+    calls of osmium clipping an OSM file to an extent and/or removing the
+    ways not usable by pedestrians
+
+    Parameters
+    ----------
+    osmium : str
+        path to the osmium executable
+    source : str
+        path to the OSM file to prepare
+    target : str
+        path to write the prepared file to
+    bbox : tuple, optional
+        min. longitude, min. latitude, max. longitude, max. latitude to clip
+        the data to, defaults to no clipping
+    pedestrian_only : bool, optional
+        remove the ways not usable by pedestrians, defaults to keeping all
+        ways
+
+    Returns
+    -------
+    list
+        the command line arguments of the calls in order
+    '''
+    commands = []
+    if bbox is not None:
+        extent = ','.join(repr(float(c)) for c in bbox)
+        clipped = f'{target}.clipped.pbf' if pedestrian_only else target
+        commands.append([osmium, 'extract', '--bbox', extent, '--overwrite',
+                         '-o', clipped, source])
+        source = clipped
+    if pedestrian_only:
+        commands.append([osmium, 'tags-filter', '--invert-match',
+                         '--overwrite', '-o', target, source] +
+                        NON_PEDESTRIAN_WAYS)
+    return commands
+
+
+def prepare_router_data(router_path: str, osmium: str = '',
+                        bbox: Tuple[float, float, float, float] = None,
+                        profile: str = 'standard', log: object = print
+                        ) -> dict:
+    '''
+    prepare the data a router is built from, the original data is moved into
+    the source folder of the router on the first preparation and is the
+    source of all following ones. Without clipping and with the standard
+    profile the original data is restored
+
+    Parameters
+    ----------
+    router_path : str
+        folder of the router
+    osmium : str, optional
+        path to the osmium executable, only needed if the data is clipped or
+        filtered
+    bbox : tuple, optional
+        min. longitude, min. latitude, max. longitude, max. latitude to clip
+        the OSM data to, defaults to no clipping
+    profile : str, optional
+        build profile of the router ('standard' or 'walk'), defaults to
+        'standard'
+    log : function, optional
+        function to log messages with
+
+    Returns
+    -------
+    dict
+        metadata of the profile (to be stored with write_profile after the
+        graph was built successfully)
+    '''
+    if profile not in PROFILES:
+        raise ValueError(f'unknown profile {profile}')
+    pedestrian_only = profile == 'walk'
+    if bbox is None and not pedestrian_only:
+        restore_router_data(router_path)
+        return profile_metadata(router_path, profile)
+
+    if not osmium:
+        raise FileNotFoundError('Osmium wurde nicht gefunden. Bitte geben '
+                                'Sie den Pfad zu Osmium an.')
+    sources = source_files(router_path)
+    if not sources:
+        raise FileNotFoundError(
+            f'Keine OSM-Daten (.pbf) im Router {router_path} gefunden')
+    feeds = source_files(router_path, extension='.zip')
+    source_folder = os.path.join(router_path, SOURCE_FOLDER)
+    if not os.path.isdir(source_folder):
+        os.makedirs(source_folder)
+        for fn in sources + feeds:
+            shutil.move(fn, os.path.join(source_folder, os.path.basename(fn)))
+        sources = source_files(router_path)
+        feeds = source_files(router_path, extension='.zip')
+
+    for source in sources:
+        target = os.path.join(router_path, os.path.basename(source))
+        try:
+            for cmd in osm_commands(osmium, source, target, bbox=bbox,
+                                    pedestrian_only=pedestrian_only):
+                log(subprocess.list2cmdline(cmd))
+                process = subprocess.run(
+                    cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                    universal_newlines=True, errors='replace')
+                if process.returncode != 0:
+                    raise RuntimeError(f'Osmium ist mit dem Fehlercode '
+                                       f'{process.returncode} abgebrochen: '
+                                       f'{process.stdout}')
+        finally:
+            # the intermediate file would be read when building the graph
+            tmp_file = f'{target}.clipped.pbf'
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+        size_before = os.path.getsize(source) / 1024 ** 2
+        size_after = os.path.getsize(target) / 1024 ** 2
+        log(f'{os.path.basename(source)}: {size_before:.1f} MB auf '
+            f'{size_after:.1f} MB verkleinert')
+
+    for feed in feeds:
+        target = os.path.join(router_path, os.path.basename(feed))
+        if pedestrian_only:
+            if os.path.exists(target):
+                os.remove(target)
+            log(f'ÖPNV-Daten {os.path.basename(feed)} werden nicht '
+                'übernommen')
+        else:
+            shutil.copyfile(feed, target)
+    return profile_metadata(router_path, profile, bbox=bbox)
+
+
+def restore_router_data(router_path: str):
+    '''
+    replace the prepared data of a router with the original data
+    '''
+    source_folder = os.path.join(router_path, SOURCE_FOLDER)
+    if not os.path.isdir(source_folder):
+        return
+    for source in (source_files(router_path) +
+                   source_files(router_path, extension='.zip')):
+        target = os.path.join(router_path, os.path.basename(source))
+        if os.path.exists(target):
+            os.remove(target)
+        shutil.move(source, target)
+    shutil.rmtree(source_folder)
+
+
+def profile_metadata(router_path: str, profile: str,
+                     bbox: Tuple[float, float, float, float] = None) -> dict:
+    '''
+    metadata of the profile of a router built from its current data
+    '''
+    files = sorted(os.listdir(router_path))
+    return {
+        'profile': profile,
+        'label': PROFILES[profile],
+        'bbox': [float(c) for c in bbox] if bbox is not None else None,
+        'osm_files': [fn for fn in files if fn.endswith('.pbf')],
+        'transit_feeds': [fn for fn in files if fn.endswith('.zip')],
+    }
+
+
+def write_profile(router_path: str, metadata: dict):
+    '''
+    store the metadata of the profile next to the graph of a router, call
+    after the graph was built successfully
+    '''
+    metadata = dict(metadata)
+    metadata['built'] = datetime.datetime.now().isoformat(timespec='seconds')
+    with open(os.path.join(router_path, PROFILE_FILE), 'w',
+              encoding='utf-8') as f:
+        json.dump(metadata, f, indent=4, ensure_ascii=False)
@@ -13,45 +13,16 @@ from argparse import ArgumentParser
 from datetime import datetime, timedelta
 import sys
 
-if __name__ == '__main__':
-    parser = ArgumentParser(description="Batch Analysis with OpenTripPlanner")
 
-    parser.add_argument('--origins', action="store",
-                        help="csv file containing the origin points " +
-                        "with at least lat/lon and id",
-                        dest="origins", required=True)
-
-    parser.add_argument('--destinations', action="store",
-                        help="csv file containing the destination points " +
-                        "with at least lat/lon and id",
-                        dest="destinations", required=True)
-
-    parser.add_argument('--config', action="store",
-                        help="xml file containing the configuration for trip " +
-                        "planning (for xml-structure see Config.setting_struct)",
-                        dest="config_file", required=True)
-
-    parser.add_argument('--target', action="store",
-                        help="target csv file the results will be written to " +
-                        "(overwrites existing file)",
-                        dest="target", default="otp_results.csv")
-
-    parser.add_argument('--nlines', action="store",
-                        help="determines how often progress in processing " +
-                        "origins/destination is written to stdout " +
-                        "(write every n results)",
-                        dest="nlines", default=50, type=int)
-
-
-    parser.set_defaults(arriveby=False)
-
-    options = parser.parse_args()
-
-    origins_csv = options.origins
-    destinations_csv = options.destinations
-    target_csv = options.target
-    print_every_n_lines = options.nlines
+def route(config_file, origins_csv, destinations_csv, target_csv,
+          print_every_n_lines=50, evaluations=None):
+    '''
+    route between the origins and destinations with the options in the
+    configuration file and write the results to the target file
 
+    evaluations: already loaded routers by graph path and router name,
+                 loaded routers are added
+    '''
     # read configuration from xml-file
     # unfortunately you can't use lxml in jython (because parts are compiled
     # in c) as in Config (config.py)
@@ -59,7 +30,7 @@ if __name__ == '__main__':
 
     # config.read(options.config_file)
 
-    config = Config(filename=options.config_file)
+    config = Config(filename=config_file)
 
     # router
     router_config = config.settings['router_config']
@@ -158,8 +129,16 @@ if __name__ == '__main__':
     # results belong, flattened later
     results = []
 
-    otpEval = OTPEvaluation(graph_path, router, print_every_n_lines,
-                            calculate_details, smart_search)
+    # the graph of a router is loaded only once per run
+    if evaluations is None:
+        evaluations = {}
+    otpEval = evaluations.get((graph_path, router))
+    if otpEval is None:
+        otpEval = OTPEvaluation(graph_path, router, print_every_n_lines,
+                                calculate_details, smart_search)
+        evaluations[(graph_path, router)] = otpEval
+    else:
+        otpEval.reset(print_every_n_lines, calculate_details, smart_search)
 
     otpEval.setup(max_walk=max_walk,
                   walk_speed=walk_speed,
@@ -191,3 +170,62 @@ if __name__ == '__main__':
     #                       bestof, arrive_by=arrive_by,
     #                       write_dest_data=write_dest_data)
 
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Batch Analysis with OpenTripPlanner")
+
+    parser.add_argument('--origins', action="store",
+                        help="csv file containing the origin points " +
+                        "with at least lat/lon and id",
+                        dest="origins")
+
+    parser.add_argument('--destinations', action="store",
+                        help="csv file containing the destination points " +
+                        "with at least lat/lon and id",
+                        dest="destinations")
+
+    parser.add_argument('--config', action="store",
+                        help="xml file containing the configuration for trip " +
+                        "planning (for xml-structure see Config.setting_struct)",
+                        dest="config_file")
+
+    parser.add_argument('--target', action="store",
+                        help="target csv file the results will be written to " +
+                        "(overwrites existing file)",
+                        dest="target", default="otp_results.csv")
+
+    parser.add_argument('--nlines', action="store",
+                        help="determines how often progress in processing " +
+                        "origins/destination is written to stdout " +
+                        "(write every n results)",
+                        dest="nlines", default=50, type=int)
+
+
+    parser.add_argument('--jobs', action="store",
+                        help="csv file (separated by semicolons) with the " +
+                        "config, origins, destinations and target files " +
+                        "of multiple routings (one routing per line), " +
+                        "each router is loaded only once",
+                        dest="jobs")
+
+    parser.set_defaults(arriveby=False)
+
+    options = parser.parse_args()
+
+    if options.jobs:
+        with open(options.jobs) as f:
+            jobs = [line.strip().split(';') for line in f if line.strip()]
+    elif options.origins and options.destinations and options.config_file:
+        jobs = [(options.config_file, options.origins, options.destinations,
+                 options.target)]
+    else:
+        parser.error('either --jobs or --config, --origins and ' +
+                     '--destinations are required')
+
+    evaluations = {}
+    for i, (config_file, origins_csv, destinations_csv,
+            target_csv) in enumerate(jobs):
+        if len(jobs) > 1:
+            print 'Job {}/{}: {}'.format(i + 1, len(jobs), target_csv)
+        route(config_file, origins_csv, destinations_csv, target_csv,
+              print_every_n_lines=options.nlines, evaluations=evaluations)
@@ -201,6 +201,15 @@ class OTPEvaluation(object):
         self.otp = OtpsEntryPoint.fromArgs([ "--graphs", graph_path, "--router", router])
         router = self.otp.getRouter()
         self.batch_processor = self.otp.createBatchProcessor(router)
+        self.reset(print_every_n_lines=print_every_n_lines,
+                   calculate_details=calculate_details,
+                   smart_search=smart_search)
+
+    def reset(self, print_every_n_lines=50, calculate_details=False, smart_search=False):
+        '''
+        discards the options of the routing request set up so far, the loaded graph is kept
+        (use to evaluate multiple requests with different options in one run)
+        '''
         self.request = self.otp.createBatchRequest()
         self.request.setEvalItineraries(calculate_details)
         # smart search needs details (esp. start/arrival times),
@@ -0,0 +1,24 @@
+import os
+import sys
+import importlib.util
+
+import pytest
+
+# the plugin folder is imported as package "gruenflaechenotp" regardless of
+# the name of the folder it is checked out to
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if 'gruenflaechenotp' not in sys.modules:
+    spec = importlib.util.spec_from_file_location(
+        'gruenflaechenotp', os.path.join(ROOT, '__init__.py'),
+        submodule_search_locations=[ROOT])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['gruenflaechenotp'] = module
+    spec.loader.exec_module(module)
+
+
+@pytest.fixture
+def database(tmp_path):
+    from gruenflaechenotp.base.geopackage import Geopackage
+    database = Geopackage(base_path=str(tmp_path), read_only=False)
+    yield database
+    database.close()
@@ -0,0 +1,173 @@
+import threading
+
+import pytest
+
+from gruenflaechenotp.base.geopackage import GeopackageConnections
+
+
+@pytest.fixture
+def table(database):
+    workspace = database.create_workspace('test')
+    table = workspace.create_table('numbers', {'value': int})
+    table.add_rows({'value': list(range(100))})
+    return table
+
+
+def _in_thread(function, *args):
+    results = []
+    errors = []
+
+    def run():
+        try:
+            results.append(function(*args))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            GeopackageConnections.release_thread()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    if errors:
+        raise errors[0]
+    return results[0]
+
+
+def test_concurrent_reads_with_writer(table):
+    n_threads = 8
+    started = threading.Barrier(n_threads + 1)
+    counts = []
+    errors = []
+
+    def read():
+        try:
+            reader = table.copy()
+            started.wait()
+            for i in range(20):
+                values = reader.values('value')
+                # the readers see complete commits only
+                assert len(values) % 100 == 0
+                counts.append(len(values))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            GeopackageConnections.release_thread()
+
+    threads = [threading.Thread(target=read) for i in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    started.wait()
+    for i in range(5):
+        table.add_rows({'value': list(range(100))})
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(counts) == n_threads * 20
+    assert len(table) == 600
+
+
+def test_read_own_writes(table):
+    with table.workspace.transaction():
+        table.add(value=1000)
+        # uncommitted changes are read from the writer inside of the
+        # transaction
+        assert len(table) == 101
+        assert 1000 in table.values('value')
+    # and from the read connections after committing
+    assert len(table) == 101
+    assert 1000 in table.values('value')
+    assert _in_thread(lambda: len(table.copy())) == 101
+
+
+def test_rollback_is_not_read(table):
+    with pytest.raises(ValueError):
+        with table.workspace.transaction():
+            table.add(value=1000)
+            raise ValueError
+    assert len(table) == 100
+    assert 1000 not in table.values('value')
+
+
+def test_readers_are_released_with_thread(table):
+    path = table.workspace.path
+    conns = []
+
+    def read():
+        conns.append(GeopackageConnections.reader(path))
+        return len(table.copy())
+
+    _in_thread(read)
+    _in_thread(read)
+    # the connection of a finished thread is never handed out again
+    assert conns[0] is not conns[1]
+    readers = [conn for _, _, conn in GeopackageConnections._readers.values()]
+    assert not any(r is conn for r in readers for conn in conns)
+
+
+def test_readers_of_dead_threads_are_closed(table):
+    path = table.workspace.path
+    thread = threading.Thread(
+        target=lambda: GeopackageConnections.reader(path))
+    thread.start()
+    thread.join()
+    assert any(t is thread for _, t, _ in
+               GeopackageConnections._readers.values())
+    # opening a connection closes the ones of ended threads
+    _in_thread(lambda: GeopackageConnections.reader(path))
+    assert not any(t is thread for _, t, _ in
+                   GeopackageConnections._readers.values())
+
+
+def _points_table(database, name, epsg):
+    workspace = database.create_workspace(name)
+    table = workspace.create_table('points', {'name': str},
+                                   geometry_type='Point', epsg=epsg)
+    return table
+
+
+def test_copy_rows_from_template(database):
+    template = _points_table(database, 'template', 25833)
+    template.add_rows({'name': ['a', 'b'],
+                       'geom': ['POINT (391000 5820000)',
+                                'POINT (392000 5821000)']})
+    table = _points_table(database, 'project', 25833)
+    assert table.copy_rows_from(template.workspace.path) == 2
+    rows = sorted((r['name'], r['geom'].asPoint().x()) for r in table)
+    assert rows == [('a', 391000), ('b', 392000)]
+    table.spatial_filter('POLYGON ((391500 5820500, 392500 5820500, '
+                         '392500 5821500, 391500 5821500, 391500 5820500))')
+    assert [r['name'] for r in table] == ['b']
+
+
+def test_copy_rows_from_template_with_other_srs(database):
+    from osgeo import ogr, osr
+    template = _points_table(database, 'template', 4326)
+    template.add_rows({'name': ['a'], 'geom': ['POINT (13.4 52.5)']})
+    table = _points_table(database, 'project', 25833)
+    ids = [r['fid'] for r in template]
+    assert table.copy_rows_from(template.workspace.path) == 1
+
+    source = osr.SpatialReference()
+    source.ImportFromEPSG(4326)
+    target = osr.SpatialReference()
+    target.ImportFromEPSG(25833)
+    if hasattr(osr, 'OAMS_TRADITIONAL_GIS_ORDER'):
+        for srs in (source, target):
+            srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    expected = ogr.CreateGeometryFromWkt('POINT (13.4 52.5)')
+    expected.Transform(osr.CoordinateTransformation(source, target))
+
+    rows = list(table)
+    assert [r['fid'] for r in rows] == ids
+    assert rows[0]['name'] == 'a'
+    point = rows[0]['geom'].asPoint()
+    assert point.x() == pytest.approx(expected.GetX())
+    assert point.y() == pytest.approx(expected.GetY())
+
+
+def test_copy_rows_from_in_transaction(database):
+    template = _points_table(database, 'template', 25833)
+    table = _points_table(database, 'project', 25833)
+    with pytest.raises(RuntimeError):
+        with table.workspace.transaction():
+            table.copy_rows_from(template.workspace.path)
@@ -16,6 +16,7 @@ XML_FILTER = u'XML-Dateien (*.xml)'
 CSV_FILTER = u'Comma-seperated values (*.csv)'
 JAR_FILTER = u'Java Archive (*.jar)'
 ALL_FILE_FILTER = u'Java Executable (java.*)'
+OSMIUM_FILTER = u'Osmium Executable (osmium*)'
 
 INFO_FORM_CLASS, _ = uic.loadUiType(os.path.join(
     settings.BASE_PATH, 'ui', 'info.ui'))
@@ -250,6 +251,74 @@ class NewRouterDialog(Dialog):
         return False, None
 
 
+class BuildRouterDialog(Dialog):
+    '''
+    dialog for choosing the profile of a router and whether its OSM data is
+    clipped to the area of the active project before building it
+    '''
+    def __init__(self, profiles=None, osmium_available=True, clipped=False,
+                 default_profile='walk', **kwargs):
+        self.profiles = profiles or {}
+        self.default_profile = default_profile
+        self.osmium_available = osmium_available
+        self.clipped = clipped
+        super().__init__(**kwargs)
+
+    def setupUi(self):
+        self.setMinimumSize(500, 150)
+        self.setWindowTitle('Router bauen')
+
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addWidget(QtWidgets.QLabel('Profil des Routers'))
+        self.profile_combo = QtWidgets.QComboBox()
+        for profile, label in self.profiles.items():
+            self.profile_combo.addItem(label, profile)
+        # all profiles but the standard one filter the OSM data
+        self.profile_combo.setEnabled(self.osmium_available)
+        if self.osmium_available:
+            self.profile_combo.setCurrentIndex(
+                max(self.profile_combo.findData(self.default_profile), 0))
+        layout.addWidget(self.profile_combo)
+        self.clip_check = QtWidgets.QCheckBox(
+            'OSM-Daten auf das Projektgebiet inkl. Puffer und max. '
+            'Laufdistanz zuschneiden')
+        self.clip_check.setChecked(self.osmium_available)
+        self.clip_check.setEnabled(self.osmium_available)
+        layout.addWidget(self.clip_check)
+
+        status_text = ''
+        if not self.osmium_available:
+            status_text = ('Osmium wurde nicht gefunden, der Router wird aus '
+                           'den vollständigen OSM-Daten gebaut. Der Pfad zu '
+                           'Osmium kann in den Einstellungen angegeben '
+                           'werden.')
+        elif self.clipped:
+            status_text = ('Die OSM-Daten des Routers wurden bereits '
+                           'zugeschnitten. Sie werden erneut aus den '
+                           'Originaldaten zugeschnitten bzw. ohne '
+                           'Zuschnitt wiederhergestellt.')
+        self.status_label = QtWidgets.QLabel(status_text)
+        self.status_label.setWordWrap(True)
+        layout.addWidget(self.status_label)
+
+        buttons = QtWidgets.QDialogButtonBox(
+            QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel,
+            QtCore.Qt.Horizontal, self)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def show(self):
+        '''
+        show dialog and return selections made by user
+        '''
+        confirmed = self.exec_()
+        if confirmed:
+            return (confirmed, self.clip_check.isChecked(),
+                    self.profile_combo.currentData())
+        return False, False, None
+
+
 class ImportLayerDialog(Dialog):
 
     def __init__(self, title='Layer importieren',
@@ -513,6 +582,7 @@ class SettingsDialog(Dialog):
                                      'Projektverzeichnis wählen'))
         self.josm_jar_browse_button.clicked.connect(
             lambda: self.browse_jar(self.josm_jar_edit, 'JOSM JAR wählen'))
+        self.osmium_browse_button.clicked.connect(self.browse_osmium)
         self.java_browse_button.clicked.connect(self.browse_java)
         self.search_java_button.clicked.connect(self.auto_java)
         self.reset_button.clicked.connect(self.reset)
@@ -526,6 +596,7 @@ class SettingsDialog(Dialog):
         self.jython_edit.setText(settings.system['jython_jar_file'])
         self.otp_jar_edit.setText(settings.system['otp_jar_file'])
         self.josm_jar_edit.setText(settings.system['josm_jar_file'])
+        self.osmium_edit.setText(settings.system['osmium'])
         self.cpu_edit.setValue(settings.system['n_threads'])
         self.memory_edit.setValue(settings.system['reserved'])
 
@@ -537,6 +608,7 @@ class SettingsDialog(Dialog):
         settings.system['jython_jar_file'] = self.jython_edit.text()
         settings.system['otp_jar_file'] = self.otp_jar_edit.text()
         settings.system['josm_jar_file'] = self.josm_jar_edit.text()
+        settings.system['osmium'] = self.osmium_edit.text()
         settings.system['n_threads'] = self.cpu_edit.value()
         settings.system['reserved'] = self.memory_edit.value()
 
@@ -606,6 +678,14 @@ class SettingsDialog(Dialog):
             return
         self.java_edit.setText(java_file)
 
+    def browse_osmium(self):
+        osmium_file = browse_file(self.osmium_edit.text(),
+                                  'Osmium wählen', OSMIUM_FILTER,
+                                  save=False, parent=self)
+        if not osmium_file:
+            return
+        self.osmium_edit.setText(osmium_file)
+
     def browse_jar(self, edit, text):
         jar_file = browse_file(edit.text(),
                                text, JAR_FILTER,
@@ -0,0 +1,320 @@
+'''
+persisted walking distances between the entrances of the green spaces and
+the addresses as sparse matrix, stored as numpy arrays in the project (rows
+by entrance and columns by address) and read memory-mapped, so that
+queries and analyses do not have to read the results of the routing again
+'''
+
+import os
+import json
+import shutil
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+# folder in the project the distance matrix is stored in
+DISTANCES_FOLDER = 'distances'
+# file in the matrix folder the results file the matrix was built from is
+# described in
+SOURCE_FILE = 'source.json'
+
+
+def _compress(keys: np.ndarray, values: np.ndarray, distances: np.ndarray
+              ) -> dict:
+    '''
+    compressed sparse representation of the pairs grouped by the keys, the
+    values of each group are ordered
+    '''
+    order = np.lexsort((values, keys))
+    keys = keys[order]
+    ids, starts = np.unique(keys, return_index=True)
+    indptr = np.append(starts, len(keys)).astype(np.int64)
+    return {'ids': ids, 'indptr': indptr, 'values': values[order],
+            'distances': distances[order]}
+
+
+def _nearest(keys: np.ndarray, distances: np.ndarray
+             ) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    smallest distance per key
+    '''
+    order = np.lexsort((distances, keys))
+    keys, distances = keys[order], distances[order]
+    ids, first = np.unique(keys, return_index=True)
+    return ids, distances[first]
+
+
+class DistanceMatrix:
+    '''
+    sparse matrix of the walking distances between the entrances of the green
+    spaces (rows) and the addresses (columns), stored compressed by rows
+    (CSR) and by columns (CSC) and read memory-mapped
+
+    Attributes
+    ----------
+    folder : str
+        the folder the matrix is stored in
+    '''
+    # names of the stored arrays
+    _arrays = ['csr_ids', 'csr_indptr', 'csr_values', 'csr_distances',
+               'csc_ids', 'csc_indptr', 'csc_values', 'csc_distances',
+               'entrance_green', 'green_ids', 'green_indptr',
+               'green_entrances']
+
+    def __init__(self, folder: str):
+        '''
+        Parameters
+        ----------
+        folder : str
+            the folder the matrix is stored in
+
+        Raises
+        ------
+        FileNotFoundError
+            no distance matrix stored in the folder
+        '''
+        self.folder = folder
+        for name in self._arrays:
+            fn = os.path.join(folder, f'{name}.npy')
+            if not os.path.exists(fn):
+                raise FileNotFoundError(f'{fn} not found')
+            setattr(self, name, np.load(fn, mmap_mode='r'))
+
+    @staticmethod
+    def project_folder(project) -> str:
+        '''
+        folder the distance matrix of a project is stored in
+        '''
+        return os.path.join(project.path, DISTANCES_FOLDER)
+
+    @staticmethod
+    def _describe(results_file: str) -> dict:
+        return {'file': os.path.abspath(results_file),
+                'mtime': os.path.getmtime(results_file),
+                'size': os.path.getsize(results_file)}
+
+    @classmethod
+    def built_from(cls, folder: str, results_file: str
+                   ) -> 'DistanceMatrix':
+        '''
+        the matrix stored in the folder if it was built from the given
+        results of a routing and the results did not change since
+
+        Parameters
+        ----------
+        folder : str
+            the folder the matrix is stored in
+        results_file : str
+            path to the results of the routing
+
+        Returns
+        -------
+        DistanceMatrix
+            the stored matrix, None if it was built from other results or if
+            there is no matrix
+        '''
+        fn = os.path.join(folder, SOURCE_FILE)
+        if not os.path.exists(fn) or not os.path.exists(results_file):
+            return None
+        try:
+            with open(fn) as f:
+                source = json.load(f)
+            if source != cls._describe(results_file):
+                return None
+            return cls(folder)
+        except (ValueError, OSError):
+            return None
+
+    @classmethod
+    def build(cls, folder: str, entrances: np.ndarray,
+              addresses: np.ndarray, distances: np.ndarray,
+              entrance_green: pd.Series, results_file: str = None
+              ) -> 'DistanceMatrix':
+        '''
+        store the routed distances as distance matrix, an existing matrix in
+        the folder is replaced
+
+        Parameters
+        ----------
+        folder : str
+            the folder to store the matrix in
+        entrances : np.ndarray
+            ids of the entrances of the routed pairs
+        addresses : np.ndarray
+            ids of the addresses of the routed pairs
+        distances : np.ndarray
+            walking distances of the routed pairs in meters
+        entrance_green : pd.Series
+            ids of the green spaces indexed by the ids of their entrances
+        results_file : str, optional
+            path to the results of the routing the distances were read from,
+            the matrix is read instead of them as long as they don't change
+
+        Returns
+        -------
+        DistanceMatrix
+            the stored matrix
+        '''
+        entrances = np.asarray(entrances, dtype=np.int64)
+        addresses = np.asarray(addresses, dtype=np.int64)
+        # the analyses get the same results with the stored distances as with
+        # the routed ones
+        distances = np.asarray(distances, dtype=np.float64)
+        arrays = {}
+        for prefix, compressed in [
+            ('csr', _compress(entrances, addresses, distances)),
+            ('csc', _compress(addresses, entrances, distances))]:
+            for name, values in compressed.items():
+                arrays[f'{prefix}_{name}'] = values
+        greens = entrance_green.reindex(arrays['csr_ids']).fillna(-1).values
+        greens = greens.astype(np.int64)
+        arrays['entrance_green'] = greens
+        order = np.argsort(greens, kind='stable')
+        green_ids, starts = np.unique(greens[order], return_index=True)
+        assigned = green_ids >= 0
+        arrays['green_ids'] = green_ids[assigned]
+        arrays['green_indptr'] = np.append(
+            starts, len(greens)).astype(np.int64)[
+                np.append(assigned, True)]
+        # positions of the entrances in the rows grouped by green space
+        arrays['green_entrances'] = order.astype(np.int64)
+
+        # written into a new folder first, the matrix is replaced only if
+        # it was written completely
+        tmp_folder = f'{folder}.tmp'
+        if os.path.exists(tmp_folder):
+            shutil.rmtree(tmp_folder)
+        os.makedirs(tmp_folder)
+        for name, values in arrays.items():
+            np.save(os.path.join(tmp_folder, f'{name}.npy'), values)
+        if results_file:
+            with open(os.path.join(tmp_folder, SOURCE_FILE), 'w') as f:
+                json.dump(cls._describe(results_file), f)
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+        os.rename(tmp_folder, folder)
+        return cls(folder)
+
+    @staticmethod
+    def _find(ids: np.ndarray, key: int) -> int:
+        pos = np.searchsorted(ids, key)
+        if pos >= len(ids) or ids[pos] != key:
+            return -1
+        return pos
+
+    def _rows(self, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        addresses and distances of the rows (entrances) at the positions
+        '''
+        if not len(positions):
+            return (np.zeros(0, dtype=np.int64),
+                    np.zeros(0, dtype=np.float64))
+        slices = [slice(self.csr_indptr[p], self.csr_indptr[p + 1])
+                  for p in positions]
+        return (np.concatenate([self.csr_values[s] for s in slices]),
+                np.concatenate([self.csr_distances[s] for s in slices]))
+
+    def from_entrance(self, entrance_id: int, max_distance: float = None
+                      ) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        addresses reachable from an entrance
+
+        Parameters
+        ----------
+        entrance_id : int
+            id of the entrance
+        max_distance : float, optional
+            max. walking distance in meters, defaults to all routed addresses
+
+        Returns
+        -------
+        tuple
+            ids of the addresses and the walking distances
+        '''
+        pos = self._find(self.csr_ids, entrance_id)
+        addresses, distances = self._rows([pos] if pos >= 0 else [])
+        if max_distance is not None:
+            in_reach = distances <= max_distance
+            addresses, distances = addresses[in_reach], distances[in_reach]
+        return addresses, distances
+
+    def addresses_of_green(self, green_id: int, max_distance: float = None
+                           ) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        addresses reachable from any entrance of a green space
+
+        Parameters
+        ----------
+        green_id : int
+            id of the green space
+        max_distance : float, optional
+            max. walking distance in meters, defaults to all routed addresses
+
+        Returns
+        -------
+        tuple
+            ids of the addresses and the walking distances to the nearest
+            entrance of the green space
+        '''
+        pos = self._find(self.green_ids, green_id)
+        if pos < 0:
+            entrances = []
+        else:
+            entrances = self.green_entrances[
+                self.green_indptr[pos]:self.green_indptr[pos + 1]]
+        addresses, distances = self._rows(entrances)
+        if max_distance is not None:
+            in_reach = distances <= max_distance
+            addresses, distances = addresses[in_reach], distances[in_reach]
+        return _nearest(addresses, distances)
+
+    def greens_of_address(self, address_id: int, max_distance: float = None
+                          ) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        green spaces reachable from an address
+
+        Parameters
+        ----------
+        address_id : int
+            id of the address
+        max_distance : float, optional
+            max. walking distance in meters, defaults to all routed green
+            spaces
+
+        Returns
+        -------
+        tuple
+            ids of the green spaces and the walking distances to their
+            nearest entrances
+        '''
+        pos = self._find(self.csc_ids, address_id)
+        if pos < 0:
+            return (np.zeros(0, dtype=np.int64),
+                    np.zeros(0, dtype=np.float64))
+        s = slice(self.csc_indptr[pos], self.csc_indptr[pos + 1])
+        entrances = np.asarray(self.csc_values[s])
+        distances = np.asarray(self.csc_distances[s])
+        greens = self.entrance_green[np.searchsorted(self.csr_ids,
+                                                     entrances)]
+        valid = greens >= 0
+        if max_distance is not None:
+            valid &= distances <= max_distance
+        return _nearest(greens[valid], distances[valid])
+
+    def pairs(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''
+        all stored pairs
+
+        Returns
+        -------
+        tuple
+            ids of the entrances, ids of the addresses and the walking
+            distances
+        '''
+        counts = np.diff(self.csr_indptr)
+        return (np.repeat(self.csr_ids, counts), np.asarray(self.csr_values),
+                np.asarray(self.csr_distances, dtype=np.float64))
+
+    def __len__(self) -> int:
+        return len(self.csr_values)
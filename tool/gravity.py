@@ -0,0 +1,435 @@
+'''
+gravity model of the usage of green spaces evaluated on the walking
+distances between the entrances of the green spaces and the addresses,
+the distances are held in memory as arrays so that the model can be
+evaluated for multiple parameters without routing again
+'''
+
+import itertools
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# max. number of values per array while evaluating multiple parameter sets,
+# larger parameter grids are evaluated in chunks. About ten float64 arrays of
+# this size are alive at once (~160 MB)
+MAX_CHUNK_VALUES = 2000000
+
+
+def read_routing_results(results_file: str
+                         ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    read the results of the batch routing
+
+    Returns
+    -------
+    tuple
+        ids of the entrances, ids of the addresses and the walking distances
+        in meters
+    '''
+    # for some reason pandas automatically replaces underscores in header
+    # with spaces, no possibility to turn that off
+    df_routing = pd.read_csv(
+        results_file, delimiter=';',
+        usecols=['origin id', 'destination id', 'walk/bike distance (m)'])
+    return (df_routing['origin id'].values,
+            df_routing['destination id'].values,
+            df_routing['walk/bike distance (m)'].values.astype(float))
+
+
+def _fan_out(keys: np.ndarray, points: pd.Series
+             ) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    all points represented by the given keys (ids of representative points)
+
+    Returns
+    -------
+    tuple
+        position of the key of each represented point and the ids of the
+        represented points
+    '''
+    order = np.argsort(points.values, kind='stable')
+    representatives, starts, counts = np.unique(
+        points.values[order], return_index=True, return_counts=True)
+    if not len(representatives):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    pos = np.minimum(np.searchsorted(representatives, keys),
+                     len(representatives) - 1)
+    n_points = np.where(representatives[pos] == keys, counts[pos], 0)
+    key_idx = np.repeat(np.arange(len(keys)), n_points)
+    offsets = np.arange(n_points.sum()) - np.repeat(
+        np.cumsum(n_points) - n_points, n_points)
+    ids = points.index.values[order][np.repeat(starts[pos], n_points) +
+                                     offsets]
+    return key_idx, ids
+
+
+def expand_pairs(entrances: np.ndarray, addresses: np.ndarray,
+                 distances: np.ndarray, entrance_points: pd.Series = None,
+                 address_points: pd.Series = None
+                 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    fan the pairs routed between representative points out to the points
+    they represent, the represented points get the distances of their
+    representatives
+
+    Parameters
+    ----------
+    entrances : np.ndarray
+        ids of the entrances of the routed pairs
+    addresses : np.ndarray
+        ids of the addresses of the routed pairs
+    distances : np.ndarray
+        walking distances of the routed pairs in meters
+    entrance_points : pd.Series, optional
+        ids of the routed entrances indexed by the ids of the entrances they
+        represent, defaults to entrances routed as they are
+    address_points : pd.Series, optional
+        ids of the routed addresses indexed by the ids of the addresses they
+        represent, defaults to addresses routed as they are
+
+    Returns
+    -------
+    tuple
+        ids of the entrances, ids of the addresses and the walking distances
+    '''
+    if entrance_points is not None:
+        idx, entrances = _fan_out(entrances, entrance_points)
+        addresses, distances = addresses[idx], distances[idx]
+    if address_points is not None:
+        idx, addresses = _fan_out(addresses, address_points)
+        entrances, distances = entrances[idx], distances[idx]
+    return entrances, addresses, distances
+
+
+def _group_sum(values: np.ndarray, groups: np.ndarray, n_groups: int
+               ) -> np.ndarray:
+    '''
+    sums of the values (2d, parameter sets x pairs) per group of the pairs
+    with a single bincount over all parameter sets
+    '''
+    n_sets = values.shape[0]
+    offsets = (np.arange(n_sets) * n_groups)[:, np.newaxis]
+    sums = np.bincount((groups[np.newaxis, :] + offsets).ravel(),
+                       weights=values.ravel(), minlength=n_sets * n_groups)
+    return sums.reshape(n_sets, n_groups)
+
+
+def _group_index(groups: np.ndarray, n_groups: int
+                 ) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    positions of the pairs ordered by group and the start of each group in
+    this order
+    '''
+    order = np.argsort(groups, kind='stable')
+    starts = np.searchsorted(groups[order], np.arange(n_groups + 1))
+    return order, starts
+
+
+def _members(index: Tuple[np.ndarray, np.ndarray], groups: np.ndarray
+             ) -> np.ndarray:
+    '''
+    positions of all pairs belonging to the given groups
+    '''
+    order, starts = index
+    begin = starts[groups]
+    lengths = starts[groups + 1] - begin
+    if not lengths.sum():
+        return np.zeros(0, dtype=np.int64)
+    ends = np.cumsum(lengths)
+    offsets = np.repeat(begin - (ends - lengths), lengths)
+    return order[offsets + np.arange(ends[-1])]
+
+
+class GravityModel:
+    '''
+    gravity model of the green space usage, the visit probability of a
+    green space from an address is its area weighted by the exponential decay
+    of the walking distance relative to the ones of all green spaces in reach
+
+    The model can be fitted to a single set of parameters, the fitted state
+    (attractivity sums per address, visits per green space and results per
+    address) is updated locally if the areas of green spaces change
+
+    Attributes
+    ----------
+    address_ids : np.ndarray
+        ids of the addresses
+    green_ids : np.ndarray
+        ids of the green spaces
+    results : np.ndarray
+        area of green space per inhabitant of the addresses as fitted
+    '''
+    # arrays the state of a fitted model consists of
+    _state = ['address_ids', 'green_ids', 'inhabitants', 'areas', 'entrances',
+              'addr_idx', 'green_idx', 'distances', 'weights',
+              'attractivity_sum', 'total_visits', 'results', 'block_ids',
+              'block_inhabitants', 'addr_block_idx', 'params']
+
+    def __init__(self, entrances: np.ndarray, addresses: np.ndarray,
+                 distances: np.ndarray, entrance_green: pd.Series,
+                 green_areas: pd.Series, address_inhabitants: pd.Series):
+        '''
+        Parameters
+        ----------
+        entrances : np.ndarray
+            ids of the entrances of the routed pairs
+        addresses : np.ndarray
+            ids of the addresses of the routed pairs
+        distances : np.ndarray
+            walking distances of the routed pairs in meters
+        entrance_green : pd.Series
+            ids of the green spaces indexed by the ids of their entrances
+        green_areas : pd.Series
+            areas of the green spaces indexed by their ids, pairs with
+            entrances of green spaces without area are ignored
+        address_inhabitants : pd.Series
+            inhabitants indexed by the ids of the addresses, pairs with
+            addresses not in here are ignored
+        '''
+        self.address_ids = address_inhabitants.index.values
+        self.green_ids = green_areas.index.values
+        self.inhabitants = address_inhabitants.values.astype(float)
+        self.areas = green_areas.values.astype(float)
+
+        addr_idx = pd.Index(self.address_ids).get_indexer(addresses)
+        greens = entrance_green.reindex(entrances).values
+        green_idx = pd.Index(self.green_ids).get_indexer(greens)
+        valid = (addr_idx >= 0) & (green_idx >= 0)
+        valid[valid] &= ~np.isnan(self.areas[green_idx[valid]])
+        self.entrances = np.asarray(entrances)[valid]
+        self.addr_idx = addr_idx[valid]
+        self.green_idx = green_idx[valid]
+        self.distances = np.asarray(distances, dtype=float)[valid]
+        for name in ['weights', 'attractivity_sum', 'total_visits', 'results',
+                     'block_ids', 'block_inhabitants', 'addr_block_idx',
+                     'params']:
+            setattr(self, name, None)
+        self._index()
+
+    def _index(self):
+        '''
+        index the pairs by address and by green space
+        '''
+        self._by_address = _group_index(self.addr_idx, len(self.address_ids))
+        self._by_green = _group_index(self.green_idx, len(self.green_ids))
+
+    def __len__(self) -> int:
+        return len(self.distances)
+
+    def evaluate(self, max_walk_dists: List[float], decays: List[float]
+                 ) -> Tuple[List[Tuple[float, float]], np.ndarray]:
+        '''
+        evaluate the model for all combinations of the given maximum walking
+        distances and decay factors at once
+
+        Parameters
+        ----------
+        max_walk_dists : list
+            maximum walking distances in meters, pairs with longer distances
+            are ignored
+        decays : list
+            factors of the exponential decay of the attractivity with the
+            distance (negative)
+
+        Returns
+        -------
+        tuple
+            the combinations of maximum walking distance and decay factor and
+            the area of green space per inhabitant of the addresses as
+            array (combinations x addresses)
+        '''
+        params = list(itertools.product(max_walk_dists, decays))
+        n_pairs = max(len(self), 1)
+        chunk = max(MAX_CHUNK_VALUES // n_pairs, 1)
+        results = [self._evaluate(params[i:i + chunk])
+                   for i in range(0, len(params), chunk)]
+        return params, np.vstack(results)
+
+    def _evaluate(self, params: List[Tuple[float, float]]) -> np.ndarray:
+        n_addr = len(self.address_ids)
+        n_green = len(self.green_ids)
+        max_dists = np.array([p[0] for p in params],
+                             dtype=float)[:, np.newaxis]
+        decays = np.array([p[1] for p in params], dtype=float)[:, np.newaxis]
+        dist = self.distances[np.newaxis, :]
+        in_reach = dist <= max_dists
+
+        attractivity = np.where(
+            in_reach, np.exp(decays * dist) * self.areas[self.green_idx], 0)
+        attractivity_sum = _group_sum(attractivity, self.addr_idx, n_addr)
+        sums = attractivity_sum[:, self.addr_idx]
+        visit_prob = np.divide(attractivity, sums,
+                               out=np.zeros_like(attractivity),
+                               where=sums > 0)
+        visits = visit_prob * self.inhabitants[self.addr_idx]
+        total_visits = _group_sum(visits, self.green_idx, n_green)
+        totals = total_visits[:, self.green_idx]
+        space_per_visitor = np.divide(
+            np.broadcast_to(self.areas[self.green_idx], totals.shape), totals,
+            out=np.zeros_like(totals), where=totals > 0)
+        return _group_sum(space_per_visitor * visit_prob, self.addr_idx,
+                          n_addr)
+
+    def set_blocks(self, address_blocks: pd.Series,
+                   block_inhabitants: pd.Series):
+        '''
+        set the blocks the addresses are in to aggregate the results to
+
+        Parameters
+        ----------
+        address_blocks : pd.Series
+            ids of the blocks indexed by the ids of the addresses
+        block_inhabitants : pd.Series
+            inhabitants indexed by the ids of the blocks
+        '''
+        self.block_ids = block_inhabitants.index.values
+        self.block_inhabitants = block_inhabitants.values.astype(float)
+        self.addr_block_idx = pd.Index(self.block_ids).get_indexer(
+            address_blocks.reindex(self.address_ids).values)
+
+    def block_results(self, space_per_inhabitant: np.ndarray) -> np.ndarray:
+        '''
+        aggregate the results of the addresses to the blocks (set_blocks has
+        to be called first)
+
+        Parameters
+        ----------
+        space_per_inhabitant : np.ndarray
+            area of green space per inhabitant of the addresses (as returned
+            by evaluate or fit)
+
+        Returns
+        -------
+        np.ndarray
+            the area of green space per inhabitant of the blocks
+            (combinations x blocks, ordered like the block ids)
+        '''
+        valid = self.addr_block_idx >= 0
+        space_used = np.atleast_2d(space_per_inhabitant) * self.inhabitants
+        space_used = _group_sum(space_used[:, valid],
+                                self.addr_block_idx[valid],
+                                len(self.block_ids))
+        inhabitants = self.block_inhabitants
+        return np.divide(space_used, inhabitants,
+                         out=np.zeros_like(space_used),
+                         where=inhabitants > 0)
+
+    def fit(self, max_walk_dist: float, decay: float) -> np.ndarray:
+        '''
+        evaluate the model for a single set of parameters and keep the state
+        to update it on changes of the areas of the green spaces
+
+        Parameters
+        ----------
+        max_walk_dist : float
+            maximum walking distance in meters, pairs with longer distances
+            are ignored
+        decay : float
+            factor of the exponential decay of the attractivity with the
+            distance (negative)
+
+        Returns
+        -------
+        np.ndarray
+            the area of green space per inhabitant of the addresses
+        '''
+        self.params = np.array([max_walk_dist, decay], dtype=float)
+        self.weights = np.where(self.distances <= max_walk_dist,
+                                np.exp(decay * self.distances), 0)
+        self.attractivity_sum = np.bincount(
+            self.addr_idx, weights=self.weights * self.areas[self.green_idx],
+            minlength=len(self.address_ids))
+        visit_prob = self._visit_prob(slice(None))
+        self.total_visits = np.bincount(
+            self.green_idx, weights=visit_prob * self.inhabitants[
+                self.addr_idx], minlength=len(self.green_ids))
+        self.results = np.bincount(
+            self.addr_idx, weights=self._space_per_visitor()[
+                self.green_idx] * visit_prob,
+            minlength=len(self.address_ids))
+        return self.results
+
+    def _visit_prob(self, pairs: np.ndarray) -> np.ndarray:
+        attractivity = (self.weights[pairs] *
+                        self.areas[self.green_idx[pairs]])
+        sums = self.attractivity_sum[self.addr_idx[pairs]]
+        return np.divide(attractivity, sums, out=np.zeros_like(attractivity),
+                         where=sums > 0)
+
+    def _space_per_visitor(self) -> np.ndarray:
+        return np.divide(self.areas, self.total_visits,
+                         out=np.zeros_like(self.areas),
+                         where=self.total_visits > 0)
+
+    def update_areas(self, areas: dict) -> np.ndarray:
+        '''
+        update the fitted state after changes of the areas of green spaces,
+        only the addresses in reach of the green spaces and the ones sharing
+        green spaces with them are reevaluated
+
+        Parameters
+        ----------
+        areas : dict
+            new areas by id of the green spaces, green spaces unknown to the
+            model are ignored
+
+        Returns
+        -------
+        np.ndarray
+            positions of the addresses whose results changed
+        '''
+        greens = pd.Index(self.green_ids).get_indexer(list(areas.keys()))
+        new_areas = np.array([a or 0 for a in areas.values()], dtype=float)
+        known = greens >= 0
+        greens = greens[known]
+        self.areas[greens] = new_areas[known]
+        n_addr = len(self.address_ids)
+        n_green = len(self.green_ids)
+
+        # the attractivity sums of the addresses in reach of the green spaces
+        addresses = np.unique(self.addr_idx[_members(self._by_green, greens)])
+        pairs = _members(self._by_address, addresses)
+        self.attractivity_sum[addresses] = np.bincount(
+            self.addr_idx[pairs], weights=self.weights[pairs] * self.areas[
+                self.green_idx[pairs]], minlength=n_addr)[addresses]
+
+        # the visits of all green spaces in reach of these addresses
+        greens = np.unique(np.concatenate([greens, self.green_idx[pairs]]))
+        pairs = _members(self._by_green, greens)
+        self.total_visits[greens] = np.bincount(
+            self.green_idx[pairs], weights=self._visit_prob(pairs) *
+            self.inhabitants[self.addr_idx[pairs]],
+            minlength=n_green)[greens]
+
+        # the results of all addresses visiting these green spaces
+        addresses = np.unique(self.addr_idx[pairs])
+        pairs = _members(self._by_address, addresses)
+        space_per_visitor = self._space_per_visitor()
+        self.results[addresses] = np.bincount(
+            self.addr_idx[pairs], weights=self._visit_prob(pairs) *
+            space_per_visitor[self.green_idx[pairs]],
+            minlength=n_addr)[addresses]
+        return addresses
+
+    def save(self, filename: str):
+        '''
+        save the fitted model
+        '''
+        state = {name: getattr(self, name) for name in self._state
+                 if getattr(self, name, None) is not None}
+        with open(filename, 'wb') as f:
+            np.savez(f, **state)
+
+    @classmethod
+    def load(cls, filename: str) -> 'GravityModel':
+        '''
+        load a fitted model
+        '''
+        model = cls.__new__(cls)
+        with np.load(filename, allow_pickle=False) as data:
+            for name in cls._state:
+                setattr(model, name, data[name] if name in data else None)
+        model._index()
+        return model
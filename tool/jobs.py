@@ -1,23 +1,51 @@
-import shutil
-from qgis.core import (QgsCoordinateTransform, QgsGeometry, QgsSpatialIndex,
-                       QgsCoordinateReferenceSystem, QgsProject, QgsVectorFileWriter)
+from qgis.core import (QgsCoordinateTransform, QgsGeometry,
+                       QgsCoordinateReferenceSystem, QgsProject,
+                       QgsWkbTypes, QgsPointXY)
 from qgis.PyQt.QtCore import QVariant, QProcess
 import pandas as pd
 import numpy as np
-import processing
 import os
 
 from gruenflaechenotp.base.worker import Worker
 from gruenflaechenotp.base.project import ProjectManager, settings
+from gruenflaechenotp.base.spatial import (PolygonIndex, PointSet,
+                                            point_coordinates,
+                                            transform_coordinates)
+from gruenflaechenotp.base.validation import (GeometryValidator, VALID,
+                                              REPAIRED, EMPTY)
+from gruenflaechenotp.batch.config import LATITUDE_COLUMN, LONGITUDE_COLUMN
+from gruenflaechenotp.tool.gravity import (GravityModel, read_routing_results,
+                                           expand_pairs)
+from gruenflaechenotp.tool.distances import DistanceMatrix
+from gruenflaechenotp.tool.osm import (project_extent, prepare_router_data,
+                                       PROFILES)
 from gruenflaechenotp.tool.tables import (GruenflaechenEingaenge, Projektgebiet,
                                           AdressenProcessed, Baubloecke,
                                           ProjectSettings, Adressen,
                                           ProjektgebietProcessed, Gruenflaechen,
                                           GruenflaechenEingaengeProcessed,
-                                          BaublockErgebnisse, AdressErgebnisse)
+                                          BaublockErgebnisse, AdressErgebnisse,
+                                          AdressSensitivitaet,
+                                          BaublockSensitivitaet,
+                                          BaublockVorschau)
 
-DEBUG = False
 EXPONENTIAL_FACTOR = -0.003
+# blocks whose area of green space per inhabitant in the preview differs by
+# less than this share from the required green space are refined
+PREVIEW_TOLERANCE = 0.2
+
+
+def write_points(filename, id_column, ids, x, y):
+    '''
+    write points in WGS84 (latitude, longitude and id columns as expected
+    by the routing) into a csv file
+    '''
+    lon, lat = transform_coordinates(x, y, settings.EPSG, 4326)
+    lines = [f'{LATITUDE_COLUMN},{LONGITUDE_COLUMN},{id_column}']
+    lines.extend(f'{float(la)!r},{float(lo)!r},{int(i)}'
+                 for la, lo, i in zip(lat, lon, ids))
+    with open(filename, 'w', encoding='utf-8', newline='') as f:
+        f.write('\n'.join(lines) + '\n')
 
 
 class CreateProject(Worker):
@@ -32,18 +60,20 @@ class CreateProject(Worker):
 
     def work(self):
         project = self.project_manager.create_project(self.project_name)
-        if self.prefill:
-            self.log('Kopiere Standarddaten Lichtenbergs in das Projekt...')
-            shutil.copyfile(
-                os.path.join(settings.TEMPLATE_PATH, 'data', 'project.gpkg'),
-                os.path.join(project.path, 'project.gpkg'))
-        else:
-            self.log('Erzeuge leere Tabellen...')
+        self.log('Erzeuge leere Tabellen...')
+        tables = [
             Projektgebiet.get_table(project=project, create=True),
             Baubloecke.get_table(project=project, create=True),
             Gruenflaechen.get_table(project=project, create=True),
             Adressen.get_table(project=project, create=True),
             GruenflaechenEingaenge.get_table(project=project, create=True)
+        ]
+        if self.prefill:
+            self.log('Kopiere Standarddaten Lichtenbergs in das Projekt...')
+            template = os.path.join(settings.TEMPLATE_PATH, 'data',
+                                    'project.gpkg')
+            for table in tables:
+                table.copy_rows_from(template)
         self.log(f'Neues Projekt erfolgreich angelegt unter {project.path}')
         return project
 
@@ -59,16 +89,15 @@ class CloneProject(Worker):
         self.project_manager = ProjectManager()
 
     def work(self):
-        cloned_project = self.project_manager.create_project(
-            self.project_name, create_folder=False)
         self.log('Kopiere Projektordner...')
-
-        # copy template folder
         try:
-            shutil.copytree(self.origin_project.path, cloned_project.path)
+            cloned_project = self.project_manager.clone_project(
+                self.origin_project, self.project_name)
         except Exception as e:
             self.error.emit(str(e))
-            self.project_manager.remove_project(self.project_name)
+            if self.project_name in [p.name for p in
+                                     self.project_manager.projects]:
+                self.project_manager.remove_project(self.project_name)
             return
         self.log('Neues Projekt erfolgreich angelegt '
                  f'unter {cloned_project.path}')
@@ -77,8 +106,12 @@ class CloneProject(Worker):
 
 class ImportLayer(Worker):
     '''
-    worker for importing data into project tables
+    worker for importing data into project tables, the features are imported
+    in batches with one transaction each, the geometries of polygon layers
+    are validated in parallel processes
     '''
+    batch_size = 2000
+
     def __init__(self, table, layer, layer_crs, fields=[], parent=None):
         super().__init__(parent=parent)
         self.layer = layer
@@ -89,7 +122,7 @@ class ImportLayer(Worker):
     def work(self):
         self.log('Lösche vorhandene Features...')
         self.table.delete_rows()
-        self.set_progress(30)
+        self.set_progress(5)
 
         tr = QgsCoordinateTransform(
             self.layer_crs,
@@ -98,44 +131,32 @@ class ImportLayer(Worker):
         )
 
         self.log('Importiere Features...')
-        n_broken_geometries = 0
-        repaired = 0
-        for feature in self.layer.getFeatures():
-            geom = feature.geometry()
-            if geom.isEmpty():
-                n_broken_geometries += 1
-            else:
-                if not geom.isGeosValid():
-                    n_broken_geometries += 1
-                    try:
-                        geom = geom.makeValid()
-                        geom.transform(tr)
-                    except:
-                        pass
-                    # still not valid -> skip feature
-                    if not geom.isGeosValid():
-                        continue
-                    else:
-                        repaired += 1
-                else:
-                    geom = QgsGeometry(geom)
-                    # infinite coordinates are considered valid but fail
-                    # to transform -> add empty geometry
-                    try:
-                        geom.transform(tr)
-                    except:
-                        n_broken_geometries += 1
-                        continue
-
-            attrs = {}
-            for f_in, f_out in self.fields:
-                attr = feature.attribute(f_in)
-                if isinstance(attr, QVariant) and attr.isNull():
+        n_features = max(self.layer.featureCount(), 1)
+        self.n_broken_geometries = 0
+        self.repaired = 0
+        n_imported = 0
+        n_processed = 0
+        batch = []
+        # validating points is cheap, not worth distributing
+        is_polygon = (self.layer.geometryType() ==
+                      QgsWkbTypes.PolygonGeometry)
+        self.validator = GeometryValidator(
+            processes=None if is_polygon else 1)
+        with self.validator:
+            for feature in self.layer.getFeatures():
+                batch.append(feature)
+                if len(batch) < self.batch_size:
                     continue
-                attrs[f_out] = attr
-            self.table.add(geom=geom, **attrs)
-
-        self.log(f'{self.layer.featureCount()} Features erfolgreich importiert')
+                n_imported += self._import_batch(batch, tr)
+                n_processed += len(batch)
+                batch = []
+                self.set_progress(5 + 95 * min(n_processed / n_features, 1))
+            if batch:
+                n_imported += self._import_batch(batch, tr)
+
+        self.log(f'{n_imported} Features erfolgreich importiert')
+        n_broken_geometries = self.n_broken_geometries
+        repaired = self.repaired
         not_repaired = n_broken_geometries - repaired
         if n_broken_geometries:
             self.log(f'{n_broken_geometries} Features hatten keine oder defekte'
@@ -144,6 +165,60 @@ class ImportLayer(Worker):
             self.log(f'{not_repaired} Features mit irreparablen Geometrien '
                      'wurden nicht in das Projekt übernommen', warning=True)
 
+    def _transformed_geometries(self, geometries, tr):
+        '''
+        validate, repair and transform the geometries, irreparable
+        geometries are returned as None, empty ones stay empty
+        '''
+        wkbs = [b'' if geom.isEmpty() else geom.asWkb().data()
+                for geom in geometries]
+        transformed = []
+        for state, wkb in self.validator.validate(wkbs):
+            if state == EMPTY:
+                self.n_broken_geometries += 1
+                transformed.append(QgsGeometry())
+                continue
+            if state not in (VALID, REPAIRED):
+                # still not valid -> skip feature
+                self.n_broken_geometries += 1
+                transformed.append(None)
+                continue
+            geom = QgsGeometry()
+            geom.fromWkb(wkb)
+            # infinite coordinates are considered valid but fail
+            # to transform -> skip feature
+            try:
+                geom.transform(tr)
+            except:
+                self.n_broken_geometries += 1
+                transformed.append(None)
+                continue
+            if state == REPAIRED:
+                self.n_broken_geometries += 1
+                self.repaired += 1
+            transformed.append(geom)
+        return transformed
+
+    def _import_batch(self, features, tr):
+        '''
+        write a batch of features into the table in one transaction,
+        returns the number of imported features
+        '''
+        geometries = self._transformed_geometries(
+            [feature.geometry() for feature in features], tr)
+        columns = dict((f_out, []) for f_in, f_out in self.fields)
+        columns['geom'] = []
+        for feature, geom in zip(features, geometries):
+            if geom is None:
+                continue
+            columns['geom'].append(geom)
+            for f_in, f_out in self.fields:
+                attr = feature.attribute(f_in)
+                if isinstance(attr, QVariant) and attr.isNull():
+                    attr = None
+                columns[f_out].append(attr)
+        return self.table.add_rows(columns)
+
 
 class ResetLayers(Worker):
     '''
@@ -159,252 +234,430 @@ class ResetLayers(Worker):
             self.log(f'<b>Zurücksetzung der Tabelle "{table.name}"...</b>')
             table.delete_rows()
             self.log('Importiere Standard-Features Lichtenbergs...')
-            base_table = self.project_manager.basedata.get_table(
-                table.name, workspace='project')
-            fields = table.fields()
-            table._layer.StartTransaction()
-            for feat in base_table.features():
-                attrs = dict((f.name, feat[f.name]) for f in fields)
-                table.add(geom=feat.geom, **attrs)
-            table._layer.CommitTransaction()
+            template = self.project_manager.basedata.get_workspace('project')
+            table.copy_rows_from(template.path)
             self.set_progress((i+1) / len(self.tables) * 100)
 
 
+def _green_spaces(project, log=None):
+    '''
+    areas of the green spaces of a project (indexed by their ids) and the
+    ids of the green spaces indexed by the ids of their prepared entrances
+    '''
+    areas = {}
+    n_without_geom = 0
+    for feat in Gruenflaechen.features(project=project):
+        if not feat.geom:
+            n_without_geom += 1
+            continue
+        areas[feat.id] = feat.geom.area()
+    if n_without_geom and log:
+        log(f'{n_without_geom} Grünflächen ohne Geometrie werden '
+            'übersprungen')
+    df_entrances = GruenflaechenEingaengeProcessed.features(
+        project=project).to_pandas(columns=['eingang', 'gruenflaeche'])
+    entrance_green = df_entrances.set_index('eingang')['gruenflaeche']
+    return pd.Series(areas, dtype=float), entrance_green
+
+
+def _routing_points(table, project, id_column):
+    '''
+    ids of the routed points indexed by the ids of the prepared points they
+    represent
+    '''
+    df = table.features(project=project).to_pandas(
+        columns=[id_column, 'routing_punkt'])
+    ids = df[id_column].values
+    points = df['routing_punkt'].values
+    # points prepared without representatives are routed themselves
+    points = np.where(points > 0, points, ids).astype(np.int64)
+    return pd.Series(points, index=ids)
+
+
+def read_routed_pairs(project, results_file, entrances=True, addresses=True):
+    '''
+    read the results of the routing between the representative points and
+    fan them out to the prepared entrances and addresses they represent
+
+    Parameters
+    ----------
+    project : Project
+        the routed project
+    results_file : str
+        path to the results of the routing
+    entrances : bool, optional
+        the origins of the routing are representative entrances, defaults to
+        True
+    addresses : bool, optional
+        the destinations of the routing are representative addresses,
+        defaults to True
+
+    Returns
+    -------
+    tuple
+        ids of the entrances, ids of the addresses and the walking distances
+        in meters
+    '''
+    entrance_points = _routing_points(
+        GruenflaechenEingaengeProcessed, project, 'eingang') \
+        if entrances else None
+    address_points = _routing_points(AdressenProcessed, project, 'adresse') \
+        if addresses else None
+    return expand_pairs(*read_routing_results(results_file),
+                        entrance_points=entrance_points,
+                        address_points=address_points)
+
+
+def load_gravity_model(project, results_file, log=None, store=False):
+    '''
+    set up the gravity model of the green space usage on the results of the
+    routing and the prepared addresses and entrances of a project
+
+    Parameters
+    ----------
+    project : Project
+        the analysed project
+    results_file : str
+        path to the results of the routing, the distances stored in the
+        project are used instead if they were built from these results or if
+        None
+    log : function, optional
+        function to log messages with
+    store : bool, optional
+        store the distances of the routing in the project, defaults to not
+        storing them
+
+    Returns
+    -------
+    tuple
+        the model (blocks set), the prepared addresses indexed by their ids
+        and the blocks indexed by their ids
+    '''
+    df_addresses = AdressenProcessed.features(project=project).to_pandas(
+        columns=['adresse', 'baublock', 'einwohner', 'in_projektgebiet',
+                 'geom'])
+    df_addresses = df_addresses.set_index('adresse')
+    df_blocks = Baubloecke.features(project=project).to_pandas(
+        columns=['fid', 'einwohner', 'geom']).set_index('fid')
+    areas, entrance_green = _green_spaces(project, log=log)
+    matrix_folder = DistanceMatrix.project_folder(project)
+    if results_file is None:
+        matrix = DistanceMatrix(matrix_folder)
+    else:
+        matrix = DistanceMatrix.built_from(matrix_folder, results_file)
+    if matrix is not None:
+        if log:
+            log('Die gespeicherten Distanzen werden verwendet')
+        pairs = matrix.pairs()
+    else:
+        pairs = read_routed_pairs(project, results_file)
+        if store:
+            DistanceMatrix.build(matrix_folder, *pairs, entrance_green,
+                                 results_file=results_file)
+    model = GravityModel(*pairs, entrance_green, areas,
+                         df_addresses['einwohner'])
+    model.set_blocks(df_addresses['baublock'], df_blocks['einwohner'])
+    return model, df_addresses, df_blocks
+
+
+def update_green_space_results(project, areas, state_file):
+    '''
+    update the results of the analysis after changes of the areas of green
+    spaces without routing again, the entrances are expected to be
+    unchanged. Only the results of the affected addresses and blocks are
+    written. If the state of the analysis is missing, the model is fitted
+    again to the distances stored in the project (whose green spaces have the
+    new areas already) and all results are written
+
+    Parameters
+    ----------
+    project : Project
+        the analysed project
+    areas : dict
+        new areas by id of the green spaces
+    state_file : str
+        path to the state of the gravity model saved by the analysis
+
+    Returns
+    -------
+    int
+        number of addresses whose results changed
+    '''
+    if os.path.exists(state_file):
+        model = GravityModel.load(state_file)
+        changed = model.update_areas(areas)
+    else:
+        project_settings = ProjectSettings.features(project=project)[0]
+        model = load_gravity_model(project, None)[0]
+        model.fit(project_settings.max_walk_dist, EXPONENTIAL_FACTOR)
+        changed = np.arange(len(model.address_ids))
+        os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    if not len(changed):
+        return 0
+    block_results = model.block_results(model.results)[0]
+    blocks = np.unique(model.addr_block_idx[changed])
+    blocks = blocks[blocks >= 0]
+
+    # the results are stored with the ids of the addresses resp. blocks
+    results_addr = AdressErgebnisse.get_table(project=project)
+    results_block = BaublockErgebnisse.get_table(project=project)
+    with results_addr.workspace.transaction():
+        for idx in changed:
+            results_addr.set(int(model.address_ids[idx]),
+                             gruenflaeche_je_einwohner=model.results[idx])
+        for idx in blocks:
+            results_block.set(int(model.block_ids[idx]),
+                              gruenflaeche_je_einwohner=block_results[idx])
+    model.save(state_file)
+    return len(changed)
+
+
 class AnalyseRouting(Worker):
-    def __init__(self, results_file, green_spaces, parent=None):
+    def __init__(self, results_file, green_spaces, project=None,
+                 decay=EXPONENTIAL_FACTOR, state_file=None, parent=None):
         super().__init__(parent=parent)
         self.results_file = results_file
         self.green_spaces = green_spaces
+        self.project = project or ProjectManager().active_project
+        self.decay = decay
+        # the fitted model is saved to update the results on changes of the
+        # green spaces
+        self.state_file = state_file
 
     def work(self):
         self.log('<br><b>Analyse der Ergebnisse des Routings</b><br>')
 
         self.log('Lese Ergebnisse des Routings...')
 
-        project_settings = ProjectSettings.features()[0]
-        df_addresses = AdressenProcessed.features().to_pandas()
-        df_addresses = df_addresses.rename(columns={'einwohner': 'ew_addr'})
-        df_blocks = Baubloecke.features().to_pandas()
-        df_addr_blocks = df_addresses.merge(df_blocks, how='left',
-                                            left_on='baublock', right_on='fid')
-
-        green_spaces = Gruenflaechen.features()
-        n_without_geom = 0
-        area_data = []
-        for feat in green_spaces:
-            if not feat.geom:
-                n_without_geom += 1
-                continue
-            area_data.append((feat.id, feat.geom.area()))
-        df_areas = pd.DataFrame(
-            columns=['gruenflaeche', 'area'], data=area_data)
-        df_entrances = GruenflaechenEingaengeProcessed.features().to_pandas()
-        df_entrances = df_entrances.merge(
-            df_areas, how='left', on='gruenflaeche')
-        if n_without_geom:
-            self.log(f'{n_without_geom} Grünflächen ohne Geometrie werden '
-                     'übersprungen')
-
-        # for some reason pandas automatically replaces underscores in header
-        # with spaces, no possibility to turn that off
-        df_routing = pd.read_csv(
-            self.results_file, delimiter=';',
-            usecols= ['origin id','destination id', 'walk/bike distance (m)'])
-        df_routing = df_routing.rename(
-            columns={'origin id': 'eingang',
-                     'destination id': 'adresse',
-                     'walk/bike distance (m)': 'distance'}
-        )
-        df_routing = df_routing[df_routing['distance'] <=
-                                project_settings.max_walk_dist]
+        project = self.project
+        project_settings = ProjectSettings.features(project=project)[0]
+        if self.state_file and os.path.exists(self.state_file):
+            os.remove(self.state_file)
+        model, df_addresses, df_blocks = load_gravity_model(
+            project, self.results_file, log=self.log, store=True)
         self.set_progress(35)
 
         self.log('Analysiere Grünflächennutzung...')
+        addr_results = model.fit(project_settings.max_walk_dist, self.decay)
+        block_results = model.block_results(addr_results)[0]
+        self.set_progress(60)
 
-        df_merged = df_routing.merge(df_addr_blocks, how='left', on='adresse')
-        df_merged = df_merged.merge(df_entrances, how='left', on='eingang')
-        df_merged = df_merged[df_merged['baublock'].notna() &
-                              df_merged['gruenflaeche'].notna()]
-
-        df_merged['weighted_dist'] = df_merged['distance'].apply(
-            lambda x: np.exp(EXPONENTIAL_FACTOR * x))
-        df_merged['attractivity'] = (df_merged['weighted_dist'] *
-                                     df_merged['area'])
-        df_merged['attractivity_sum'] = df_merged.groupby(
-            'adresse')['attractivity'].transform('sum')
-        df_merged['addr_visit_prob'] = (df_merged['attractivity'] /
-                                   df_merged['attractivity_sum'])
-        df_merged['addr_visits'] = (df_merged['addr_visit_prob'] *
-                                    df_merged['ew_addr'])
-        df_merged['total_area_visits'] = df_merged.groupby(
-            'gruenflaeche')['addr_visits'].transform('sum')
-        df_merged['space_per_visitor'] = (df_merged['area'] /
-                                          df_merged['total_area_visits'])
-        df_merged['space_per_vis_weighted'] = (df_merged['space_per_visitor'] *
-                                               df_merged['addr_visit_prob'])
-
-        if DEBUG:
-            df_merged = df_merged.drop(columns=['fid_x', 'fid_y', 'geom_x',
-                                                'geom_y', 'fid', 'geom'])
-            ppath = ProjectManager().active_project.path
-            df_merged.to_csv(os.path.join(ppath, 'schritt_8.csv'), sep=';')
-
-        df_results_addr = df_merged[['adresse', 'ew_addr', 'space_per_vis_weighted', 'in_projektgebiet']].groupby(
-            ['adresse', 'ew_addr']).sum().reset_index()
-        df_results_addr['space_used_addr'] = (
-            df_results_addr['space_per_vis_weighted'] *
-            df_results_addr['ew_addr'])
-        df_results_addr.reset_index(inplace=True)
-        df_results_addr.drop(columns=['in_projektgebiet'], inplace=True)
-
-        if DEBUG:
-            df_results_addr.to_csv(os.path.join(ppath, 'schritt_11.csv'),
-                                   sep=';')
-
-        df_results_block = df_results_addr.merge(
-            df_addresses, how='left', on='adresse')[['baublock', 'space_used_addr']]
-        df_results_block = df_results_block.groupby(
-            'baublock').sum().reset_index()
-        # resetting index (baublock) changes dtype to float
-        df_results_block = df_results_block.astype({'baublock': 'int64'})
-
-        df_results_block = df_blocks.merge(df_results_block, how='left',
-                                           left_on='fid', right_on='baublock')
-        df_results_block['space_per_inh'] = (
-            df_results_block['space_used_addr'] / df_results_block['einwohner'])
-        df_results_block = df_results_block.fillna(0)
-
-        if DEBUG:
-            df_out = df_results_block[
-                ['fid', 'space_per_inh', 'space_used_addr' , 'einwohner']]
-            df_out.to_csv(os.path.join(ppath, 'schritt_13+.csv'), sep=';')
-
-        df_results_block = df_results_block[
-            ['fid', 'space_per_inh', 'geom', 'einwohner']]
+        self.log('Schreibe Ergebnisse...')
+        in_project = df_addresses['in_projektgebiet'].values.astype(bool)
+        blocks_in_pa = np.isin(df_blocks.index.values,
+                               df_addresses['baublock'].values[in_project])
+        # the ids of the results are the ones of the addresses resp. blocks
+        # to be able to update single results
+        AdressErgebnisse.remove(project=project)
+        results_addr = AdressErgebnisse.get_table(project=project,
+                                                  create=True)
+        results_addr.add_rows({
+            'fid': model.address_ids[in_project],
+            'adresse': model.address_ids[in_project],
+            'einwohner': model.inhabitants[in_project],
+            'gruenflaeche_je_einwohner': addr_results[in_project],
+            'geom': df_addresses['geom'].values[in_project]
+        })
+
+        BaublockErgebnisse.remove(project=project)
+        results_block = BaublockErgebnisse.get_table(project=project,
+                                                     create=True)
+        results_block.add_rows({
+            'fid': model.block_ids[blocks_in_pa],
+            'baublock': model.block_ids[blocks_in_pa],
+            'einwohner': df_blocks['einwohner'].values[blocks_in_pa],
+            'gruenflaeche_je_einwohner': block_results[blocks_in_pa],
+            'geom': df_blocks['geom'].values[blocks_in_pa]
+        })
+        if self.state_file:
+            model.save(self.state_file)
+
+
+class SweepAnalysis(Worker):
+    '''
+    worker analysing the results of a single routing for all combinations of
+    the given maximum walking distances and decay factors, the distances
+    have to be routed up to the largest of the maximum walking distances.
+    The results are written in long format into the sensitivity tables
+    without geometries, the rows are identified by the id of the address or
+    block and the parameters
+    '''
+    def __init__(self, results_file, max_walk_dists, decays, project=None,
+                 parent=None):
+        super().__init__(parent=parent)
+        self.results_file = results_file
+        self.max_walk_dists = sorted(max_walk_dists)
+        self.decays = sorted(decays)
+        self.project = project or ProjectManager().active_project
+
+    def work(self):
+        self.log('<br><b>Sensitivitätsanalyse der Ergebnisse des Routings</b>'
+                 '<br>')
+        project = self.project
+
+        self.log('Lese Ergebnisse des Routings...')
+        model, df_addresses, df_blocks = load_gravity_model(
+            project, self.results_file, log=self.log)
+        self.set_progress(20)
+
+        n_params = len(self.max_walk_dists) * len(self.decays)
+        self.log(f'Berechne {n_params} Parameterkombinationen...')
+        params, addr_results = model.evaluate(self.max_walk_dists,
+                                              self.decays)
+        block_results = model.block_results(addr_results)
         self.set_progress(60)
 
         self.log('Schreibe Ergebnisse...')
+        in_project = df_addresses['in_projektgebiet'].values.astype(bool)
+        blocks_in_pa = np.isin(df_blocks.index.values,
+                               df_addresses['baublock'].values[in_project])
+        max_dists = np.array([p[0] for p in params])
+        decays = np.array([p[1] for p in params])
+
+        AdressSensitivitaet.remove(project=project)
+        table = AdressSensitivitaet.get_table(project=project, create=True)
+        n_addr = in_project.sum()
+        table.add_rows({
+            'adresse': np.tile(model.address_ids[in_project], len(params)),
+            'max_walk_dist': np.repeat(max_dists, n_addr),
+            'decay': np.repeat(decays, n_addr),
+            'gruenflaeche_je_einwohner': addr_results[:, in_project].ravel(),
+            'einwohner': np.tile(model.inhabitants[in_project], len(params))
+        })
+        self.set_progress(80)
+
+        BaublockSensitivitaet.remove(project=project)
+        table = BaublockSensitivitaet.get_table(project=project, create=True)
+        n_blocks = blocks_in_pa.sum()
+        table.add_rows({
+            'baublock': np.tile(df_blocks.index.values[blocks_in_pa],
+                                len(params)),
+            'max_walk_dist': np.repeat(max_dists, n_blocks),
+            'decay': np.repeat(decays, n_blocks),
+            'gruenflaeche_je_einwohner':
+            block_results[:, blocks_in_pa].ravel(),
+            'einwohner': np.tile(df_blocks['einwohner'].values[blocks_in_pa],
+                                 len(params))
+        })
+
+
+class PrepareRouterData(Worker):
+    '''
+    worker preparing the data of a router for building it with a profile,
+    optionally clipped to the area of a project buffered by the project
+    buffer and the maximum walking distance. Returns the metadata of the
+    profile
+    '''
+    def __init__(self, router_path, project=None, clip=True,
+                 profile='standard', parent=None):
+        super().__init__(parent=parent)
+        self.router_path = router_path
+        self.project = project or ProjectManager().active_project
+        self.clip = clip
+        self.profile = profile
 
-        df_addresses_in_project = df_addresses[
-            df_addresses['in_projektgebiet'] == True]
-
-        AdressErgebnisse.remove()
-        results_addr = AdressErgebnisse.features(create=True)
-        df_results_addr = df_results_addr.drop(columns=['ew_addr'])
-        df_results_addr = df_addresses_in_project.merge(
-            df_results_addr, how='left', on='adresse')
-        df_results_addr = df_results_addr.fillna(0)
-
-        results_addr.table._layer.StartTransaction()
-        for index, row in df_results_addr.iterrows():
-            results_addr.add(adresse=row['adresse'], einwohner=row['ew_addr'],
-                             gruenflaeche_je_einwohner=
-                             row['space_per_vis_weighted'], geom=row['geom'])
-        results_addr.table._layer.CommitTransaction()
-
-        BaublockErgebnisse.remove()
-        blocks_in_pa = df_addresses_in_project['baublock'].unique()
-        df_results_block_in_pa = df_results_block[
-            df_results_block['fid'].isin(blocks_in_pa)]
-        results_block = BaublockErgebnisse.features(create=True)
-        results_block.table._layer.StartTransaction()
-        for index, row in df_results_block_in_pa.iterrows():
-            results_block.add(baublock=row['fid'], einwohner=row['einwohner'],
-                              gruenflaeche_je_einwohner=row['space_per_inh'],
-                              geom=row['geom'])
-        results_block.table._layer.CommitTransaction()
+    def work(self):
+        self.log('<b>Vorbereitung der Daten des Routers</b><br>')
+        self.log(f'Profil: {PROFILES[self.profile]}')
+        bbox = None
+        if self.clip:
+            bbox = project_extent(self.project)
+            self.log('Zuschnitt auf (Längen-/Breitengrade): ' +
+                     ', '.join(f'{c:.5f}' for c in bbox))
+        metadata = prepare_router_data(self.router_path, bbox=bbox,
+                                       profile=self.profile, log=self.log)
+        if self.clip:
+            metadata['project'] = self.project.name
+        return metadata
 
 
 class PrepareRouting(Worker):
 
-    def __init__(self, temp_dir, parent=None):
+    def __init__(self, temp_dir, project=None, parent=None):
         super().__init__(parent=parent)
         self.temp_dir = temp_dir
+        self.project = project or ProjectManager().active_project
 
     def work(self):
         self.log('<b>Vorbereitung des Routings</b><br>')
-        project_settings = ProjectSettings.features()[0]
-        entrances_layer = GruenflaechenEingaenge.as_layer()
-        address_layer = Adressen.as_layer()
-        block_layer = Baubloecke.as_layer()
-        df_blocks = Baubloecke.features().to_pandas(columns=['fid', 'einwohner'])
-        green_spaces_layer = Gruenflaechen.as_layer()
-        AdressenProcessed.remove()
-        GruenflaechenEingaengeProcessed.remove()
-        ProjektgebietProcessed.remove()
+        project = self.project
+        project_settings = ProjectSettings.features(project=project)[0]
+        AdressenProcessed.remove(project=project)
+        GruenflaechenEingaengeProcessed.remove(project=project)
+        ProjektgebietProcessed.remove(project=project)
 
         buffer = project_settings.project_buffer
         self.log('Verschneide Adressen und Grünflächeingänge '
                  f'mit dem Projektgebiet inkl. Buffer ({buffer}m) ')
-        proc_pa = ProjektgebietProcessed.features(create=True)
-        for feat in Projektgebiet.features():
-            proc_pa.add(geom=feat.geom.buffer(buffer, 10))
-
-        project_layer_buffered = ProjektgebietProcessed.as_layer()
-
-        parameters = {'INPUT': address_layer,
-                      'INPUT_FIELDS': ['fid'],
-                      'OVERLAY': project_layer_buffered,
-                      'OUTPUT':'memory:'}
-        addr_in_buffer_layer = processing.run(
-            'native:intersection', parameters)['OUTPUT']
-
-        parameters = {'INPUT': address_layer,
-                      'INPUT_FIELDS': ['fid'],
-                      'OVERLAY': Projektgebiet.as_layer(),
-                      'OUTPUT':'memory:'}
-        addr_in_project_layer = processing.run(
-            'native:intersection', parameters)['OUTPUT']
-
-        parameters = {'INPUT': entrances_layer,
-                      'OVERLAY': project_layer_buffered,
-                      'OVERLAY_FIELDS_PREFIX': 'green_',
-                      'OUTPUT':'memory:'}
-        ent_in_buffer_layer = processing.run(
-            'native:intersection', parameters)['OUTPUT']
+        project_areas = [feat.geom for feat in
+                         Projektgebiet.features(project=project)]
+        buffered_areas = [geom.buffer(buffer, 10) for geom in project_areas]
+        buffer_index = PolygonIndex(buffered_areas)
+
+        df_addr = Adressen.features(project=project).to_pandas(
+            columns=['fid', 'geom'])
+        addr_x, addr_y = point_coordinates(df_addr['geom'])
+        addr_in_buffer = buffer_index.contains(addr_x, addr_y)
+        addr_in_project = PolygonIndex(project_areas).contains(addr_x, addr_y)
+
+        df_entrances = GruenflaechenEingaenge.features(
+            project=project).to_pandas(columns=['fid', 'geom'])
+        ent_x, ent_y = point_coordinates(df_entrances['geom'])
+        ent_in_buffer = buffer_index.contains(ent_x, ent_y)
         self.set_progress(15)
 
         self.log('Ordne Adressen den Baublöcken zu...')
-
-        parameters = {'INPUT': addr_in_buffer_layer,
-                      'INPUT_FIELDS': ['fid'],
-                      'OVERLAY': block_layer,
-                      'OVERLAY_FIELDS_PREFIX': 'block_',
-                      'OUTPUT':'memory:'}
-
-        addr_block_layer = processing.run(
-            'native:intersection', parameters)['OUTPUT']
+        df_blocks = Baubloecke.features(project=project).to_pandas(
+            columns=['fid', 'einwohner', 'geom'])
+        block_index = PolygonIndex(df_blocks['geom'], ids=df_blocks['fid'])
+        addr_blocks = np.full(len(df_addr), -1, dtype=np.int64)
+        addr_blocks[addr_in_buffer] = block_index.locate(
+            addr_x[addr_in_buffer], addr_y[addr_in_buffer])
         self.set_progress(30)
 
-        in_project = []
-        for feat in addr_in_project_layer.getFeatures():
-            in_project.append(feat.attribute('fid'))
-
-        rows = []
-        for feat in addr_block_layer.getFeatures():
-            # intersection turns the points into multipoints whyever
-            geom = feat.geometry().asGeometryCollection()[0]
-            rows.append(
-                [feat.attribute('fid'), feat.attribute('block_fid'), geom])
-
-        df_blocks = df_blocks.rename(columns={'einwohner': 'einwohner_block'})
-        df_addresses = pd.DataFrame(
-            data=rows, columns=['adresse', 'baublock', 'geom'])
+        assigned = addr_blocks >= 0
+        df_addresses = pd.DataFrame({
+            'adresse': df_addr['fid'].values[assigned],
+            'baublock': addr_blocks[assigned],
+            'geom': [QgsGeometry.fromPointXY(QgsPointXY(x, y)) for x, y in
+                     zip(addr_x[assigned], addr_y[assigned])],
+            'in_projektgebiet': addr_in_project[assigned],
+            'x': addr_x[assigned],
+            'y': addr_y[assigned]
+        })
+
+        df_blocks = df_blocks[['fid', 'einwohner']].rename(
+            columns={'einwohner': 'einwohner_block'})
         df_addresses = df_addresses.merge(
             df_blocks, left_on='baublock', right_on='fid')
-        df_addresses['in_projektgebiet'] = False
-        df_addresses.loc[df_addresses['adresse'].isin(in_project), 'in_projektgebiet'] = True
 
         df_addresses['block_count'] = (
             df_addresses.groupby('baublock')['baublock'].transform('count'))
         df_addresses['einwohner'] = (df_addresses['einwohner_block'].astype(float) /
                                      df_addresses['block_count'])
-        df_addresses.drop(columns=['fid'], inplace=True)
-        proc_addresses = AdressenProcessed.features(create=True)
-        proc_addresses.update_pandas(df_addresses)
-
-        missing = (addr_in_buffer_layer.featureCount() -
-                   addr_block_layer.featureCount())
+        # addresses at (almost) the same location are routed only once
+        tolerance = project_settings.point_tolerance
+        rep = PointSet(df_addresses[['x', 'y']].values).collapse(tolerance)
+        df_addresses['routing_punkt'] = df_addresses['adresse'].values[rep]
+        routed = rep == np.arange(len(rep))
+        if not routed.all():
+            self.log(f'{len(rep)} Adressen werden durch {routed.sum()} '
+                     f'Routingpunkte im Abstand bis {tolerance}m '
+                     'repräsentiert')
+        # the destinations of the routing are kept for the export
+        self.destinations = (df_addresses['adresse'].values[routed],
+                             df_addresses['x'].values[routed],
+                             df_addresses['y'].values[routed])
+        address_rows = {
+            'adresse': df_addresses['adresse'].values,
+            'baublock': df_addresses['baublock'].values,
+            'einwohner': df_addresses['einwohner'].values,
+            'in_projektgebiet': df_addresses['in_projektgebiet'].tolist(),
+            'routing_punkt': df_addresses['routing_punkt'].values,
+            'geom': df_addresses['geom'].values
+        }
+
+        missing = addr_in_buffer.sum() - assigned.sum()
         if missing:
             self.log(f'{missing} Adressen konnten keinem Baublock '
                      'zugeordnet werden.', warning=True)
@@ -412,58 +665,280 @@ class PrepareRouting(Worker):
 
         self.log('Ordne Eingänge den Grünflächen zu...')
 
-        green_index = QgsSpatialIndex()
-        for feat in green_spaces_layer.getFeatures():
-            green_index.addFeature(feat)
-        missing = 0
+        df_green = Gruenflaechen.features(project=project).to_pandas(
+            columns=['fid', 'geom'])
+        green_index = PolygonIndex(df_green['geom'], ids=df_green['fid'])
         max_ent_dist = 100
-        proc_entrances = GruenflaechenEingaengeProcessed.features(create=True)
-        for feat in ent_in_buffer_layer.getFeatures():
-            # multipoint to point
-            geom = feat.geometry().asGeometryCollection()[0]
-            nearest = green_index.nearestNeighbor(geom, 1,
-                                                  maxDistance=max_ent_dist)
-            if nearest:
-                proc_entrances.add(eingang=feat.attribute('fid'), geom=geom,
-                                   gruenflaeche=nearest[0])
-            else:
-                missing += 1
+        ent_green = green_index.nearest(ent_x[ent_in_buffer],
+                                        ent_y[ent_in_buffer],
+                                        max_distance=max_ent_dist)
+        assigned = ent_green >= 0
+        missing = len(ent_green) - assigned.sum()
+        ids = df_entrances['fid'].values[ent_in_buffer][assigned]
+        x = ent_x[ent_in_buffer][assigned]
+        y = ent_y[ent_in_buffer][assigned]
+        greens = ent_green[assigned]
+        # entrances of the same green space at (almost) the same location
+        # are routed only once
+        rep = PointSet(np.column_stack([x, y])).collapse(tolerance,
+                                                          groups=greens)
+        routed = rep == np.arange(len(rep))
+        if not routed.all():
+            self.log(f'{len(rep)} Eingänge werden durch {routed.sum()} '
+                     f'Routingpunkte im Abstand bis {tolerance}m '
+                     'repräsentiert')
+        # the origins of the routing are kept for the export
+        self.origins = (ids[routed], x[routed], y[routed])
         if missing:
             self.log(f'{missing} Eingänge konnten im Umkreis von '
                      f'{max_ent_dist}m keiner Grünfläche zugeordnet werden.',
                      warning=True)
 
+        self.log('Schreibe die vorbereiteten Daten...')
+        proc_pa = ProjektgebietProcessed.features(project=project, create=True)
+        proc_addresses = AdressenProcessed.features(project=project,
+                                                    create=True)
+        proc_entrances = GruenflaechenEingaengeProcessed.features(
+            project=project, create=True)
+        # all tables are in the results workspace, written in one transaction
+        with proc_addresses.table.workspace.transaction():
+            proc_pa.table.add_rows({'geom': buffered_areas})
+            proc_addresses.table.add_rows(address_rows)
+            proc_entrances.table.add_rows({
+                'eingang': ids,
+                'gruenflaeche': greens,
+                'routing_punkt': ids[rep],
+                'geom': [QgsGeometry.fromPointXY(QgsPointXY(px, py))
+                         for px, py in zip(x, y)]
+            })
+        self.set_progress(90)
+
         self.write_csv()
 
     def write_csv(self):
         self.log('Exportiere Start- und Zielpunkte für das Routing...')
 
-        origin_layer = GruenflaechenEingaengeProcessed.as_layer()
-        destination_layer = AdressenProcessed.as_layer()
-        wgs84 = QgsCoordinateReferenceSystem(f'EPSG:{4326}')
-
-        # convert layers to csv and write them to temporary directory
+        # write the points as csv into temporary directory
         orig_tmp_filename = os.path.join(self.temp_dir, 'origins.csv')
         dest_tmp_filename = os.path.join(self.temp_dir, 'destinations.csv')
 
-        o_fid_idx = [f.name() for f in origin_layer.fields()].index('eingang')
-        d_fid_idx = [f.name() for f in destination_layer.fields()].index('adresse')
+        write_points(orig_tmp_filename, 'eingang', *self.origins)
+        self.log(f'{orig_tmp_filename} geschrieben')
+        write_points(dest_tmp_filename, 'adresse', *self.destinations)
+        self.log(f'{dest_tmp_filename} geschrieben')
 
-        options = QgsVectorFileWriter.SaveVectorOptions()
-        options.fileEncoding = 'utf-8'
-        options.driverName = 'CSV'
-        options.layerOptions=['GEOMETRY=AS_YX'] #f'SEPARATOR=,', 'WRITE_BOM=YES']
 
-        options.attributes = [o_fid_idx]
-        options.ct =  QgsCoordinateTransform(origin_layer.crs(), wgs84, QgsProject.instance())
+def block_representatives(blocks, x, y, weights):
+    '''
+    representative address of each block, the one nearest to the centre of
+    the addresses of the block weighted by their inhabitants (unweighted
+    centre if the block has no inhabitants)
+
+    Parameters
+    ----------
+    blocks : np.ndarray
+        ids of the blocks of the addresses
+    x : np.ndarray
+        x-coordinates of the addresses
+    y : np.ndarray
+        y-coordinates of the addresses
+    weights : np.ndarray
+        inhabitants of the addresses
+
+    Returns
+    -------
+    tuple
+        ids of the blocks and positions of their representative addresses
+    '''
+    block_ids, idx = np.unique(blocks, return_inverse=True)
+    n_blocks = len(block_ids)
+    weights = np.asarray(weights, dtype=float)
+    weight_sum = np.bincount(idx, weights=weights, minlength=n_blocks)
+    weights = np.where(weight_sum[idx] > 0, weights, 1)
+    weight_sum = np.bincount(idx, weights=weights, minlength=n_blocks)
+    center_x = np.bincount(idx, weights=weights * x,
+                           minlength=n_blocks) / weight_sum
+    center_y = np.bincount(idx, weights=weights * y,
+                           minlength=n_blocks) / weight_sum
+    dist = (x - center_x[idx]) ** 2 + (y - center_y[idx]) ** 2
+    order = np.lexsort((dist, idx))
+    first = np.searchsorted(idx[order], np.arange(n_blocks))
+    return block_ids, order[first]
+
+
+class PreparePreview(Worker):
+    '''
+    worker exporting the points of the routing of the preview, the prepared
+    addresses of each block are represented by a single address (ids of the
+    representatives are the negative ids of their blocks). For the exact
+    refinement of blocks their addresses are exported instead
+    '''
+    def __init__(self, folder, refine_blocks=None, project=None,
+                 parent=None):
+        super().__init__(parent=parent)
+        self.folder = folder
+        self.refine_blocks = refine_blocks
+        self.project = project or ProjectManager().active_project
 
-        QgsVectorFileWriter.writeAsVectorFormatV3(
-            origin_layer, orig_tmp_filename, QgsProject.instance().transformContext(), options)
-        self.log(f'{orig_tmp_filename} geschrieben')
+    def work(self):
+        project = self.project
+        os.makedirs(self.folder, exist_ok=True)
+        self.log('Exportiere Start- und Zielpunkte für das Routing...')
+        entrance_points = _routing_points(GruenflaechenEingaengeProcessed,
+                                          project, 'eingang')
+        df_entrances = GruenflaechenEingaengeProcessed.features(
+            project=project).to_pandas(columns=['eingang', 'geom'])
+        routed = np.isin(df_entrances['eingang'].values,
+                         entrance_points.values)
+        x, y = point_coordinates(df_entrances['geom'].values[routed])
+        write_points(os.path.join(self.folder, 'origins.csv'), 'eingang',
+                     df_entrances['eingang'].values[routed], x, y)
+
+        df_addresses = AdressenProcessed.features(project=project).to_pandas(
+            columns=['adresse', 'baublock', 'einwohner', 'geom'])
+        x, y = point_coordinates(df_addresses['geom'])
+        blocks = df_addresses['baublock'].values
+        if self.refine_blocks is None:
+            block_ids, rep = block_representatives(
+                blocks, x, y, df_addresses['einwohner'].values)
+            ids, x, y = -block_ids, x[rep], y[rep]
+            self.log(f'{len(df_addresses)} Adressen werden durch {len(ids)} '
+                     'Punkte (je Baublock einer) repräsentiert')
+        else:
+            refine = np.isin(blocks, list(self.refine_blocks))
+            address_points = _routing_points(AdressenProcessed, project,
+                                             'adresse')
+            routed = np.isin(df_addresses['adresse'].values,
+                             address_points.reindex(
+                                 df_addresses['adresse'].values[refine]
+                             ).values)
+            ids, x, y = (df_addresses['adresse'].values[routed], x[routed],
+                         y[routed])
+            self.log(f'{refine.sum()} Adressen von '
+                     f'{len(self.refine_blocks)} Baublöcken werden exakt '
+                     'berechnet')
+        write_points(os.path.join(self.folder, 'destinations.csv'), 'adresse',
+                     ids, x, y)
+
+
+class PreviewAnalysis(Worker):
+    '''
+    worker analysing the routing of the preview, the results of the blocks
+    are approximated by the ones of their representatives and compared to
+    the results of the last exact analysis. The routed addresses of refined
+    blocks replace their representatives
+    '''
+    def __init__(self, results_file, refine_results_file=None,
+                 refined_blocks=[], tolerance=PREVIEW_TOLERANCE,
+                 project=None, decay=EXPONENTIAL_FACTOR, parent=None):
+        super().__init__(parent=parent)
+        self.results_file = results_file
+        self.refine_results_file = refine_results_file
+        self.refined_blocks = refined_blocks
+        self.tolerance = tolerance
+        self.project = project or ProjectManager().active_project
+        self.decay = decay
 
-        options.attributes = [d_fid_idx]
-        options.ct =  QgsCoordinateTransform(destination_layer.crs(), wgs84, QgsProject.instance())
+    def work(self):
+        self.log('<br><b>Analyse der Vorschau</b><br>')
+        project = self.project
+        project_settings = ProjectSettings.features(project=project)[0]
+
+        self.log('Lese Ergebnisse des Routings...')
+        df_addresses = AdressenProcessed.features(project=project).to_pandas(
+            columns=['adresse', 'baublock', 'einwohner', 'in_projektgebiet'])
+        df_blocks = Baubloecke.features(project=project).to_pandas(
+            columns=['fid', 'einwohner', 'geom']).set_index('fid')
+        areas, entrance_green = _green_spaces(project, log=self.log)
+        refined = np.array(list(self.refined_blocks), dtype=np.int64)
+        is_refined = np.isin(df_addresses['baublock'].values, refined)
+
+        # the representatives bear the inhabitants of all addresses of their
+        # blocks
+        rep_inhabitants = df_addresses[~is_refined].groupby(
+            'baublock')['einwohner'].sum()
+        rep_ids = -rep_inhabitants.index.values
+        df_refined = df_addresses[is_refined].set_index('adresse')
+        inhabitants = pd.concat([
+            pd.Series(rep_inhabitants.values, index=rep_ids),
+            df_refined['einwohner']])
+        destination_blocks = pd.concat([
+            pd.Series(rep_inhabitants.index.values, index=rep_ids),
+            df_refined['baublock']])
+
+        entrances, destinations, distances = read_routed_pairs(
+            project, self.results_file, addresses=False)
+        if len(refined) and self.refine_results_file:
+            # the routes to the representatives of the refined blocks are
+            # replaced by the ones to their addresses
+            keep = ~np.isin(-destinations, refined)
+            refine_pairs = read_routed_pairs(project,
+                                             self.refine_results_file)
+            entrances = np.concatenate([entrances[keep], refine_pairs[0]])
+            destinations = np.concatenate([destinations[keep],
+                                           refine_pairs[1]])
+            distances = np.concatenate([distances[keep], refine_pairs[2]])
+        self.set_progress(30)
+
+        self.log('Analysiere Grünflächennutzung...')
+        model = GravityModel(entrances, destinations, distances,
+                             entrance_green, areas, inhabitants)
+        model.set_blocks(destination_blocks, df_blocks['einwohner'])
+        results = model.block_results(
+            model.fit(project_settings.max_walk_dist, self.decay))[0]
+        self.set_progress(60)
 
-        QgsVectorFileWriter.writeAsVectorFormatV3(
-            destination_layer, dest_tmp_filename, QgsProject.instance().transformContext(), options)
-        self.log(f'{dest_tmp_filename} geschrieben')
\ No newline at end of file
+        in_project = df_addresses['in_projektgebiet'].values.astype(bool)
+        blocks_in_pa = np.isin(df_blocks.index.values,
+                               df_addresses['baublock'].values[in_project])
+        block_ids = df_blocks.index.values[blocks_in_pa]
+        results = results[blocks_in_pa]
+        required = project_settings.required_green
+        near = np.abs(results - required) <= self.tolerance * required
+        exact = np.isin(block_ids, refined)
+        self.log(f'{len(block_ids)} Baublöcke berechnet, davon '
+                 f'{exact.sum()} exakt')
+
+        difference = np.full(len(block_ids), np.nan)
+        last_results = np.full(len(block_ids), np.nan)
+        workspace = BaublockErgebnisse.get_workspace(project=project)
+        if BaublockErgebnisse.get_name() in workspace.tables:
+            df_last = BaublockErgebnisse.features(project=project).to_pandas(
+                columns=['baublock', 'gruenflaeche_je_einwohner'])
+            last_results = df_last.set_index('baublock')[
+                'gruenflaeche_je_einwohner'].reindex(block_ids).values
+            difference = results - last_results
+        compared = ~np.isnan(difference)
+        if compared.any():
+            abs_diff = np.abs(difference[compared])
+            changed = ((results[compared] >= required) !=
+                       (last_results[compared] >= required))
+            self.log('Abweichung von der letzten exakten Berechnung: '
+                     f'im Mittel {abs_diff.mean():.2f}m², maximal '
+                     f'{abs_diff.max():.2f}m² je Einwohner')
+            self.log(f'{changed.sum()} von {compared.sum()} Baublöcken liegen '
+                     'auf einer anderen Seite des Richtwerts '
+                     f'({required}m² je Einwohner) als in der letzten '
+                     'exakten Berechnung')
+        else:
+            self.log('Keine exakte Berechnung zum Vergleich vorhanden')
+        n_near = (near & ~exact).sum()
+        if n_near:
+            self.log(f'{n_near} Baublöcke liegen nahe am Richtwert und '
+                     'können exakt nachberechnet werden')
+        self.set_progress(80)
+
+        self.log('Schreibe Ergebnisse...')
+        BaublockVorschau.remove(project=project)
+        table = BaublockVorschau.get_table(project=project, create=True)
+        table.add_rows({
+            'fid': block_ids,
+            'baublock': block_ids,
+            'einwohner': df_blocks['einwohner'].values[blocks_in_pa],
+            'gruenflaeche_je_einwohner': results,
+            'exakt': [bool(e) for e in exact],
+            'nahe_schwelle': [bool(n) for n in near],
+            'differenz': [None if np.isnan(d) else d for d in difference],
+            'geom': df_blocks['geom'].values[blocks_in_pa]
+        })
+        return block_ids[near]
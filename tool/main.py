@@ -1,7 +1,5 @@
 import os
-import math
 import subprocess
-import tempfile
 import functools
 import threading
 import sys
@@ -21,24 +19,31 @@ from gruenflaechenotp.base.project import (ProjectManager, settings, ProjectLaye
 from gruenflaechenotp.tool.dialogs import (ExecOTPDialog, InfoDialog,
                                            SettingsDialog, NewProjectDialog,
                                            NewRouterDialog, ImportLayerDialog,
-                                           ExecBuildRouterDialog)
+                                           ExecBuildRouterDialog,
+                                           BuildRouterDialog)
 from gruenflaechenotp.base.database import Workspace
 from gruenflaechenotp.tool.tables import (
     ProjectSettings, Projektgebiet, Adressen, Baubloecke, Gruenflaechen,
-    GruenflaechenEingaenge, AdressenProcessed, GruenflaechenEingaengeProcessed,
-    BaublockErgebnisse, AdressErgebnisse
+    GruenflaechenEingaenge, AdressenProcessed, BaublockErgebnisse,
+    AdressErgebnisse
 )
 from gruenflaechenotp.base.dialogs import ProgressDialog
 from gruenflaechenotp.tool.jobs import (CloneProject, ImportLayer, ResetLayers,
                                         AnalyseRouting, PrepareRouting,
-                                        CreateProject)
-from gruenflaechenotp.batch.config import Config as OTPConfig
+                                        CreateProject, PrepareRouterData,
+                                        update_green_space_results)
+from gruenflaechenotp.tool.osm import (SOURCE_FOLDER, PROFILES,
+                                       osmium_executable, prepare_router_data,
+                                       write_profile, profile_description)
+from gruenflaechenotp.tool.pipeline import (PRINT_EVERY_N_LINES,
+                                            ROUTING_FOLDER, ANALYSIS_STATE,
+                                            StageFingerprints,
+                                            missing_executables,
+                                            routing_command, routing_folder,
+                                            write_routing_config)
 
 TITLE = "Grünflächenbewertung"
 DEFAULT_ROUTERS = ["Standardrouter_Berlin", "Standardrouter_Lichtenberg"]
-
-# how many results are written while running batch script
-PRINT_EVERY_N_LINES = 100
 main_form = os.path.join(settings.UI_PATH, 'OTP_main_window.ui')
 
 def threaded(function):
@@ -72,6 +77,7 @@ class OTPMainWindow(QtCore.QObject):
         self.ui.setWindowTitle(TITLE)
         self.setupUi()
         self.temp_dir = None
+        self.stages = None
 
     def closeEvent(self, evnt):
         if self.on_close:
@@ -112,6 +118,8 @@ class OTPMainWindow(QtCore.QObject):
             lambda x: save_project_setting('max_walk_dist', x))
         self.ui.project_buffer_edit.valueChanged.connect(
             lambda x: save_project_setting('project_buffer', x))
+        self.ui.point_tolerance_edit.valueChanged.connect(
+            lambda x: save_project_setting('point_tolerance', x))
 
         self.ui.walk_speed_edit.valueChanged.connect(
             lambda x: save_project_setting('walk_speed', x))
@@ -128,6 +136,7 @@ class OTPMainWindow(QtCore.QObject):
             save_project_setting('router', name)
             self.ui.remove_router_button.setEnabled(name not in DEFAULT_ROUTERS)
             self.ui.build_router_button.setEnabled(name not in DEFAULT_ROUTERS)
+            self.show_router_profile()
         self.ui.router_combo.currentTextChanged.connect(change_router)
 
         def open_current_router():
@@ -485,6 +494,33 @@ class OTPMainWindow(QtCore.QObject):
             label='Grünflächen',
             style_file='gruenflaechen.qml',
             redraw=False)
+        if self.green_output.layer:
+            self.green_output.layer.committedGeometriesChanges.connect(
+                self.update_green_results)
+
+    def update_green_results(self, layer_id, geometries):
+        '''
+        update the results of the last analysis after the geometries of
+        green spaces were edited, without routing again
+        '''
+        project = self.project_manager.active_project
+        if not project:
+            return
+        state_file = os.path.join(project.path, ROUTING_FOLDER,
+                                  ANALYSIS_STATE)
+        # without the state the model is fitted to the stored distances
+        if not (os.path.exists(state_file) or os.path.isdir(
+                DistanceMatrix.project_folder(project))):
+            return
+        areas = {fid: geom.area() if geom and not geom.isEmpty() else 0
+                 for fid, geom in geometries.items()}
+        n_changed = update_green_space_results(project, areas, state_file)
+        if n_changed:
+            for output in [getattr(self, 'adress_results_output', None),
+                           self.block_results_output]:
+                if output and output.layer:
+                    output.layer.reload()
+                    output.layer.triggerRepaint()
 
     def add_background_inputs(self):
         groupname = 'Eingangsdaten (Wohnen)'
@@ -585,6 +621,8 @@ class OTPMainWindow(QtCore.QObject):
         self.ui.required_green_edit.blockSignals(False)
         self.ui.max_walk_dist_edit.setValue(self.project_settings.max_walk_dist)
         self.ui.project_buffer_edit.setValue(self.project_settings.project_buffer)
+        self.ui.point_tolerance_edit.setValue(
+            self.project_settings.point_tolerance)
 
         self.ui.walk_speed_edit.setValue(self.project_settings.walk_speed)
         #self.ui.wheelchair_check.setChecked(self.project_settings.wheelchair)
@@ -621,6 +659,10 @@ class OTPMainWindow(QtCore.QObject):
                     #graph_file = os.path.join(path, 'Graph.obj')
                     #if os.path.exists(graph_file):
                     self.ui.router_combo.addItem(subdir)
+                    # the profile the router was built with as tooltip
+                    self.ui.router_combo.setItemData(
+                        self.ui.router_combo.count() - 1,
+                        profile_description(path), QtCore.Qt.ToolTipRole)
                     if current_router and current_router == subdir:
                         idx = i
                         current_found = True
@@ -639,121 +681,123 @@ class OTPMainWindow(QtCore.QObject):
             current_router not in DEFAULT_ROUTERS)
         self.ui.build_router_button.setEnabled(
             current_router not in DEFAULT_ROUTERS)
+        self.show_router_profile()
 
-    def calculate(self):
-        otp_jar = settings.system['otp_jar_file']
-        if not os.path.exists(otp_jar):
-            msg_box = QtWidgets.QMessageBox(
-                QtWidgets.QMessageBox.Warning, "Fehler",
-                u'Die in den Einstellungen angegebene OTP Datei existiert nicht!')
-            msg_box.exec_()
+    def show_router_profile(self):
+        '''
+        show the profile the selected router was built with
+        '''
+        router = self.ui.router_combo.currentText()
+        if not router or not settings.graph_path:
+            self.ui.router_combo.setToolTip('')
             return
-        jython_jar = settings.system['jython_jar_file']
-        if not os.path.exists(jython_jar):
+        description = profile_description(
+            os.path.join(settings.graph_path, router))
+        self.ui.router_combo.setToolTip(description)
+        idx = self.ui.router_combo.currentIndex()
+        if idx >= 0:
+            self.ui.router_combo.setItemData(idx, description,
+                                             QtCore.Qt.ToolTipRole)
+
+    def calculate(self):
+        missing = missing_executables()
+        if missing:
             msg_box = QtWidgets.QMessageBox(
-                QtWidgets.QMessageBox.Warning, "Fehler",
-                u'Der in den Einstellungen angegebene Jython Interpreter existiert nicht!')
+                QtWidgets.QMessageBox.Warning, "Fehler", missing[0])
             msg_box.exec_()
             return
-        java_executable = settings.system['java']
-        if not os.path.exists(java_executable):
+
+        project = self.project_manager.active_project
+        self.temp_dir = routing_folder(project)
+        # only the stages whose inputs changed since their last run are rerun
+        self.stages = StageFingerprints(project, self.temp_dir)
+        self.elapsed_time = 0
+        self.progress_log = []
+        if not self.stages.is_current('prepare'):
+            self.prepare_routing()
+        elif not self.stages.is_current('route'):
+            self.route()
+        elif not self.stages.is_current('analyse'):
+            self.analyse()
+        else:
             msg_box = QtWidgets.QMessageBox(
-                QtWidgets.QMessageBox.Warning, "Fehler",
-                u'Der in den Einstellungen angegebene Java-Pfad existiert nicht!')
+                QtWidgets.QMessageBox.Information, "Berechnung",
+                'Die Ergebnisse sind aktuell, die Eingangsdaten haben sich '
+                'seit der letzten Berechnung nicht geändert.')
             msg_box.exec_()
-            return
-
-        self.temp_dir = tempfile.mkdtemp()
-        self.prepare_routing()
+            self.add_result_layers()
 
     def prepare_routing(self):
-        job = PrepareRouting(self.temp_dir, parent=self.ui)
+        self.stages.invalidate('prepare')
+        job = PrepareRouting(self.temp_dir,
+                             project=self.project_manager.active_project,
+                             parent=self.ui)
         # workaround for not being able to run process together with
         # preparation and analysis in one Thread (and therefore in one dialog)
         # keeping track of elapsed time and log to hide this
         dialog = None
-        self.elapsed_time = 0
-        self.progress_log = []
         def on_close():
             if dialog.success:
+                self.stages.store('prepare')
                 self.elapsed_time = dialog.elapsed_time
                 self.progress_log = dialog.logs
-                self.route()
+                if self.stages.is_current('route'):
+                    self.analyse()
+                else:
+                    self.route()
         dialog = ProgressDialog(job, on_close=on_close, auto_close=True,
                                 title='Vorbereitung (1/3)',
                                 hide_auto_close=True, parent=self.ui)
         dialog.show()
 
     def route(self):
-        otp_jar = settings.system['otp_jar_file']
-        jython_jar = settings.system['jython_jar_file']
-        java_executable = settings.system['java']
-        memory = settings.system['reserved']
-
-        config_xml = os.path.join(self.temp_dir, 'config.xml')
-        config = OTPConfig(filename=config_xml)
-        config.settings['system']['n_threads'] = settings.system['n_threads']
-        config.settings['origin']['id_field'] = 'eingang'
-        config.settings['destination']['id_field'] = 'adresse'
-        config.settings['post_processing']['details'] = True
-
-        router_config = config.settings['router_config']
-        buffered_dist = self.project_settings.max_walk_dist + 500
-        router_config['path'] = settings.graph_path
-        router_config['router'] = self.project_settings.router
-        router_config['max_walk_distance'] = buffered_dist
-        router_config['traverse_modes'] = 'WALK'
-        router_config['walk_speed'] = self.project_settings.walk_speed
-        router_config['max_time_min'] = math.ceil(
-            buffered_dist / self.project_settings.walk_speed / 60)
-        config.write()
-
-        working_dir = os.path.join(settings.BASE_PATH, 'batch')
-
-        orig_tmp_filename = os.path.join(self.temp_dir, 'origins.csv')
-        dest_tmp_filename = os.path.join(self.temp_dir, 'destinations.csv')
-        target_file = os.path.join(self.temp_dir, 'results.csv')
-
-        cmd = (f'"{java_executable}" -Xmx{memory}G -jar "{jython_jar}" '
-               f'-Dpython.path="{otp_jar}" '
-               f'{working_dir}/otp_batch.py '
-               f'--config "{config_xml}" '
-               f'--origins "{orig_tmp_filename}" --destinations "{dest_tmp_filename}" '
-               f'--target "{target_file}" --nlines {PRINT_EVERY_N_LINES}'
-               )
+        self.stages.invalidate('route')
+        config_xml = write_routing_config(self.temp_dir, self.project_settings)
+        cmd = subprocess.list2cmdline(
+            routing_command(self.temp_dir, config_xml))
 
         dialog = None
         # workaround
         def on_close():
             if dialog.success:
+                self.stages.store('route')
                 self.elapsed_time = dialog.elapsed_time
                 self.progress_log = dialog.logs
-                self.analyse(target_file)
+                self.analyse()
 
-        origin_layer = GruenflaechenEingaengeProcessed.as_layer()
+        # only the representative entrances are routed
+        with open(os.path.join(self.temp_dir, 'origins.csv')) as f:
+            n_origins = max(sum(1 for line in f) - 1, 0)
 
         dialog = ExecOTPDialog(cmd, parent=self.ui,
                                start_elapsed=self.elapsed_time,
                                logs=self.progress_log,
                                title='Routing (2/3)',
-                               n_points=origin_layer.featureCount(),
+                               n_points=n_origins,
                                points_per_tick=PRINT_EVERY_N_LINES,
                                on_close=on_close,
                                auto_close=True, hide_auto_close=True)
         dialog.show()
 
-    def analyse(self, target_file):
+    def analyse(self):
+        self.stages.invalidate('analyse')
         project = self.project_manager.active_project
         project_group = project.get_group()
         result_group = project_group.findGroup('Ergebnisse')
         if result_group:
             result_group.removeAllChildren()
+        target_file = os.path.join(self.temp_dir, 'results.csv')
+        state_file = os.path.join(self.temp_dir, ANALYSIS_STATE)
         job = AnalyseRouting(target_file, self.green_output.layer.getFeatures(),
+                             project=project, state_file=state_file,
                              parent=self.ui)
+        def on_success(result):
+            self.stages.store('analyse')
+            self.add_result_layers()
         dialog = ProgressDialog(job, parent=self.ui, title='Analyse (3/3)',
                                 start_elapsed=self.elapsed_time,
                                 logs=self.progress_log,
-                                on_success=lambda x: self.add_result_layers())
+                                on_success=on_success)
         dialog.show()
 
     def build_router(self):
@@ -777,9 +821,43 @@ class OTPMainWindow(QtCore.QObject):
         router_path = os.path.join(graph_path, router)
         if not router:
             return
-        diag = ExecBuildRouterDialog(router_path, java_executable, otp_jar,
-                                     memory=memory, parent=self.ui)
-        diag.show()
+        clipped = os.path.isdir(os.path.join(router_path, SOURCE_FOLDER))
+        confirmed, clip, profile = BuildRouterDialog(
+            profiles=PROFILES, osmium_available=bool(osmium_executable()),
+            clipped=clipped, parent=self.ui).show()
+        if not confirmed:
+            return
+        metadata = {}
+
+        def build():
+            # the profile is stored next to the graph if it was built
+            def on_success(result):
+                if (not result and os.path.exists(
+                        os.path.join(router_path, 'Graph.obj'))):
+                    write_profile(router_path, metadata)
+                    self.show_router_profile()
+            diag = ExecBuildRouterDialog(router_path, java_executable,
+                                         otp_jar, memory=memory,
+                                         on_success=on_success,
+                                         parent=self.ui)
+            diag.show()
+
+        if not clip and profile == 'standard':
+            metadata.update(prepare_router_data(router_path))
+            build()
+            return
+        job = PrepareRouterData(router_path,
+                                project=self.project_manager.active_project,
+                                clip=clip, profile=profile, parent=self.ui)
+        dialog = None
+        def on_close():
+            if dialog.success:
+                metadata.update(dialog.result)
+                build()
+        dialog = ProgressDialog(job, on_close=on_close, auto_close=True,
+                                title='Daten des Routers vorbereiten',
+                                parent=self.ui)
+        dialog.show()
 
     def show_info(self):
         diag = InfoDialog(parent=self.ui)
@@ -0,0 +1,132 @@
+'''
+preparation of the data the routers are built from. The OpenStreetMap data
+is clipped with osmium to the area of a project plus the distance walked
+beyond it, so that building the graph takes less time and memory and the
+graph itself gets smaller. The walking profile additionally removes the
+ways not usable by pedestrians and the transit feeds, the analysis of the
+green spaces only routes by foot. The preparation itself is implemented in
+batch/osm_data.py, shared with the batch script building routers
+'''
+
+import os
+import json
+import shutil
+from typing import Tuple
+
+import numpy as np
+
+from gruenflaechenotp.base.project import settings
+from gruenflaechenotp.base.spatial import transform_coordinates
+from gruenflaechenotp.tool.tables import Projektgebiet, ProjectSettings
+from gruenflaechenotp.batch import osm_data
+from gruenflaechenotp.batch.osm_data import (SOURCE_FOLDER, PROFILE_FILE,
+                                             PROFILES, write_profile)
+
+
+def osmium_executable() -> str:
+    '''
+    path to the osmium executable, the one set in the settings or the one
+    found in the system path, empty if osmium is not available
+    '''
+    osmium = settings.system.get('osmium')
+    if osmium and os.path.exists(osmium):
+        return osmium
+    return shutil.which('osmium') or ''
+
+
+def project_extent(project) -> Tuple[float, float, float, float]:
+    '''
+    extent of the project area buffered by the project buffer and the
+    maximum walking distance (addresses in the buffer walk up to this
+    distance)
+
+    Returns
+    -------
+    tuple
+        min. longitude, min. latitude, max. longitude, max. latitude in WGS84
+    '''
+    project_settings = ProjectSettings.features(project=project)[0]
+    extent = None
+    for feat in Projektgebiet.features(project=project):
+        if not feat.geom or feat.geom.isEmpty():
+            continue
+        bbox = feat.geom.boundingBox()
+        if extent is None:
+            extent = bbox
+        else:
+            extent.combineExtentWith(bbox)
+    if extent is None:
+        raise ValueError('Das Projektgebiet enthält keine Geometrien')
+    extent.grow(project_settings.project_buffer +
+                project_settings.max_walk_dist)
+    x = np.array([extent.xMinimum(), extent.xMinimum(),
+                  extent.xMaximum(), extent.xMaximum()])
+    y = np.array([extent.yMinimum(), extent.yMaximum(),
+                  extent.yMinimum(), extent.yMaximum()])
+    lon, lat = transform_coordinates(x, y, settings.EPSG, 4326)
+    return lon.min(), lat.min(), lon.max(), lat.max()
+
+
+def prepare_router_data(router_path: str,
+                        bbox: Tuple[float, float, float, float] = None,
+                        profile: str = 'standard', log: object = print
+                        ) -> dict:
+    '''
+    prepare the data a router is built from with the osmium executable of
+    the settings, see batch.osm_data.prepare_router_data
+
+    Parameters
+    ----------
+    router_path : str
+        folder of the router
+    bbox : tuple, optional
+        min. longitude, min. latitude, max. longitude, max. latitude to clip
+        the OSM data to, defaults to no clipping
+    profile : str, optional
+        build profile of the router ('standard' or 'walk'), defaults to
+        'standard'
+    log : function, optional
+        function to log messages with
+
+    Returns
+    -------
+    dict
+        metadata of the profile (to be stored with write_profile after the
+        graph was built successfully)
+    '''
+    return osm_data.prepare_router_data(
+        router_path, osmium=osmium_executable(), bbox=bbox, profile=profile,
+        log=log)
+
+
+def read_profile(router_path: str) -> dict:
+    '''
+    metadata of the profile of the graph of a router, None if unknown (the
+    router was not built by the plugin or its graph was built without
+    storing the profile)
+    '''
+    fn = os.path.join(router_path, PROFILE_FILE)
+    graph = os.path.join(router_path, 'Graph.obj')
+    if not os.path.exists(fn) or not os.path.exists(graph):
+        return None
+    try:
+        with open(fn, encoding='utf-8') as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        return None
+
+
+def profile_description(router_path: str) -> str:
+    '''
+    description of the profile of the graph of a router
+    '''
+    metadata = read_profile(router_path)
+    if not metadata:
+        return 'Profil unbekannt'
+    description = f'Profil: {metadata.get("label", metadata.get("profile"))}'
+    if metadata.get('bbox'):
+        description += ', zugeschnitten auf ' + ', '.join(
+            f'{c:.4f}' for c in metadata['bbox'])
+    if metadata.get('built'):
+        description += f', gebaut am {metadata["built"]}'
+    return description
@@ -0,0 +1,729 @@
+'''
+headless evaluation of a project (preparation, routing with the
+OpenTripPlanner and analysis of the routing results) without any dialogs,
+e.g. to run scheduled evaluations on a server:
+
+    python -m gruenflaechenotp.tool.pipeline <project folder>
+
+the package has to be importable and the QGIS python bindings available
+(QGIS_PREFIX_PATH pointing to the QGIS installation)
+'''
+
+import os
+import re
+import sys
+import math
+import time
+import hashlib
+import argparse
+import subprocess
+from collections import OrderedDict
+from typing import List
+
+from qgis.core import QgsApplication
+
+from gruenflaechenotp.base.project import ProjectManager, Project, settings
+from gruenflaechenotp.tool.tables import (
+    ProjectSettings, Projektgebiet, Adressen, Baubloecke, Gruenflaechen,
+    GruenflaechenEingaenge, ProjektgebietProcessed, AdressenProcessed,
+    GruenflaechenEingaengeProcessed, AdressErgebnisse, BaublockErgebnisse,
+    PipelineStages)
+from gruenflaechenotp.tool.jobs import (AnalyseRouting, PrepareRouting,
+                                        SweepAnalysis, PreparePreview,
+                                        PreviewAnalysis, EXPONENTIAL_FACTOR)
+from gruenflaechenotp.batch.config import Config as OTPConfig
+
+# how many results are written while running batch script
+PRINT_EVERY_N_LINES = 100
+# folder in the project the data of the routing is exchanged in
+ROUTING_FOLDER = 'routing'
+# file in the routing folder the state of the analysis is saved to
+ANALYSIS_STATE = 'analysis.npz'
+# folder in the routing folder the data of the routing of the preview is
+# exchanged in
+PREVIEW_FOLDER = 'preview'
+# folder in the routing folder the results of the routing of the
+# sensitivity analysis are written to
+SWEEP_FOLDER = 'sweep'
+# file in the sweep folder the distance the sweep was routed up to is
+# saved to
+SWEEP_DISTANCE = 'max_walk_dist.txt'
+
+
+def routing_folder(project: Project) -> str:
+    '''
+    folder in the project the data of the routing is exchanged in, the data
+    is kept after the evaluation, so that the routing is only repeated if its
+    inputs changed
+    '''
+    folder = os.path.join(project.path, ROUTING_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def write_routing_config(folder: str, project_settings: ProjectSettings,
+                         max_walk_dist: int = None) -> str:
+    '''
+    write the configuration of the batch routing for a project into a folder
+
+    Parameters
+    ----------
+    folder : str
+        the folder to write the configuration file into
+    project_settings : ProjectSettings
+        the settings of the project to route
+    max_walk_dist : int, optional
+        maximum walking distance to route, defaults to the one in the project
+        settings
+
+    Returns
+    -------
+    str
+        path to the written configuration file
+    '''
+    config_xml = os.path.join(folder, 'config.xml')
+    config = OTPConfig(filename=config_xml)
+    config.settings['system']['n_threads'] = settings.system['n_threads']
+    config.settings['origin']['id_field'] = 'eingang'
+    config.settings['destination']['id_field'] = 'adresse'
+    config.settings['post_processing']['details'] = True
+
+    router_config = config.settings['router_config']
+    if max_walk_dist is None:
+        max_walk_dist = project_settings.max_walk_dist
+    buffered_dist = max_walk_dist + 500
+    router_config['path'] = settings.graph_path
+    router_config['router'] = project_settings.router
+    router_config['max_walk_distance'] = buffered_dist
+    router_config['traverse_modes'] = 'WALK'
+    router_config['walk_speed'] = project_settings.walk_speed
+    router_config['max_time_min'] = math.ceil(
+        buffered_dist / project_settings.walk_speed / 60)
+    config.write()
+    return config_xml
+
+
+def _batch_call() -> List[str]:
+    '''
+    arguments of the call of the batch routing script with the jython
+    interpreter
+    '''
+    working_dir = os.path.join(settings.BASE_PATH, 'batch')
+    return [
+        settings.system['java'], f'-Xmx{settings.system["reserved"]}G',
+        '-jar', settings.system['jython_jar_file'],
+        f'-Dpython.path={settings.system["otp_jar_file"]}',
+        os.path.join(working_dir, 'otp_batch.py')
+    ]
+
+
+def routing_command(folder: str, config_xml: str, target: str = None
+                    ) -> List[str]:
+    '''
+    arguments of the call of the batch routing with the origins and
+    destinations exported into the given folder, the results are written
+    into the same folder (results.csv) if no target is given
+
+    Parameters
+    ----------
+    folder : str
+        the folder containing the exported origins and destinations
+    config_xml : str
+        path to the configuration of the batch routing
+    target : str, optional
+        path to the file to write the results into
+
+    Returns
+    -------
+    list
+        the command line arguments
+    '''
+    return _batch_call() + [
+        '--config', config_xml,
+        '--origins', os.path.join(folder, 'origins.csv'),
+        '--destinations', os.path.join(folder, 'destinations.csv'),
+        '--target', target or os.path.join(folder, 'results.csv'),
+        '--nlines', str(PRINT_EVERY_N_LINES)
+    ]
+
+
+def batch_routing_command(folders: List[str], jobs_file: str) -> List[str]:
+    '''
+    arguments of a single call of the batch routing for multiple folders
+    with exported origins, destinations and routing configuration
+    (config.xml), the graphs of the routers are loaded only once. The results
+    are written into the folders (results.csv)
+
+    Parameters
+    ----------
+    folders : list
+        the folders containing the exported data
+    jobs_file : str
+        path to write the list of routings to
+
+    Returns
+    -------
+    list
+        the command line arguments
+    '''
+    files = ['config.xml', 'origins.csv', 'destinations.csv', 'results.csv']
+    with open(jobs_file, 'w', encoding='utf-8') as f:
+        for folder in folders:
+            f.write(';'.join(os.path.join(folder, fn) for fn in files) + '\n')
+    return _batch_call() + [
+        '--jobs', jobs_file, '--nlines', str(PRINT_EVERY_N_LINES)]
+
+
+def run_routing(cmd: List[str], log: object = print):
+    '''
+    run the batch routing and pass its output to the log function line by
+    line, raises an error if the routing failed
+    '''
+    process = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        universal_newlines=True, errors='replace')
+    for line in process.stdout:
+        log(line)
+    if process.wait() != 0:
+        raise RuntimeError('Das Routing ist mit dem Fehlercode '
+                           f'{process.returncode} abgebrochen.')
+
+
+def _read_distance(fn: str) -> float:
+    '''
+    distance stored in a file, 0 if the file is missing or invalid
+    '''
+    try:
+        with open(fn) as f:
+            return float(f.read().strip())
+    except (OSError, ValueError):
+        return 0
+
+
+def missing_executables() -> List[str]:
+    '''
+    messages for the executables needed for routing not found at the paths
+    defined in the settings
+    '''
+    files = [
+        ('otp_jar_file', 'Die in den Einstellungen angegebene OTP Datei '
+         'existiert nicht!'),
+        ('jython_jar_file', 'Der in den Einstellungen angegebene Jython '
+         'Interpreter existiert nicht!'),
+        ('java', 'Der in den Einstellungen angegebene Java-Pfad existiert '
+         'nicht!'),
+    ]
+    return [msg for key, msg in files
+            if not os.path.exists(settings.system[key])]
+
+
+class StageFingerprints:
+    '''
+    fingerprints of the inputs of the stages of the evaluation (content of
+    the source tables and the relevant project settings), a stage has to be
+    rerun only if its fingerprint differs from the one stored after its last
+    run or if its outputs are missing. The fingerprint of a stage includes
+    the one of the stage it depends on. The routings of the preview and of
+    the sensitivity analysis are no part of the regular evaluation but
+    depend on the preparation as well
+
+    Attributes
+    ----------
+    project : Project
+        the evaluated project
+    folder : str
+        the folder the data of the routing is exchanged in
+    '''
+    stages = ['prepare', 'route', 'analyse']
+    # stage whose outputs are the inputs of a stage
+    depends = {
+        'prepare': None,
+        'route': 'prepare',
+        'analyse': 'route',
+        'preview': 'prepare',
+        'sweep': 'prepare',
+    }
+    # source tables of the stages
+    tables = {
+        'prepare': [Projektgebiet, Adressen, Baubloecke, Gruenflaechen,
+                    GruenflaechenEingaenge],
+        'route': [],
+        'analyse': [],
+        'preview': [],
+        'sweep': [],
+    }
+    # fields of the project settings the stages depend on
+    # (required_green is only used for displaying the results, the distance
+    # the sweep is routed up to is stored with its results)
+    settings = {
+        'prepare': ['project_buffer', 'point_tolerance'],
+        'route': ['router', 'max_walk_dist', 'walk_speed'],
+        'analyse': ['max_walk_dist'],
+        'preview': ['router', 'max_walk_dist', 'walk_speed'],
+        'sweep': ['router', 'walk_speed'],
+    }
+    # tables and files written by the stages
+    output_tables = {
+        'prepare': [ProjektgebietProcessed, AdressenProcessed,
+                    GruenflaechenEingaengeProcessed],
+        'route': [],
+        'analyse': [AdressErgebnisse, BaublockErgebnisse],
+        'preview': [],
+        'sweep': [],
+    }
+    output_files = {
+        'prepare': ['origins.csv', 'destinations.csv'],
+        'route': ['results.csv'],
+        'analyse': [],
+        'preview': [os.path.join(PREVIEW_FOLDER, 'results.csv')],
+        'sweep': [os.path.join(SWEEP_FOLDER, 'results.csv'),
+                  os.path.join(SWEEP_FOLDER, SWEEP_DISTANCE)],
+    }
+    # files written by the stages into the routing folder of the project
+    # regardless of the folder the routing is exchanged in
+    project_files = {
+        'analyse': [ANALYSIS_STATE],
+    }
+
+    def __init__(self, project: Project, folder: str):
+        '''
+        Parameters
+        ----------
+        project : Project
+            the evaluated project
+        folder : str
+            the folder the data of the routing is exchanged in
+        '''
+        self.project = project
+        self.folder = folder
+        self._fingerprints = {}
+
+    def _extra(self, stage: str) -> list:
+        '''
+        inputs of a stage other than tables and project settings
+        '''
+        if stage in ('route', 'preview', 'sweep'):
+            project_settings = ProjectSettings.features(
+                project=self.project)[0]
+            graph = os.path.join(settings.graph_path, project_settings.router,
+                                 'Graph.obj')
+            mtime = os.path.getmtime(graph) if os.path.exists(graph) else None
+            return [graph, mtime]
+        if stage == 'analyse':
+            return [EXPONENTIAL_FACTOR]
+        return []
+
+    def fingerprint(self, stage: str) -> str:
+        '''
+        fingerprint of the current inputs of a stage
+        '''
+        if stage in self._fingerprints:
+            return self._fingerprints[stage]
+        sha = hashlib.sha1()
+        previous = self.depends[stage]
+        if previous:
+            sha.update(self.fingerprint(previous).encode('utf-8'))
+        for table in self.tables[stage]:
+            content = table.get_table(project=self.project).content_hash()
+            sha.update(f'{table.get_name()}:{content}'.encode('utf-8'))
+        project_settings = ProjectSettings.features(project=self.project)[0]
+        values = [(field, getattr(project_settings, field))
+                  for field in self.settings[stage]]
+        values.extend(self._extra(stage))
+        sha.update(repr(values).encode('utf-8'))
+        self._fingerprints[stage] = sha.hexdigest()
+        return self._fingerprints[stage]
+
+    def _stored(self) -> dict:
+        features = PipelineStages.features(project=self.project, create=True)
+        return {f.stage: f.fingerprint for f in features}
+
+    def _outputs_exist(self, stage: str) -> bool:
+        for fn in self.output_files[stage]:
+            if not os.path.exists(os.path.join(self.folder, fn)):
+                return False
+        for fn in self.project_files.get(stage, []):
+            if not os.path.exists(
+                    os.path.join(self.project.path, ROUTING_FOLDER, fn)):
+                return False
+        if self.output_tables[stage]:
+            workspace = self.output_tables[stage][0].get_workspace(
+                project=self.project)
+            tables = workspace.tables
+            for table in self.output_tables[stage]:
+                if table.get_name() not in tables:
+                    return False
+        return True
+
+    def is_current(self, stage: str) -> bool:
+        '''
+        whether the outputs of a stage are up to date (inputs unchanged since
+        the last run of the stage)
+        '''
+        stored = self._stored().get(stage)
+        return (stored is not None and stored == self.fingerprint(stage) and
+                self._outputs_exist(stage))
+
+    def invalidate(self, stage: str):
+        '''
+        remove the stored fingerprint of a stage, call before running it
+        '''
+        PipelineStages.features(project=self.project, create=True).delete(
+            stage=stage)
+
+    def store(self, stage: str):
+        '''
+        store the fingerprint of a stage after running it successfully
+        '''
+        self.invalidate(stage)
+        PipelineStages.features(project=self.project, create=True).add(
+            stage=stage, fingerprint=self.fingerprint(stage))
+
+
+class Pipeline:
+    '''
+    evaluation of a project without user interface, the stages (preparation,
+    routing and analysis) are run one after another in the calling thread
+
+    Attributes
+    ----------
+    project : Project
+        the evaluated project
+    timings : OrderedDict
+        elapsed seconds per finished stage
+    skipped : list
+        stages skipped in the last run because their inputs did not change
+    '''
+    stages = StageFingerprints.stages
+
+    def __init__(self, project: Project, temp_dir: str = None,
+                 on_message: object = None, force: bool = False):
+        '''
+        Parameters
+        ----------
+        project : Project
+            the project to evaluate
+        temp_dir : str, optional
+            folder to exchange the data with the routing in, defaults to the
+            routing folder of the project
+        on_message : function, optional
+            called with every log message, defaults to printing the messages
+        force : bool, optional
+            run all stages even if their inputs did not change, defaults to
+            skipping unchanged stages
+        '''
+        self.project = project
+        self.temp_dir = temp_dir
+        self.on_message = on_message or print
+        self.force = force
+        self.timings = OrderedDict()
+        self.skipped = []
+
+    def log(self, message: str, warning: bool = False):
+        '''
+        pass a message without html formatting to the message callback
+        '''
+        message = re.sub(r'<br\s*/?>', '\n', str(message))
+        message = re.sub(r'<[^>]+>', '', message).strip()
+        if not message:
+            return
+        if warning:
+            message = f'Warnung: {message}'
+        self.on_message(message)
+
+    def _run_worker(self, worker):
+        worker.message.connect(self.log)
+        worker.warning.connect(lambda msg: self.log(msg, warning=True))
+        return worker.work()
+
+    def _prepare_if_changed(self, fingerprints: StageFingerprints):
+        '''
+        run the preparation if its inputs changed since its last run
+        '''
+        if not self.force and fingerprints.is_current('prepare'):
+            return
+        fingerprints.invalidate('prepare')
+        start = time.perf_counter()
+        self.prepare()
+        self.timings['prepare'] = time.perf_counter() - start
+        fingerprints.store('prepare')
+
+    def _route(self, folder: str):
+        '''
+        route between the origins and destinations exported into the folder,
+        the results are written into the same folder
+        '''
+        missing = missing_executables()
+        if missing:
+            raise FileNotFoundError(' '.join(missing))
+        project_settings = ProjectSettings.features(project=self.project)[0]
+        config_xml = write_routing_config(folder, project_settings)
+        cmd = routing_command(folder, config_xml)
+        self.log('Script: ' + subprocess.list2cmdline(cmd))
+        run_routing(cmd, log=self.log)
+
+    def prepare(self):
+        '''
+        intersect and export the origins and destinations of the routing
+        '''
+        self._run_worker(PrepareRouting(self.temp_dir, project=self.project))
+
+    def route(self):
+        '''
+        route between the exported origins and destinations with the
+        OpenTripPlanner
+        '''
+        self.log('<b>Routing mit dem OpenTripPlanner</b>')
+        self._route(self.temp_dir)
+
+    def analyse(self):
+        '''
+        analyse the results of the routing
+        '''
+        results_file = os.path.join(self.temp_dir, 'results.csv')
+        # the state is kept in the project to update the results on changes
+        # of the green spaces, independent of the temporary folder
+        state_file = os.path.join(routing_folder(self.project),
+                                  ANALYSIS_STATE)
+        self._run_worker(AnalyseRouting(results_file, None,
+                                        project=self.project,
+                                        state_file=state_file))
+
+    def sweep(self, max_walk_dists: List[int], decays: List[float]
+              ) -> OrderedDict:
+        '''
+        analyse all combinations of the given maximum walking distances and
+        decay factors with a single routing up to the largest distance, the
+        results are written into the sensitivity tables. The results of the
+        regular routing or of the last routing of a sweep are reused if they
+        are up to date and were routed far enough
+
+        Parameters
+        ----------
+        max_walk_dists : list
+            maximum walking distances in meters
+        decays : list
+            factors of the exponential decay of the attractivity with the
+            distance (negative)
+
+        Returns
+        -------
+        OrderedDict
+            elapsed seconds per stage run
+        '''
+        if self.temp_dir is None:
+            self.temp_dir = routing_folder(self.project)
+        self.timings.clear()
+        fingerprints = StageFingerprints(self.project, self.temp_dir)
+        self._prepare_if_changed(fingerprints)
+
+        project_settings = ProjectSettings.features(project=self.project)[0]
+        max_dist = max(max_walk_dists)
+        results_file = os.path.join(self.temp_dir, 'results.csv')
+        sweep_dir = os.path.join(self.temp_dir, SWEEP_FOLDER)
+        sweep_results = os.path.join(sweep_dir, 'results.csv')
+        distance_file = os.path.join(sweep_dir, SWEEP_DISTANCE)
+        if (not self.force and max_dist <= project_settings.max_walk_dist and
+                fingerprints.is_current('route')):
+            self.log('Die Ergebnisse des Routings werden wiederverwendet')
+        elif (not self.force and fingerprints.is_current('sweep') and
+                _read_distance(distance_file) >= max_dist):
+            self.log('Die Ergebnisse des letzten Routings der '
+                     'Sensitivitätsanalyse werden wiederverwendet')
+            results_file = sweep_results
+        else:
+            # routed into a separate file, the results of the regular
+            # evaluation stay untouched
+            fingerprints.invalidate('sweep')
+            start = time.perf_counter()
+            self.log(f'<b>Routing bis {max_dist}m für die '
+                     'Sensitivitätsanalyse</b>')
+            missing = missing_executables()
+            if missing:
+                raise FileNotFoundError(' '.join(missing))
+            os.makedirs(sweep_dir, exist_ok=True)
+            config_xml = write_routing_config(sweep_dir, project_settings,
+                                              max_walk_dist=max_dist)
+            results_file = sweep_results
+            cmd = routing_command(self.temp_dir, config_xml,
+                                  target=results_file)
+            run_routing(cmd, log=self.log)
+            with open(distance_file, 'w') as f:
+                f.write(str(max_dist))
+            fingerprints.store('sweep')
+            self.timings['route'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self._run_worker(SweepAnalysis(results_file, max_walk_dists, decays,
+                                       project=self.project))
+        self.timings['sweep'] = time.perf_counter() - start
+        self.project.data.checkpoint()
+        self.log(f'Gesamtdauer: {sum(self.timings.values()):.1f}s')
+        return self.timings
+
+    def preview(self, refine: bool = False) -> OrderedDict:
+        '''
+        approximate results of the blocks with the routing to a single
+        representative point per block instead of to all addresses, written
+        into the preview table and compared to the results of the last exact
+        evaluation. The routing of the preview is reused as long as its
+        inputs do not change
+
+        Parameters
+        ----------
+        refine : bool, optional
+            route the addresses of the blocks whose results in the preview
+            are near the required green space and calculate these blocks
+            exactly, defaults to the preview only
+
+        Returns
+        -------
+        OrderedDict
+            elapsed seconds per stage run
+        '''
+        if self.temp_dir is None:
+            self.temp_dir = routing_folder(self.project)
+        self.timings.clear()
+        fingerprints = StageFingerprints(self.project, self.temp_dir)
+        self._prepare_if_changed(fingerprints)
+
+        folder = os.path.join(self.temp_dir, PREVIEW_FOLDER)
+        results_file = os.path.join(folder, 'results.csv')
+        if self.force or not fingerprints.is_current('preview'):
+            fingerprints.invalidate('preview')
+            start = time.perf_counter()
+            self.log('<b>Routing der Vorschau (ein Punkt je Baublock)</b>')
+            self._run_worker(PreparePreview(folder, project=self.project))
+            self._route(folder)
+            self.timings['preview_route'] = time.perf_counter() - start
+            fingerprints.store('preview')
+
+        start = time.perf_counter()
+        near = self._run_worker(PreviewAnalysis(results_file,
+                                                project=self.project))
+        self.timings['preview'] = time.perf_counter() - start
+
+        if refine and len(near):
+            start = time.perf_counter()
+            self.log('<b>Exakte Nachberechnung der Baublöcke nahe am '
+                     'Richtwert</b>')
+            refine_folder = os.path.join(folder, 'refine')
+            self._run_worker(PreparePreview(refine_folder, refine_blocks=near,
+                                            project=self.project))
+            self._route(refine_folder)
+            self._run_worker(PreviewAnalysis(
+                results_file,
+                refine_results_file=os.path.join(refine_folder,
+                                                 'results.csv'),
+                refined_blocks=near, project=self.project))
+            self.timings['refine'] = time.perf_counter() - start
+        self.project.data.checkpoint()
+        self.log(f'Gesamtdauer: {sum(self.timings.values()):.1f}s')
+        return self.timings
+
+    def run(self) -> OrderedDict:
+        '''
+        run the stages of the evaluation whose inputs changed since their
+        last run (all stages if forced)
+
+        Returns
+        -------
+        OrderedDict
+            elapsed seconds per stage run
+        '''
+        if self.temp_dir is None:
+            self.temp_dir = routing_folder(self.project)
+        self.timings.clear()
+        self.skipped = []
+        fingerprints = StageFingerprints(self.project, self.temp_dir)
+        for stage in self.stages:
+            if not self.force and fingerprints.is_current(stage):
+                self.skipped.append(stage)
+                self.log(f'Schritt "{stage}" übersprungen, die Eingangsdaten '
+                         'haben sich nicht geändert')
+                continue
+            fingerprints.invalidate(stage)
+            start = time.perf_counter()
+            getattr(self, stage)()
+            self.timings[stage] = time.perf_counter() - start
+            fingerprints.store(stage)
+            self.log(f'Schritt "{stage}" abgeschlossen nach '
+                     f'{self.timings[stage]:.1f}s')
+        self.project.data.checkpoint()
+        self.log(f'Gesamtdauer: {sum(self.timings.values()):.1f}s')
+        return self.timings
+
+
+def init_qgis() -> QgsApplication:
+    '''
+    initialize QGIS without graphical user interface
+    '''
+    prefix = os.environ.get('QGIS_PREFIX_PATH')
+    if prefix:
+        QgsApplication.setPrefixPath(prefix, True)
+    app = QgsApplication([], False)
+    app.initQgis()
+    return app
+
+
+def main(args: List[str] = None):
+    parser = argparse.ArgumentParser(
+        description='Grünflächenbewertung eines Projekts ohne '
+        'Benutzeroberfläche')
+    parser.add_argument('project', help='Pfad zum Projektordner')
+    parser.add_argument('--temp-dir', dest='temp_dir',
+                        help='Ordner für die Daten des Routings, '
+                        'Standard: Ordner "routing" im Projekt')
+    parser.add_argument('--force', action='store_true',
+                        help='alle Schritte berechnen, auch wenn sich die '
+                        'Eingangsdaten nicht geändert haben')
+    parser.add_argument('--preview', action='store_true',
+                        help='Vorschau der Ergebnisse der Baublöcke mit '
+                        'einem Punkt je Baublock statt aller Adressen')
+    parser.add_argument('--refine', action='store_true',
+                        help='Vorschau mit exakter Nachberechnung der '
+                        'Baublöcke nahe am Richtwert')
+    parser.add_argument('--sweep-dist', dest='sweep_dist',
+                        help='maximale Gehdistanzen der Sensitivitätsanalyse '
+                        '(kommagetrennt, in Metern)')
+    parser.add_argument('--sweep-decay', dest='sweep_decay',
+                        help='Faktoren der Distanzgewichtung der '
+                        'Sensitivitätsanalyse (kommagetrennt), Standard: '
+                        f'{EXPONENTIAL_FACTOR}')
+    options = parser.parse_args(args)
+
+    app = init_qgis()
+    path, name = os.path.split(os.path.abspath(options.project))
+    if not os.path.isdir(os.path.join(path, name)):
+        parser.error(f'Projektordner {options.project} nicht gefunden')
+    if options.temp_dir:
+        os.makedirs(options.temp_dir, exist_ok=True)
+    project = Project(name, path=path)
+    pipeline = Pipeline(project, temp_dir=options.temp_dir,
+                        force=options.force)
+    try:
+        if options.preview or options.refine:
+            pipeline.preview(refine=options.refine)
+        elif options.sweep_dist or options.sweep_decay:
+            project_settings = ProjectSettings.features(project=project)[0]
+            dists = [int(d) for d in options.sweep_dist.split(',')] \
+                if options.sweep_dist else [project_settings.max_walk_dist]
+            decays = [float(d) for d in options.sweep_decay.split(',')] \
+                if options.sweep_decay else [EXPONENTIAL_FACTOR]
+            pipeline.sweep(dists, decays)
+        else:
+            pipeline.run()
+    except Exception as e:
+        print(f'Fehler: {e}', file=sys.stderr)
+        return 1
+    finally:
+        project.close()
+        ProjectManager().basedata.close()
+        app.exitQgis()
+    for stage, seconds in pipeline.timings.items():
+        print(f'{stage};{seconds:.3f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,320 @@
+'''
+evaluation of multiple projects (e.g. scenarios cloned from one project) in
+one run without user interface. The preparation and the analysis of the
+projects run in a pool of processes, the routing is done with a single call
+of the OpenTripPlanner per router for all of its projects. As in the
+evaluation of a single project, the data of the routing is kept in the
+routing folders of the projects and stages whose inputs did not change are
+skipped:
+
+    python -m gruenflaechenotp.tool.scenarios [project names]
+
+evaluates the given (or all) projects in the project folder of the settings
+'''
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+from gruenflaechenotp.base.project import ProjectManager, Project
+from gruenflaechenotp.base.validation import _python_executable
+from gruenflaechenotp.tool.tables import ProjectSettings
+from gruenflaechenotp.tool.pipeline import (Pipeline, StageFingerprints,
+                                            init_qgis, routing_folder,
+                                            write_routing_config,
+                                            batch_routing_command,
+                                            run_routing, missing_executables)
+
+# QGIS application of a process of the pool
+_app = None
+
+
+def _init_process():
+    global _app
+    _app = init_qgis()
+
+
+def _run_stage(stage: str, project_path: str, folder: str,
+               force: bool = False) -> Tuple[float, List[str], str]:
+    '''
+    run a stage of the pipeline on a project in a process of the pool, the
+    stage is skipped if its inputs did not change since its last run
+
+    Returns
+    -------
+    tuple
+        elapsed seconds, log messages and error message (None on success)
+    '''
+    path, name = os.path.split(project_path)
+    project = Project(name, path=path)
+    messages = []
+    pipeline = Pipeline(project, temp_dir=folder,
+                        on_message=messages.append)
+    fingerprints = StageFingerprints(project, folder)
+    start = time.perf_counter()
+    error = None
+    try:
+        if not force and fingerprints.is_current(stage):
+            messages.append(f'Schritt "{stage}" übersprungen, die '
+                            'Eingangsdaten haben sich nicht geändert')
+        else:
+            fingerprints.invalidate(stage)
+            getattr(pipeline, stage)()
+            fingerprints.store(stage)
+        project.data.checkpoint()
+    except Exception as e:
+        error = str(e)
+    finally:
+        project.close()
+    return time.perf_counter() - start, messages, error
+
+
+class ScenarioBatch:
+    '''
+    evaluates multiple projects, the preparation and the analysis are
+    distributed to a pool of processes, the routing is done per router
+    (one Java VM loading the graph once for all projects using the router)
+
+    Attributes
+    ----------
+    projects : list
+        the projects to evaluate
+    results : OrderedDict
+        status and elapsed seconds per stage by project name
+    routers : OrderedDict
+        projects, routed origins and elapsed seconds of the routing by
+        router name
+    '''
+    def __init__(self, projects: List[Project], processes: int = None,
+                 on_message: object = None, force: bool = False):
+        '''
+        Parameters
+        ----------
+        projects : list
+            the projects to evaluate
+        processes : int, optional
+            number of processes, defaults to the number of cores minus one
+        on_message : function, optional
+            called with every log message, defaults to printing the messages
+        force : bool, optional
+            run all stages even if their inputs did not change, defaults to
+            skipping unchanged stages
+        '''
+        self.projects = projects
+        self.force = force
+        if processes is None:
+            processes = max((os.cpu_count() or 1) - 1, 1)
+        self.processes = processes
+        self.on_message = on_message or print
+        self.results = OrderedDict()
+        self.routers = OrderedDict()
+        self.elapsed = 0
+
+    def log(self, message: str):
+        self.on_message(message)
+
+    def _run_stage(self, executor: ProcessPoolExecutor, stage: str,
+                   projects: List[Project], folders: dict) -> List[Project]:
+        '''
+        run a stage on the projects in the pool, returns the projects the
+        stage succeeded for
+        '''
+        futures = [(project, executor.submit(
+            _run_stage, stage, project.path, folders[project.name],
+            self.force))
+            for project in projects]
+        succeeded = []
+        for project, future in futures:
+            result = self.results[project.name]
+            try:
+                seconds, messages, error = future.result()
+            except Exception as e:
+                seconds, messages, error = 0, [], str(e)
+            for message in messages:
+                self.log(f'[{project.name}] {message}')
+            result[stage] = seconds
+            if error:
+                result['status'] = f'Fehler ({stage}): {error}'
+                self.log(f'[{project.name}] Fehler: {error}')
+            else:
+                succeeded.append(project)
+        return succeeded
+
+    def _route(self, projects: List[Project], folders: dict, temp_dir: str
+               ) -> List[Project]:
+        '''
+        route the projects with one call of the routing per router, returns
+        the projects routed successfully
+        '''
+        by_router = OrderedDict()
+        succeeded = []
+        fingerprints = {}
+        for project in projects:
+            project_fingerprints = StageFingerprints(project,
+                                                     folders[project.name])
+            if not self.force and project_fingerprints.is_current('route'):
+                self.log(f'[{project.name}] Schritt "route" übersprungen, '
+                         'die Eingangsdaten haben sich nicht geändert')
+                succeeded.append(project)
+                continue
+            project_fingerprints.invalidate('route')
+            fingerprints[project.name] = project_fingerprints
+            project_settings = ProjectSettings.features(project=project)[0]
+            write_routing_config(folders[project.name], project_settings)
+            by_router.setdefault(project_settings.router, []).append(project)
+
+        for i, (router, router_projects) in enumerate(by_router.items()):
+            self.log(f'Routing mit Router "{router}" für '
+                     f'{len(router_projects)} Projekt(e)...')
+            router_folders = [folders[p.name] for p in router_projects]
+            n_origins = 0
+            for folder in router_folders:
+                with open(os.path.join(folder, 'origins.csv')) as f:
+                    n_origins += max(sum(1 for line in f) - 1, 0)
+            cmd = batch_routing_command(
+                router_folders, os.path.join(temp_dir, f'jobs_{i}.csv'))
+            start = time.perf_counter()
+            try:
+                run_routing(cmd, log=lambda line: self.log(
+                    f'[{router}] {line.rstrip()}'))
+                error = None
+            except Exception as e:
+                error = str(e)
+            seconds = time.perf_counter() - start
+            self.routers[router] = {'projects': len(router_projects),
+                                    'origins': n_origins,
+                                    'seconds': seconds}
+            for project in router_projects:
+                result = self.results[project.name]
+                result['route'] = seconds
+                if error:
+                    result['status'] = f'Fehler (route): {error}'
+                else:
+                    fingerprints[project.name].store('route')
+                    succeeded.append(project)
+        return succeeded
+
+    def run(self) -> OrderedDict:
+        '''
+        evaluate all projects, the results are written into the projects
+
+        Returns
+        -------
+        OrderedDict
+            status and elapsed seconds per stage by project name
+        '''
+        missing = missing_executables()
+        if missing:
+            raise FileNotFoundError(' '.join(missing))
+        self.results.clear()
+        self.routers.clear()
+        start = time.perf_counter()
+        # only the lists of the routings of the routers are temporary, the
+        # data of the routing is kept in the projects
+        temp_dir = tempfile.mkdtemp()
+        folders = {}
+        for project in self.projects:
+            folders[project.name] = routing_folder(project)
+            self.results[project.name] = OrderedDict(
+                status='ok', prepare=0, route=0, analyse=0)
+            # the processes open the projects on their own
+            project.close()
+
+        context = multiprocessing.get_context('spawn')
+        executable = _python_executable()
+        if executable:
+            context.set_executable(executable)
+        try:
+            with ProcessPoolExecutor(max_workers=self.processes,
+                                     mp_context=context,
+                                     initializer=_init_process) as executor:
+                self.log('Vorbereitung des Routings')
+                projects = self._run_stage(executor, 'prepare',
+                                           self.projects, folders)
+                self.log('Routing mit dem OpenTripPlanner')
+                projects = self._route(projects, folders, temp_dir)
+                for project in projects:
+                    project.close()
+                self.log('Analyse der Ergebnisse des Routings')
+                self._run_stage(executor, 'analyse', projects, folders)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        self.elapsed = time.perf_counter() - start
+        return self.results
+
+    def report(self) -> str:
+        '''
+        timings of all projects and the throughput of the routing as text
+        '''
+        lines = ['Projekt;Status;Vorbereitung (s);Routing (s);Analyse (s)']
+        for name, result in self.results.items():
+            lines.append(f'{name};{result["status"]};{result["prepare"]:.1f};'
+                         f'{result["route"]:.1f};{result["analyse"]:.1f}')
+        lines.append('')
+        lines.append('Router;Projekte;Startpunkte;Routing (s);Startpunkte/s')
+        for router, stats in self.routers.items():
+            rate = stats['origins'] / stats['seconds'] \
+                if stats['seconds'] else 0
+            lines.append(f'{router};{stats["projects"]};{stats["origins"]};'
+                         f'{stats["seconds"]:.1f};{rate:.1f}')
+        n_ok = sum(1 for r in self.results.values() if r['status'] == 'ok')
+        lines.append('')
+        lines.append(f'{n_ok}/{len(self.results)} Projekte erfolgreich '
+                     f'berechnet in {self.elapsed:.1f}s')
+        if self.elapsed:
+            lines.append(f'Durchsatz: {n_ok / self.elapsed * 3600:.1f} '
+                         'Projekte/h')
+        return '\n'.join(lines)
+
+
+def main(args: List[str] = None):
+    parser = argparse.ArgumentParser(
+        description='Grünflächenbewertung mehrerer Projekte ohne '
+        'Benutzeroberfläche')
+    parser.add_argument('projects', nargs='*',
+                        help='Namen der Projekte, Standard: alle Projekte')
+    parser.add_argument('--processes', type=int,
+                        help='Anzahl der Prozesse')
+    parser.add_argument('--report', help='Datei für den Bericht')
+    parser.add_argument('--force', action='store_true',
+                        help='alle Schritte berechnen, auch wenn sich die '
+                        'Eingangsdaten nicht geändert haben')
+    options = parser.parse_args(args)
+
+    app = init_qgis()
+    project_manager = ProjectManager()
+    projects = project_manager.projects
+    if options.projects:
+        names = [p.name for p in projects]
+        unknown = [n for n in options.projects if n not in names]
+        if unknown:
+            parser.error(f'Projekte nicht gefunden: {", ".join(unknown)}')
+        projects = [p for p in projects if p.name in options.projects]
+    batch = ScenarioBatch(projects, processes=options.processes,
+                          force=options.force)
+    try:
+        batch.run()
+    except Exception as e:
+        print(f'Fehler: {e}', file=sys.stderr)
+        return 1
+    finally:
+        project_manager.basedata.close()
+        app.exitQgis()
+    report = batch.report()
+    print(report)
+    if options.report:
+        with open(options.report, 'w', encoding='utf-8') as f:
+            f.write(report + '\n')
+    n_failed = sum(1 for r in batch.results.values() if r['status'] != 'ok')
+    return 1 if n_failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,6 +10,7 @@ class ProjectSettings(ProjectTable):
     walk_speed = Field(float, 1.33)
     wheelchair = Field(bool, False)
     max_slope = Field(float, 0.083333)
+    point_tolerance = Field(float, 1)
 
     class Meta:
         workspace = 'project'
@@ -61,6 +62,7 @@ class AdressenProcessed(ProjectTable):
     baublock = Field(int, 0)
     einwohner = Field(float, 0)
     in_projektgebiet = Field(bool, False)
+    routing_punkt = Field(int, 0)
 
     class Meta:
         workspace = 'results'
@@ -70,6 +72,7 @@ class AdressenProcessed(ProjectTable):
 class GruenflaechenEingaengeProcessed(ProjectTable):
     eingang = Field(int, 0)
     gruenflaeche = Field(int, 0)
+    routing_punkt = Field(int, 0)
 
     class Meta:
         workspace = 'results'
@@ -103,5 +106,44 @@ class BaublockErgebnisse(ProjectTable):
         geom = 'MultiPolygon'
 
 
+class AdressSensitivitaet(ProjectTable):
+    max_walk_dist = Field(int, 0)
+    decay = Field(float, 0)
+    gruenflaeche_je_einwohner = Field(float, 0)
+    einwohner = Field(float, 0)
+    adresse = Field(int, 0)
+
+    class Meta:
+        workspace = 'results'
+
+
+class BaublockSensitivitaet(ProjectTable):
+    max_walk_dist = Field(int, 0)
+    decay = Field(float, 0)
+    gruenflaeche_je_einwohner = Field(float, 0)
+    einwohner = Field(int, 0)
+    baublock = Field(int, 0)
+
+    class Meta:
+        workspace = 'results'
+
 
+class PipelineStages(ProjectTable):
+    stage = Field(str, '')
+    fingerprint = Field(str, '')
 
+    class Meta:
+        workspace = 'results'
+
+
+class BaublockVorschau(ProjectTable):
+    gruenflaeche_je_einwohner = Field(float, 0)
+    einwohner = Field(int, 0)
+    baublock = Field(int, 0)
+    exakt = Field(bool, False)
+    nahe_schwelle = Field(bool, False)
+    differenz = Field(float, 0)
+
+    class Meta:
+        workspace = 'results'
+        geom = 'MultiPolygon'